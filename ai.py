@@ -1,18 +1,313 @@
 import os
-from groq import Groq
+import time
+import asyncio
+import threading
+from contextlib import contextmanager, asynccontextmanager
 from dotenv import load_dotenv
+from cache import make_cache
+from metrics import span, inc
+from resilience import (TokenBucket, CircuitBreaker, CircuitOpen,
+                        ConcurrencyLimiter, Saturated, backoff_delay)
 
 load_dotenv()
 
-client = Groq(api_key=os.environ.get("GROK_API_KEY"))
 MODEL  = "llama-3.3-70b-versatile"
 
+LLM_TIMEOUT          = float(os.environ.get("LLM_TIMEOUT", 30))
+LLM_DEADLINE         = float(os.environ.get("LLM_DEADLINE", 45))
+LLM_MAX_RETRIES      = int(os.environ.get("LLM_MAX_RETRIES", 3))
+LLM_CONCURRENCY      = int(os.environ.get("LLM_CONCURRENCY", 8))
+LLM_USER_CONCURRENCY = int(os.environ.get("LLM_USER_CONCURRENCY", 2))
+LLM_REQUESTS_PER_MIN = int(os.environ.get("LLM_REQUESTS_PER_MIN", 30))
+LLM_PROCESSES        = int(os.environ.get("LLM_PROCESSES", os.environ.get("WEB_CONCURRENCY", 1)))
+
+CONTEXT_WINDOW = int(os.environ.get("CHAT_CONTEXT_WINDOW", 12))
+SUMMARY_BATCH  = int(os.environ.get("CHAT_SUMMARY_BATCH", 8))
+
+# ─── Groq Clients ────────────────────────────────────────
+# Created on first use: importing the SDK is a large share of worker
+# boot time, and nothing at startup needs it.
+# The SDK also reads GROQ_BASE_URL; bench/fake_groq.py serves a local stand-in
+client        = None
+async_client  = None
+_clients_lock = threading.Lock()
+
+def get_client():
+    global client
+    if client is None:
+        with _clients_lock:
+            if client is None:
+                from groq import Groq
+                client = Groq(api_key=os.environ.get("GROK_API_KEY"))
+    return client
+
+def get_async_client():
+    global async_client
+    if async_client is None:
+        with _clients_lock:
+            if async_client is None:
+                from groq import AsyncGroq
+                async_client = AsyncGroq(api_key=os.environ.get("GROK_API_KEY"))
+    return async_client
+
+# ─── Resilient LLM Calls ─────────────────────────────────
+# Every Groq call goes through llm_call / llm_call_async: one overall
+# deadline (LLM_DEADLINE) covering the wait for a slot and a token, every
+# attempt (each also capped at LLM_TIMEOUT) and the backoff between them;
+# jittered retries on 429/5xx/timeouts, a token bucket sized to our quota,
+# global + per-user concurrency caps and a circuit breaker.
+#
+# These limits live in each process. LLM_REQUESTS_PER_MIN is the account's
+# quota, so each process takes an equal share of it: set LLM_PROCESSES (or
+# gunicorn's WEB_CONCURRENCY) to the number of processes calling Groq.
+# CLI runs such as backfill.py share the quota too; give them their own
+# LLM_REQUESTS_PER_MIN when they run next to the web workers.
+class LLMUnavailable(Exception):
+    pass
+
+rate_limiter = TokenBucket(LLM_REQUESTS_PER_MIN / max(1, LLM_PROCESSES), per=60.0)
+breaker      = CircuitBreaker(threshold=5, reset_after=30.0)
+limiter      = ConcurrencyLimiter(LLM_CONCURRENCY, LLM_USER_CONCURRENCY)
+
+def user_of(persona):
+    return persona["user_id"] if persona and "user_id" in persona else None
+
+def _retryable(error):
+    import groq
+    if isinstance(error, (groq.APITimeoutError, groq.APIConnectionError,
+                          groq.RateLimitError)):
+        return True
+    return isinstance(error, groq.APIStatusError) and error.status_code >= 500
+
+def _retry_after(error):
+    response = getattr(error, "response", None)
+    return response.headers.get("retry-after") if response is not None else None
+
+def record_usage(purpose, usage):
+    """
+    Adds a response's token counts (Groq `usage` field) to the counters.
+    """
+    if usage is None:
+        return
+    inc("llm_tokens_total", usage.prompt_tokens,     purpose=purpose, kind="prompt")
+    inc("llm_tokens_total", usage.completion_tokens, purpose=purpose, kind="completion")
+
+def record_stream_usage(purpose, chunk):
+    # Groq reports usage on the final chunk of a stream under x_groq
+    record_usage(purpose, getattr(getattr(chunk, "x_groq", None), "usage", None))
+
+def _remaining(purpose, deadline):
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        inc("llm_calls_total", purpose=purpose, outcome="deadline")
+        raise LLMUnavailable("LLM call ran out of time")
+    return remaining
+
+def _acquire_token(purpose, deadline):
+    try:
+        rate_limiter.acquire(timeout=_remaining(purpose, deadline))
+    except Saturated as e:
+        inc("llm_calls_total", purpose=purpose, outcome="saturated")
+        raise LLMUnavailable(str(e)) from e
+
+def _give_up(attempt, delay, deadline):
+    """
+    True once retrying can't help: out of attempts, or the backoff would
+    run past the deadline.
+    """
+    return attempt == LLM_MAX_RETRIES or time.monotonic() + delay >= deadline
+
+def _create(purpose, deadline, **kwargs):
+    try:
+        breaker.check()
+    except CircuitOpen as e:
+        inc("llm_calls_total", purpose=purpose, outcome="circuit_open")
+        raise LLMUnavailable(str(e)) from e
+
+    import groq
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        _acquire_token(purpose, deadline)
+        timeout = min(LLM_TIMEOUT, _remaining(purpose, deadline))
+        bounded = get_client().with_options(timeout=timeout, max_retries=0)
+        try:
+            with span("llm", purpose=purpose):
+                response = bounded.chat.completions.create(**kwargs)
+        except groq.APIError as e:
+            if not _retryable(e):
+                inc("llm_calls_total", purpose=purpose, outcome="error")
+                raise
+            delay = backoff_delay(attempt, retry_after=_retry_after(e))
+            if _give_up(attempt, delay, deadline):
+                breaker.record_failure()
+                inc("llm_calls_total", purpose=purpose, outcome="unavailable")
+                raise LLMUnavailable(str(e)) from e
+            inc("llm_retries_total", purpose=purpose)
+            time.sleep(delay)
+            continue
+        breaker.record_success()
+        inc("llm_calls_total", purpose=purpose, outcome="ok")
+        record_usage(purpose, getattr(response, "usage", None))
+        return response
+
+async def _create_async(purpose, deadline, **kwargs):
+    try:
+        breaker.check()
+    except CircuitOpen as e:
+        inc("llm_calls_total", purpose=purpose, outcome="circuit_open")
+        raise LLMUnavailable(str(e)) from e
+
+    import groq
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        try:
+            await rate_limiter.acquire_async(timeout=_remaining(purpose, deadline))
+        except Saturated as e:
+            inc("llm_calls_total", purpose=purpose, outcome="saturated")
+            raise LLMUnavailable(str(e)) from e
+        timeout = min(LLM_TIMEOUT, _remaining(purpose, deadline))
+        bounded = get_async_client().with_options(timeout=timeout, max_retries=0)
+        try:
+            with span("llm", purpose=purpose):
+                response = await bounded.chat.completions.create(**kwargs)
+        except groq.APIError as e:
+            if not _retryable(e):
+                inc("llm_calls_total", purpose=purpose, outcome="error")
+                raise
+            delay = backoff_delay(attempt, retry_after=_retry_after(e))
+            if _give_up(attempt, delay, deadline):
+                breaker.record_failure()
+                inc("llm_calls_total", purpose=purpose, outcome="unavailable")
+                raise LLMUnavailable(str(e)) from e
+            inc("llm_retries_total", purpose=purpose)
+            await asyncio.sleep(delay)
+            continue
+        breaker.record_success()
+        inc("llm_calls_total", purpose=purpose, outcome="ok")
+        record_usage(purpose, getattr(response, "usage", None))
+        return response
+
+@contextmanager
+def llm_slot(user_id, purpose, deadline):
+    """
+    A concurrency slot, waited for until `deadline` at most.
+    """
+    try:
+        with limiter.slot(user_id, timeout=_remaining(purpose, deadline)):
+            yield
+    except Saturated as e:
+        inc("llm_calls_total", purpose=purpose, outcome="saturated")
+        raise LLMUnavailable(str(e)) from e
+
+@asynccontextmanager
+async def llm_slot_async(user_id, purpose, deadline):
+    try:
+        async with limiter.slot_async(user_id, timeout=_remaining(purpose, deadline)):
+            yield
+    except Saturated as e:
+        inc("llm_calls_total", purpose=purpose, outcome="saturated")
+        raise LLMUnavailable(str(e)) from e
+
+def llm_call(user_id=None, purpose="chat", **kwargs):
+    deadline = time.monotonic() + LLM_DEADLINE
+    with llm_slot(user_id, purpose, deadline):
+        return _create(purpose, deadline, **kwargs)
+
+async def llm_call_async(user_id=None, purpose="chat", **kwargs):
+    deadline = time.monotonic() + LLM_DEADLINE
+    async with llm_slot_async(user_id, purpose, deadline):
+        return await _create_async(purpose, deadline, **kwargs)
+
+# ─── Conversation Context ────────────────────────────────
+class ConversationContext:
+    """
+    Today's conversation as a running summary plus the messages after it.
+    Prompts only ever see the summary and the last CONTEXT_WINDOW messages,
+    so their size stays bounded however long the day's chat gets.
+    """
+    def __init__(self, messages, summary="", through_id=0, journal=None):
+        self.messages   = messages      # oldest first; DB rows carry an "id"
+        self.summary    = summary or ""
+        self.through_id = through_id or 0
+        self.journal    = journal       # today's journal as loaded with the turn
+
+    def append(self, role, content, chat_id=None):
+        message = {"role": role, "content": content}
+        if chat_id:
+            message["id"] = chat_id
+        self.messages.append(message)
+
+    def last_id(self):
+        ids = [m["id"] for m in self.messages if m.get("id")]
+        return ids[-1] if ids else self.through_id
+
+    def has_history(self):
+        return bool(self.summary) or len(self.messages) > 1
+
+    def window(self):
+        """
+        Messages to send to the LLM: the summary (if any) + the recent window.
+        """
+        recent = [
+            {"role": m["role"], "content": m["content"]}
+            for m in self.messages[-CONTEXT_WINDOW:]
+        ]
+        if not self.summary:
+            return recent
+        return [self.summary_message()] + recent
+
+    def summary_message(self):
+        return {
+            "role": "system",
+            "content": f"Summary of earlier in today's conversation:\n{self.summary}"
+        }
+
+    def needs_compaction(self):
+        return len(self.messages) > CONTEXT_WINDOW + SUMMARY_BATCH
+
+    def compact(self, user_id=None, summarize=None):
+        """
+        Folds stored messages that fell out of the window into the summary.
+        Returns True if the summary changed and should be saved.
+        """
+        old = [m for m in self.messages[:-CONTEXT_WINDOW] if m.get("id")]
+        if not old:
+            return False
+        summarize       = summarize or summarize_conversation
+        self.summary    = summarize(self.summary, old, user_id)
+        self.through_id = old[-1]["id"]
+        self.messages   = self.messages[len(old):]
+        return True
+
+def format_conversation(messages):
+    """
+    Plain-text transcript for the journal / persona prompts.
+    """
+    return "\n".join([
+        "EARLIER TODAY (SUMMARY): " + m["content"].split("\n", 1)[-1]
+        if m["role"] == "system" else
+        f"{m['role'].upper()}: {m['content']}"
+        for m in messages
+    ])
+
 # ─── Build System Prompt ─────────────────────────────────
+# Keyed by persona version, so a persona write naturally misses the cache
+prompt_cache = make_cache("system_prompts", maxsize=2048, ttl=24 * 3600)
+
 def build_system_prompt(persona, has_history=False):
     """
     Creates the AI's instructions based on user's persona.
     """
-
+    if not persona or "user_id" not in persona or "updated_at" not in persona:
+        return render_system_prompt(persona, has_history)
+
+    key    = (persona["user_id"], str(persona["updated_at"]),
+              bool(persona["onboarded"]), has_history)
+    prompt = prompt_cache.get(key)
+    if prompt is None:
+        prompt = render_system_prompt(persona, has_history)
+        prompt_cache.set(key, prompt)
+    return prompt
+
+def render_system_prompt(persona, has_history=False):
     # New user — onboarding
     if not persona or not persona["onboarded"]:
         return """
@@ -92,7 +387,8 @@ def get_ai_response(messages, persona, has_history=False):
         {"role": "system", "content": system_prompt}
     ] + messages
 
-    response = client.chat.completions.create(
+    response = llm_call(
+        user_of(persona), "chat",
         model=MODEL,
         messages=full_messages,
         max_tokens=500,
@@ -101,6 +397,71 @@ def get_ai_response(messages, persona, has_history=False):
 
     return response.choices[0].message.content
 
+# ─── Stream AI Response ──────────────────────────────────
+def stream_ai_response(messages, persona, has_history=False):
+    """
+    Same as get_ai_response but yields the reply piece by piece
+    as Groq generates it.
+    """
+    system_prompt = build_system_prompt(persona, has_history)
+
+    full_messages = [
+        {"role": "system", "content": system_prompt}
+    ] + messages
+
+    # Hold the concurrency slot for as long as the stream is open
+    deadline = time.monotonic() + LLM_DEADLINE
+    with llm_slot(user_of(persona), "chat_stream", deadline):
+        stream = _create(
+            "chat_stream", deadline,
+            model=MODEL,
+            messages=full_messages,
+            max_tokens=500,
+            temperature=0.9,
+            stream=True
+        )
+
+        for chunk in stream:
+            record_stream_usage("chat_stream", chunk)
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+# ─── Async variants (used by asgi.py) ────────────────────
+async def get_ai_response_async(messages, persona, has_history=False):
+    """
+    get_ai_response for the event loop: waiting on Groq holds no thread.
+    """
+    system_prompt = build_system_prompt(persona, has_history)
+
+    response = await llm_call_async(
+        user_of(persona), "chat",
+        model=MODEL,
+        messages=[{"role": "system", "content": system_prompt}] + messages,
+        max_tokens=500,
+        temperature=0.9
+    )
+
+    return response.choices[0].message.content
+
+async def stream_ai_response_async(messages, persona, has_history=False):
+    system_prompt = build_system_prompt(persona, has_history)
+
+    deadline = time.monotonic() + LLM_DEADLINE
+    async with llm_slot_async(user_of(persona), "chat_stream", deadline):
+        stream = await _create_async(
+            "chat_stream", deadline,
+            model=MODEL,
+            messages=[{"role": "system", "content": system_prompt}] + messages,
+            max_tokens=500,
+            temperature=0.9,
+            stream=True
+        )
+
+        async for chunk in stream:
+            record_stream_usage("chat_stream", chunk)
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
 # ─── Create Journal Entry ─────────────────────────────────
 def create_journal_entry(messages, persona):
     """
@@ -110,14 +471,10 @@ def create_journal_entry(messages, persona):
     goals   = persona["goals"]   or "not specified"
     habits  = persona["habits"]  or "not specified"
 
-    # Format conversation for the prompt
-    conversation = "\n".join([
-        f"{m['role'].upper()}: {m['content']}"
-        for m in messages
-        if m["role"] != "system"
-    ])
+    conversation = format_conversation(messages)
 
-    response = client.chat.completions.create(
+    response = llm_call(
+        user_of(persona), "journal",
         model=MODEL,
         messages=[
             {
@@ -155,17 +512,14 @@ Then write the journal entry."""
     return title, content
 
 # ─── Extract Persona Updates ─────────────────────────────
-def extract_persona(messages):
+def extract_persona(messages, user_id=None):
     """
     After onboarding or conversation, extracts updated persona info.
     """
-    conversation = "\n".join([
-        f"{m['role'].upper()}: {m['content']}"
-        for m in messages
-        if m["role"] != "system"
-    ])
+    conversation = format_conversation(messages)
 
-    response = client.chat.completions.create(
+    response = llm_call(
+        user_id, "persona",
         model=MODEL,
         messages=[
             {
@@ -216,16 +570,13 @@ def create_or_update_journal(messages, persona, existing_content=None):
     goals   = persona["goals"]   if persona else "not specified"
     habits  = persona["habits"]  if persona else "not specified"
 
-    conversation = "\n".join([
-        f"{m['role'].upper()}: {m['content']}"
-        for m in messages
-        if m["role"] != "system"
-    ])
+    conversation = format_conversation(messages)
 
     # If there's existing content, update it
     existing = f"\nExisting journal entry to update:\n{existing_content}" if existing_content else ""
 
-    response = client.chat.completions.create(
+    response = llm_call(
+        user_of(persona), "journal",
         model=MODEL,
         messages=[
             {
@@ -260,4 +611,96 @@ Then write the journal entry."""
     title   = lines[0].replace("TITLE:", "").strip()
     content = "\n".join(lines[1:]).strip()
 
-    return title, content
\ No newline at end of file
+    return title, content
+
+# ─── Summarize Conversation ──────────────────────────────
+def summarize_conversation(summary, messages, user_id=None):
+    """
+    Extends the running summary of today's chat with older messages
+    that no longer fit in the context window.
+    """
+    conversation = format_conversation(messages)
+    previous     = summary or "(nothing yet)"
+
+    response = llm_call(
+        user_id, "summary",
+        model=MODEL,
+        messages=[
+            {
+                "role": "system",
+                "content": "You keep a running summary of a journaling conversation. Be concise."
+            },
+            {
+                "role": "user",
+                "content": f"""Summary so far:
+{previous}
+
+New messages:
+{conversation}
+
+Rewrite the summary to include the new messages.
+Keep names, feelings, events and anything the user wants to follow up on.
+At most 150 words. Reply with the summary only."""
+            }
+        ],
+        max_tokens=250
+    )
+
+    return response.choices[0].message.content.strip()
+
+# ─── Update Journal (incremental) ────────────────────────
+def journal_digest(content, head=200, tail=400):
+    """
+    Compact stand-in for a long entry: its opening and its most recent part.
+    """
+    if len(content) <= head + tail:
+        return content
+    return content[:head].rstrip() + "\n[...]\n" + content[-tail:].lstrip()
+
+def update_journal(new_messages, persona, title, existing_content):
+    """
+    Writes only the paragraph(s) to append to today's entry, from the
+    messages that came in since it was last updated.
+    """
+    goals   = persona["goals"]   if persona else "not specified"
+    habits  = persona["habits"]  if persona else "not specified"
+
+    conversation = format_conversation(new_messages)
+
+    response = llm_call(
+        user_of(persona), "journal_update",
+        model=MODEL,
+        messages=[
+            {
+                "role": "system",
+                "content": """You are a journal writing assistant.
+                           Write in first person as if the USER is writing.
+                           Be personal, reflective and warm."""
+            },
+            {
+                "role": "user",
+                "content": f"""Continue today's journal entry with what was shared since it was last written.
+
+User's goals: {goals}
+User's habits: {habits}
+
+Entry so far ("{title}", shortened):
+{journal_digest(existing_content)}
+
+New conversation:
+{conversation}
+
+Write 1-2 short paragraphs that continue the entry naturally.
+Don't repeat what the entry already says.
+Reply with only the new paragraphs, no title."""
+            }
+        ],
+        max_tokens=300
+    )
+
+    raw   = response.choices[0].message.content.strip()
+    lines = raw.split("\n")
+    # The model sometimes adds a title line anyway
+    if lines[0].startswith("TITLE:"):
+        raw = "\n".join(lines[1:]).strip()
+    return raw
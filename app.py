@@ -1,38 +1,125 @@
-from flask import Flask, render_template, request, redirect, url_for, session
+from flask import (Flask, Response, abort, make_response, render_template, request, redirect,
+                   url_for, session)
 from werkzeug.security import generate_password_hash, check_password_hash
-from database import get_connection, init_db
+from database import get_connection, migrate, release_connections, get_pool_stats
+from cache import get_cache_stats
+import jobs
+import metrics
+import http_cache
+import fragments
+from fragments import forget_note
+from http_cache import page_etag, conditional, revalidating, validators
+from search import search_notes, semantic_search
+from embeddings import index_note, index_user_notes, reindex
+from chat_archive import maintain as maintain_chats, ARCHIVE_AFTER_DAYS
+from transfer import export_stream, import_file, EXPORT_FORMATS, PARSERS
+import chat_store
+from ai import get_ai_response, LLMUnavailable, breaker
+from chat_engine import (engine, persona_extractions, UNAVAILABLE_REPLY,
+                         PERSONA_MAX_AGE_MINUTES)
 from dotenv import load_dotenv
 load_dotenv()
 import os
+import json
+import click
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
 
+# Importing this module only builds the app: no DB connection, no Groq
+# client and no DDL. Schema changes run as a separate step (`flask init-db`).
 app = Flask(__name__)
 app.secret_key = os.environ.get("SECRET_KEY")
-init_db()
+
+# Hand back any pooled connection a route didn't close (e.g. on an exception)
+@app.teardown_request
+def return_connections(exc):
+    release_connections()
+
+# Per-route latency, DB queries per request, sampled profiles (PROFILE_SAMPLE_RATE)
+metrics.install(app)
+
+# Versioned static URLs with long max-age, and 304 counters for them
+http_cache.install(app)
+
+# note_body() / note_card() for templates, cached per note revision
+fragments.install(app)
 
 # ─── Homepage ────────────────────────────────────────────
+PAGE_SIZE   = 30
+PREVIEW_LEN = 160
+
+def encode_cursor(note):
+    return f"{note['created'].isoformat()}_{note['id']}"
+
+def decode_cursor(cursor):
+    """
+    Returns (created, id) for a cursor from encode_cursor, or None if invalid.
+    """
+    try:
+        created, note_id = cursor.rsplit("_", 1)
+        return datetime.fromisoformat(created), int(note_id)
+    except ValueError:
+        return None
+
 @app.route("/")
 def index():
     if "user_id" not in session:
         return redirect(url_for("login"))
-    query = request.args.get("q", "")
+    query   = request.args.get("q", "")
+    mode    = request.args.get("mode", "")
+    after   = decode_cursor(request.args.get("cursor", ""))
+    partial = request.args.get("partial") == "1"
+    next_cursor = None
     conn = get_connection()
     cur = conn.cursor()
-    if query:
-        cur.execute(
-            """SELECT * FROM notes
-               WHERE user_id = %s AND (title ILIKE %s OR content ILIKE %s)
-               ORDER BY created DESC""",
-            (session["user_id"], f"%{query}%", f"%{query}%")
-        )
+
+    # Nothing changed since the client's copy: 304 without querying further.
+    # Semantic results also follow note_embeddings, which indexing updates
+    # without touching notes.
+    semantic = bool(query) and mode == "semantic"
+    embedded = """,
+        (SELECT COUNT(*) FROM note_embeddings WHERE user_id = %(user_id)s) AS embedded,
+        (SELECT MAX(updated) FROM note_embeddings WHERE user_id = %(user_id)s) AS embedded_at
+    """ if semantic else ""
+    cur.execute(
+        f"""SELECT COUNT(*) AS n, MAX(updated) AS updated {embedded}
+            FROM notes WHERE user_id = %(user_id)s""",
+        {"user_id": session["user_id"]}
+    )
+    version = cur.fetchone()
+    etag    = page_etag("index", session["user_id"], *version.values(), request.query_string)
+    cached  = conditional(etag)
+    if cached:
+        cur.close()
+        conn.close()
+        return cached
+
+    if semantic:
+        notes = semantic_search(cur, session["user_id"], query, preview_len=PREVIEW_LEN)
+    elif query:
+        notes = search_notes(cur, session["user_id"], query)
     else:
+        # Keyset pagination on (created, id): same cost at any depth
+        keyset = "AND (created, id) < (%s, %s)" if after else ""
         cur.execute(
-            "SELECT * FROM notes WHERE user_id = %s ORDER BY created DESC",
-            (session["user_id"],)
+            f"""SELECT id, title, created, revision, LEFT(content, %s) AS preview,
+                       LENGTH(content) > %s AS truncated
+                FROM notes
+                WHERE user_id = %s {keyset}
+                ORDER BY created DESC, id DESC
+                LIMIT %s""",
+            (PREVIEW_LEN, PREVIEW_LEN, session["user_id"], *(after or ()),
+             PAGE_SIZE + 1)
         )
-    notes = cur.fetchall()
+        notes = cur.fetchall()
+        if len(notes) > PAGE_SIZE:
+            notes       = notes[:PAGE_SIZE]
+            next_cursor = encode_cursor(notes[-1])
     cur.close()
     conn.close()
-    return render_template("index.html", notes=notes, query=query)
+    template = "_note_cards.html" if partial else "index.html"
+    return validators(make_response(render_template(template, notes=notes, query=query,
+                                                    mode=mode, next_cursor=next_cursor)), etag)
 
 # ─── Signup ──────────────────────────────────────────────
 @app.route("/signup", methods=["GET", "POST"])
@@ -97,9 +184,10 @@ def new_note():
         conn = get_connection()
         cur  = conn.cursor()
         cur.execute(
-            "INSERT INTO notes (user_id, title, content) VALUES (%s, %s, %s)",
+            "INSERT INTO notes (user_id, title, content) VALUES (%s, %s, %s) RETURNING id",
             (session["user_id"], title, content)
         )
+        index_note(cur, cur.fetchone()["id"], session["user_id"], title, content)
         conn.commit()
         cur.close()
         conn.close()
@@ -107,12 +195,28 @@ def new_note():
     return render_template("note.html", note=None)
 
 # ─── View Note ───────────────────────────────────────────
+def note_etag(note_id, revision):
+    return page_etag("note", session["user_id"], note_id, revision)
+
 @app.route("/note/<int:note_id>")
 def view_note(note_id):
     if "user_id" not in session:
         return redirect(url_for("login"))
     conn = get_connection()
     cur  = conn.cursor()
+    if revalidating():
+        # Check the version before loading the whole note
+        cur.execute(
+            "SELECT revision, updated FROM notes WHERE id = %s AND user_id = %s",
+            (note_id, session["user_id"])
+        )
+        version = cur.fetchone()
+        cached  = version and conditional(note_etag(note_id, version["revision"]),
+                                          version["updated"])
+        if cached:
+            cur.close()
+            conn.close()
+            return cached
     cur.execute(
         "SELECT * FROM notes WHERE id = %s AND user_id = %s",
         (note_id, session["user_id"])
@@ -120,7 +224,10 @@ def view_note(note_id):
     note = cur.fetchone()
     cur.close()
     conn.close()
-    return render_template("view.html", note=note)
+    if not note:
+        abort(404)
+    response = make_response(render_template("view.html", note=note))
+    return validators(response, note_etag(note_id, note["revision"]), note["updated"])
 
 # ─── Edit Note ───────────────────────────────────────────
 @app.route("/edit/<int:note_id>", methods=["GET", "POST"])
@@ -141,7 +248,11 @@ def edit_note(note_id):
             "UPDATE notes SET title = %s, content = %s WHERE id = %s AND user_id = %s",
             (title, content, note_id, session["user_id"])
         )
+        if note:
+            index_note(cur, note_id, session["user_id"], title, content)
         conn.commit()
+        if note:
+            forget_note(note_id, note["revision"])
         cur.close()
         conn.close()
         return redirect(url_for("index"))
@@ -157,13 +268,83 @@ def delete_note(note_id):
     conn = get_connection()
     cur  = conn.cursor()
     cur.execute(
-        "DELETE FROM notes WHERE id = %s AND user_id = %s",
+        "DELETE FROM notes WHERE id = %s AND user_id = %s RETURNING revision",
         (note_id, session["user_id"])
     )
+    deleted = cur.fetchone()
     conn.commit()
+    if deleted:
+        forget_note(note_id, deleted["revision"])
     cur.close()
     conn.close()
     return redirect(url_for("index"))
+# ─── Export / Import ─────────────────────────────────────
+@app.route("/export")
+def export_notes():
+    if "user_id" not in session:
+        return redirect(url_for("login"))
+    fmt = request.args.get("format", "zip")
+    if fmt not in EXPORT_FORMATS:
+        return {"error": f"format must be one of {', '.join(EXPORT_FORMATS)}"}, 400
+    mimetype, extension = EXPORT_FORMATS[fmt]
+    return Response(export_stream(session["user_id"], fmt), mimetype=mimetype,
+                    headers={"Content-Disposition":
+                             f'attachment; filename="notes-{datetime.now():%Y%m%d}.{extension}"'})
+
+@app.route("/import", methods=["POST"])
+def import_notes():
+    if "user_id" not in session:
+        return {"error": "Not logged in"}, 401
+    upload = request.files.get("file")
+    if upload is None:
+        return {"error": "No file"}, 400
+    fmt = request.form.get("format") or upload.filename.rsplit(".", 1)[-1].lower()
+    if fmt not in PARSERS:
+        return {"error": f"format must be one of {', '.join(PARSERS)}"}, 400
+    try:
+        counts = import_file(session["user_id"], upload.stream, fmt)
+    except (ValueError, KeyError) as e:
+        return {"error": f"Could not read the file: {e}"}, 400
+    # Embedding a large import takes a while: do it in the background
+    counts["job_id"] = jobs.submit(session["user_id"], "index_notes",
+                                   index_user_notes, session["user_id"]) if counts["notes"] else None
+    return counts
+
+def user_id_for(username):
+    conn = get_connection()
+    cur  = conn.cursor()
+    cur.execute("SELECT id FROM users WHERE username = %s", (username,))
+    user = cur.fetchone()
+    cur.close()
+    conn.close()
+    if not user:
+        raise click.ClickException(f"no user named {username}")
+    return user["id"]
+
+@app.cli.command("export-notes")
+@click.argument("username")
+@click.option("--format", "fmt", type=click.Choice(list(EXPORT_FORMATS)), default="ndjson")
+@click.option("--output", "-o", type=click.File("wb"), default="-")
+def export_notes_command(username, fmt, output):
+    """Export a user's notes, journals and chats."""
+    for chunk in export_stream(user_id_for(username), fmt):
+        output.write(chunk)
+
+@app.cli.command("import-notes")
+@click.argument("username")
+@click.argument("path", type=click.File("rb"))
+@click.option("--format", "fmt", type=click.Choice(list(PARSERS)), default=None,
+              help="Defaults to the file extension.")
+def import_notes_command(username, path, fmt):
+    """Import an NDJSON or JSON export into a user's account."""
+    fmt    = fmt or path.name.rsplit(".", 1)[-1].lower()
+    if fmt not in PARSERS:
+        raise click.ClickException("pass --format ndjson or --format json")
+    user_id = user_id_for(username)
+    counts  = import_file(user_id, path, fmt)
+    click.echo(", ".join(f"{count} {table}" for table, count in counts.items()))
+    click.echo(f"embedded {index_user_notes(user_id)} notes")
+
 # ─── Chat Page ────────────────────────────────────────@app.route("/chat", methods=["GET"])
 # ─── Chat Page ───────────────────────────────────────────
 @app.route("/chat", methods=["GET"])
@@ -174,168 +355,194 @@ def chat():
     conn = get_connection()
     cur  = conn.cursor()
 
-    # Create persona if first time
-    cur.execute(
-        "SELECT * FROM personas WHERE user_id = %s",
-        (session["user_id"],)
-    )
-    persona = cur.fetchone()
-    if not persona:
-        cur.execute(
-            "INSERT INTO personas (user_id) VALUES (%s)",
-            (session["user_id"],)
-        )
-        conn.commit()
-        persona = {"onboarded": False, "goals": "", "habits": "", "summary": ""}
+    # Cached persona (created on first visit)
+    persona = chat_store.load_persona(cur, session["user_id"], PERSONA_MAX_AGE_MINUTES)
+    conn.commit()
 
     # Load today's chat history
     cur.execute(
         """SELECT role, content FROM chats
            WHERE user_id = %s
-           AND created::date = CURRENT_DATE
+           AND created >= CURRENT_DATE AND created < CURRENT_DATE + 1
            ORDER BY created ASC""",
         (session["user_id"],)
     )
     history = [dict(row) for row in cur.fetchall()]
 
-    # If no history today → generate opening message from AI
+    # If no history today → use the pre-generated opening, or queue one
+    opening_job    = None
+    opening_failed = False
     if not history:
-        from ai import get_ai_response
-        opening = get_ai_response([], persona, has_history=False)
         cur.execute(
-            "INSERT INTO chats (user_id, role, content) VALUES (%s, %s, %s)",
-            (session["user_id"], "assistant", opening)
+            """WITH opening AS (
+                   DELETE FROM opening_messages
+                   WHERE user_id = %s AND date = CURRENT_DATE
+                   RETURNING user_id, content
+               )
+               INSERT INTO chats (user_id, role, content)
+               SELECT user_id, 'assistant', content FROM opening
+               RETURNING content""",
+            (session["user_id"],)
         )
+        opening = cur.fetchone()
         conn.commit()
-        history = [{"role": "assistant", "content": opening}]
+        if opening:
+            history = [{"role": "assistant", "content": opening["content"]}]
+        else:
+            # One opening job a day: a reload waits on the same job, and one
+            # that failed (Groq down) gets the static opening, not a retry.
+            # A job still pending after OPENING_JOB_TIMEOUT died with its
+            # worker (deploy, recycling) and is submitted again.
+            cur.execute(
+                """SELECT id, status,
+                          created < NOW() - make_interval(secs => %s) AS lost
+                   FROM jobs
+                   WHERE user_id = %s AND kind = 'opening' AND created >= CURRENT_DATE
+                   ORDER BY id DESC LIMIT 1""",
+                (OPENING_JOB_TIMEOUT, session["user_id"])
+            )
+            job = cur.fetchone()
+            if job is None or (job["status"] in ("queued", "running") and job["lost"]):
+                opening_job = jobs.submit(session["user_id"], "opening",
+                                          generate_opening, session["user_id"], persona)
+            elif job["status"] in ("queued", "running"):
+                opening_job = job["id"]
+            else:
+                opening_failed = True
 
     cur.close()
     conn.close()
 
-    return render_template("chat.html", history=history)
-
-
-# ─── Chat Message ─────────────────────────────────────────
-@app.route("/chat/message", methods=["POST"])
-def chat_message():
-    if "user_id" not in session:
-        return redirect(url_for("login"))
+    return render_template("chat.html", history=history, opening_job=opening_job,
+                           opening_failed=opening_failed, fallback_opening=FALLBACK_OPENING)
 
-    user_message = request.form["message"]
-    user_id      = session["user_id"]
+# ─── Opening Messages ────────────────────────────────────
+FALLBACK_OPENING    = "Hey! How has your day been so far?"
+OPENING_ACTIVE_DAYS = int(os.environ.get("OPENING_ACTIVE_DAYS", 14))
+OPENING_JOB_TIMEOUT = int(os.environ.get("OPENING_JOB_TIMEOUT", 120))
 
+def generate_opening(user_id, persona):
+    """
+    Fallback for users the nightly batch missed: writes today's opening
+    straight into chats, unless the conversation already started.
+    """
+    opening = get_ai_response([], persona, has_history=False)
     conn = get_connection()
     cur  = conn.cursor()
-
-    # Load persona
-    cur.execute(
-        "SELECT * FROM personas WHERE user_id = %s",
-        (user_id,)
-    )
-    persona = cur.fetchone()
-
-    # Load today's chat history
-    cur.execute(
-        """SELECT role, content FROM chats
-           WHERE user_id = %s
-           AND created::date = CURRENT_DATE
-           ORDER BY created ASC""",
-        (user_id,)
-    )
-    history = [dict(row) for row in cur.fetchall()]
-
-    # Save user message
-    cur.execute(
-        "INSERT INTO chats (user_id, role, content) VALUES (%s, %s, %s)",
-        (user_id, "user", user_message)
-    )
-    conn.commit()
-
-    history.append({"role": "user", "content": user_message})
-
-    # Get AI response
-    from ai import get_ai_response, extract_persona, create_or_update_journal
-    has_history = len(history) > 1   # more than just the user's first message
-    ai_reply = get_ai_response(history, persona, has_history)
-
-    # Save AI response
-    cur.execute(
-        "INSERT INTO chats (user_id, role, content) VALUES (%s, %s, %s)",
-        (user_id, "assistant", ai_reply)
-    )
-    conn.commit()
-
-    history.append({"role": "assistant", "content": ai_reply})
-
-    # ── Handle onboarding complete ────────────────────────
-    if "[ONBOARDING_COMPLETE]" in ai_reply:
-        persona_data = extract_persona(history)
+    try:
         cur.execute(
-            """UPDATE personas
-               SET goals = %s, habits = %s, summary = %s, onboarded = TRUE
-               WHERE user_id = %s""",
-            (persona_data["goals"], persona_data["habits"],
-             persona_data["summary"], user_id)
+            """INSERT INTO chats (user_id, role, content)
+               SELECT %s, 'assistant', %s
+               WHERE NOT EXISTS (
+                   SELECT 1 FROM chats WHERE user_id = %s
+                   AND created >= CURRENT_DATE AND created < CURRENT_DATE + 1
+               )""",
+            (user_id, opening, user_id)
         )
         conn.commit()
-        ai_reply = ai_reply.replace("[ONBOARDING_COMPLETE]", "").strip()
-
-    # ── Save/update journal after every user message ──────
-    if persona and persona["onboarded"]:
-        # Check if today's journal entry exists
-        cur.execute(
-            """SELECT dj.note_id, n.content FROM daily_journals dj
-               JOIN notes n ON n.id = dj.note_id
-               WHERE dj.user_id = %s AND dj.date = CURRENT_DATE""",
-            (user_id,)
-        )
-        existing = cur.fetchone()
-
-        # Create or update journal entry
-        existing_content = existing["content"] if existing else None
-        title, content   = create_or_update_journal(
-            history, persona, existing_content
-        )
-
-        if existing:
-            # Update existing note
-            cur.execute(
-                "UPDATE notes SET title = %s, content = %s WHERE id = %s",
-                (title, content, existing["note_id"])
-            )
-        else:
-            # Create new note
-            cur.execute(
-                """INSERT INTO notes (user_id, title, content)
-                   VALUES (%s, %s, %s) RETURNING id""",
-                (user_id, title, content)
-            )
-            note_id = cur.fetchone()["id"]
-            cur.execute(
-                """INSERT INTO daily_journals (user_id, note_id)
-                   VALUES (%s, %s)""",
-                (user_id, note_id)
-            )
+    finally:
+        cur.close()
+        conn.close()
 
-        # Update persona
-        persona_data = extract_persona(history)
+def pregenerate_openings(days_ahead=0, workers=4):
+    """
+    Generates the opening message for every onboarded user who chatted in
+    the last OPENING_ACTIVE_DAYS and doesn't have one yet for the target
+    day, so opening the chat page is a plain DB read. Everyone else gets
+    generate_opening on their next visit. Returns (created, {user_id: error}).
+    """
+    conn = get_connection()
+    cur  = conn.cursor()
+    try:
+        # Openings nobody came back for
+        cur.execute("DELETE FROM opening_messages WHERE date < CURRENT_DATE")
         cur.execute(
-            """UPDATE personas
-               SET goals = %s, habits = %s, summary = %s, updated_at = NOW()
-               WHERE user_id = %s""",
-            (persona_data["goals"], persona_data["habits"],
-             persona_data["summary"], user_id)
+            """SELECT p.* FROM personas p
+               WHERE p.onboarded
+               AND EXISTS (
+                   SELECT 1 FROM chats c
+                   WHERE c.user_id = p.user_id AND c.created >= CURRENT_DATE - %s
+               )
+               AND NOT EXISTS (
+                   SELECT 1 FROM opening_messages o
+                   WHERE o.user_id = p.user_id AND o.date = CURRENT_DATE + %s
+               )""",
+            (OPENING_ACTIVE_DAYS, days_ahead)
         )
+        personas = cur.fetchall()
         conn.commit()
 
-    # ── Handle journal ready signal ───────────────────────
-    if "[JOURNAL_READY]" in ai_reply:
-        ai_reply = ai_reply.replace("[JOURNAL_READY]", "").strip()
-        ai_reply += "\n\n✅ Today's journal entry saved to your notes!"
-
+        def generate(persona):
+            return get_ai_response([], persona, has_history=False)
+
+        created, failed = 0, {}
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(generate, persona): persona["user_id"] for persona in personas}
+            for future in as_completed(futures):
+                user_id = futures[future]
+                try:
+                    opening = future.result()
+                except Exception as e:
+                    # One user's failure shouldn't cost everyone else theirs
+                    failed[user_id] = f"{type(e).__name__}: {e}"
+                    continue
+                cur.execute(
+                    """INSERT INTO opening_messages (user_id, date, content)
+                       VALUES (%s, CURRENT_DATE + %s, %s)
+                       ON CONFLICT (user_id, date) DO NOTHING""",
+                    (user_id, days_ahead, opening)
+                )
+                conn.commit()
+                created += 1
+    finally:
+        cur.close()
+        conn.close()
+    return created, failed
+
+@app.cli.command("pregenerate-openings")
+@click.option("--days-ahead", default=0, help="0 = today, 1 = tomorrow.")
+@click.option("--workers", default=4, help="Concurrent LLM calls.")
+def pregenerate_openings_command(days_ahead, workers):
+    """Pre-generate chat opening messages (run from cron)."""
+    created, failed = pregenerate_openings(days_ahead, workers)
+    for user_id, error in failed.items():
+        click.echo(f"user {user_id}: {error}", err=True)
+    click.echo(f"generated {created} opening messages, {len(failed)} failed")
+
+@app.cli.command("index-notes")
+@click.option("--all", "everything", is_flag=True, help="Re-embed every note, not just new ones.")
+def index_notes_command(everything):
+    """Embed notes for semantic search (after deploy or an EMBEDDING_DIM change)."""
+    conn = get_connection()
+    cur  = conn.cursor()
+    written = reindex(cur, everything)
+    conn.commit()
     cur.close()
     conn.close()
+    click.echo(f"embedded {written} notes")
+
+@app.cli.command("archive-chats")
+@click.option("--after-days", default=ARCHIVE_AFTER_DAYS, help="Archive months older than this.")
+def archive_chats_command(after_days):
+    """Create upcoming chat partitions and archive old months (run from cron)."""
+    conn = get_connection()
+    created, archived = maintain_chats(conn, after_days)
+    conn.close()
+    for name in created:
+        click.echo(f"created {name}")
+    for month, days in archived.items():
+        click.echo(f"archived {month:%Y-%m}: {days} user-days")
+
+# ─── Chat Message ─────────────────────────────────────────
+@app.route("/chat/message", methods=["POST"])
+def chat_message():
+    if "user_id" not in session:
+        return redirect(url_for("login"))
 
+    try:
+        engine.run(session["user_id"], request.form["message"])
+    except LLMUnavailable:
+        pass
     return redirect(url_for("chat"))
 
 # ─── Chat API (AJAX) ─────────────────────────────────────
@@ -344,117 +551,92 @@ def chat_send():
     if "user_id" not in session:
         return {"error": "Not logged in"}, 401
 
-    user_message = request.json.get("message")
-    user_id      = session["user_id"]
-
-    conn = get_connection()
-    cur  = conn.cursor()
+    try:
+        return engine.run(session["user_id"], request.json.get("message"))
+    except LLMUnavailable:
+        # Provider is struggling: say so instead of hanging the request
+        return {"reply": UNAVAILABLE_REPLY, "journal_saved": False,
+                "job_id": None}, 503
 
-    # Load persona
-    cur.execute(
-        "SELECT * FROM personas WHERE user_id = %s",
-        (user_id,)
-    )
-    persona = cur.fetchone()
-
-    # Load today's history
-    cur.execute(
-        """SELECT role, content FROM chats
-           WHERE user_id = %s
-           AND created::date = CURRENT_DATE
-           ORDER BY created ASC""",
-        (user_id,)
-    )
-    history = [dict(row) for row in cur.fetchall()]
+# ─── Chat Stream (SSE) ───────────────────────────────────
+def sse(data, event=None):
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
 
-    # Save user message
-    cur.execute(
-        "INSERT INTO chats (user_id, role, content) VALUES (%s, %s, %s)",
-        (user_id, "user", user_message)
-    )
-    conn.commit()
-
-    history.append({"role": "user", "content": user_message})
-
-    # Get AI response
-    from ai import get_ai_response, extract_persona, create_or_update_journal
-    has_history = len(history) > 1
-    ai_reply    = get_ai_response(history, persona, has_history)
-
-    # Save AI response
-    cur.execute(
-        "INSERT INTO chats (user_id, role, content) VALUES (%s, %s, %s)",
-        (user_id, "assistant", ai_reply)
-    )
-    conn.commit()
-
-    history.append({"role": "assistant", "content": ai_reply})
-
-    # Handle onboarding
-    if "[ONBOARDING_COMPLETE]" in ai_reply:
-        persona_data = extract_persona(history)
-        cur.execute(
-            """UPDATE personas
-               SET goals = %s, habits = %s, summary = %s, onboarded = TRUE
-               WHERE user_id = %s""",
-            (persona_data["goals"], persona_data["habits"],
-             persona_data["summary"], user_id)
-        )
-        conn.commit()
-        ai_reply = ai_reply.replace("[ONBOARDING_COMPLETE]", "").strip()
-
-    # Save/update journal
-    if persona and persona["onboarded"]:
-        cur.execute(
-            """SELECT dj.note_id, n.content FROM daily_journals dj
-               JOIN notes n ON n.id = dj.note_id
-               WHERE dj.user_id = %s AND dj.date = CURRENT_DATE""",
-            (user_id,)
-        )
-        existing        = cur.fetchone()
-        existing_content = existing["content"] if existing else None
-        title, content  = create_or_update_journal(
-            history, persona, existing_content
-        )
-        if existing:
-            cur.execute(
-                "UPDATE notes SET title = %s, content = %s WHERE id = %s",
-                (title, content, existing["note_id"])
-            )
-        else:
-            cur.execute(
-                """INSERT INTO notes (user_id, title, content)
-                   VALUES (%s, %s, %s) RETURNING id""",
-                (user_id, title, content)
-            )
-            note_id = cur.fetchone()["id"]
-            cur.execute(
-                "INSERT INTO daily_journals (user_id, note_id) VALUES (%s, %s)",
-                (user_id, note_id)
-            )
-        persona_data = extract_persona(history)
-        cur.execute(
-            """UPDATE personas
-               SET goals = %s, habits = %s, summary = %s, updated_at = NOW()
-               WHERE user_id = %s""",
-            (persona_data["goals"], persona_data["habits"],
-             persona_data["summary"], user_id)
-        )
-        conn.commit()
-
-    # Handle journal ready
-    journal_saved = False
-    if "[JOURNAL_READY]" in ai_reply:
-        ai_reply     = ai_reply.replace("[JOURNAL_READY]", "").strip()
-        journal_saved = True
+@app.route("/chat/stream", methods=["POST"])
+def chat_stream():
+    if "user_id" not in session:
+        return {"error": "Not logged in"}, 401
 
-    cur.close()
-    conn.close()
+    user_id          = session["user_id"]
+    persona, context = engine.begin(user_id, request.json.get("message"))
 
+    def generate():
+        try:
+            for event, data in engine.stream(user_id, persona, context):
+                if event == "delta":
+                    yield sse({"delta": data})
+                else:
+                    yield sse(data, event)
+        except Exception:
+            yield sse({"error": UNAVAILABLE_REPLY}, "error")
+
+    return Response(generate(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache",
+                             "X-Accel-Buffering": "no"})
+
+# ─── Job Status ──────────────────────────────────────────
+@app.route("/jobs/<int:job_id>")
+def job_status(job_id):
+    if "user_id" not in session:
+        return {"error": "Not logged in"}, 401
+    job = jobs.get_status(job_id, session["user_id"])
+    if not job:
+        return {"error": "Not found"}, 404
     return {
-        "reply":        ai_reply,
-        "journal_saved": journal_saved
+        "id":       job["id"],
+        "kind":     job["kind"],
+        "status":   job["status"],
+        "finished": job["finished"].isoformat() if job["finished"] else None
     }
 
+# ─── Metrics ─────────────────────────────────────────────
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+
+@app.route("/metrics")
+def metrics_endpoint():
+    """
+    Prometheus text format. Set METRICS_TOKEN to require
+    `Authorization: Bearer <token>`.
+    """
+    if METRICS_TOKEN and request.headers.get("Authorization") != f"Bearer {METRICS_TOKEN}":
+        return {"error": "Forbidden"}, 403
+    gauges = [(f"db_pool_{key}", {}, value) for key, value in get_pool_stats().items()]
+    for name, stats in get_cache_stats().items():
+        gauges += [(f"cache_{key}", {"cache": name}, value) for key, value in stats.items()]
+    gauges += [("persona_extractions", {"result": key}, value)
+               for key, value in persona_extractions.items()]
+    gauges.append(("llm_circuit_open", {}, int(breaker.state == "open")))
+    return Response(metrics.render(gauges), mimetype="text/plain; version=0.0.4")
+
+# ─── Startup ─────────────────────────────────────────────
+@app.cli.command("init-db")
+def init_db_command():
+    """Apply pending schema migrations (run once per deploy)."""
+    for applied in migrate():
+        click.echo(f"applied {applied}")
+    click.echo("schema up to date")
+
+def create_app():
+    """
+    Startup path for servers: gunicorn "app:create_app()".
+    Stays cheap so workers boot fast and don't need the database up;
+    set AUTO_MIGRATE=1 to apply migrations here instead (dev only).
+    """
+    if os.environ.get("AUTO_MIGRATE") == "1":
+        from database import init_db
+        init_db()
+    return app
+
 if __name__ == "__main__":
-    app.run(debug=True)
\ No newline at end of file
+    create_app().run(debug=True)
\ No newline at end of file
@@ -0,0 +1,143 @@
+"""
+Async serving mode.
+
+    uvicorn asgi:app
+    gunicorn asgi:app -k uvicorn.workers.UvicornWorker
+
+/chat/send and /chat/stream run on the event loop with the async Groq
+client, so a user waiting on the LLM costs a coroutine, not a worker.
+Their short DB steps run on threads against the same connection pool
+(psycopg2 has no asyncio API). Every other route is the regular Flask
+app, mounted through asgiref's WSGI adapter.
+"""
+import json
+import time
+import asyncio
+from http.cookies import SimpleCookie
+from asgiref.wsgi import WsgiToAsgi
+from itsdangerous import BadSignature
+
+from app import create_app, sse
+from ai import LLMUnavailable
+from chat_engine import engine, UNAVAILABLE_REPLY
+import metrics
+
+flask_app = create_app()
+wsgi      = WsgiToAsgi(flask_app)
+
+# ─── Helpers ─────────────────────────────────────────────
+def session_user_id(scope):
+    """
+    Reads the user id from Flask's signed session cookie.
+    """
+    headers = dict(scope["headers"])
+    cookie  = SimpleCookie(headers.get(b"cookie", b"").decode("latin-1"))
+    name    = flask_app.config["SESSION_COOKIE_NAME"]
+    if name not in cookie:
+        return None
+    serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+    max_age    = int(flask_app.permanent_session_lifetime.total_seconds())
+    try:
+        return serializer.loads(cookie[name].value, max_age=max_age).get("user_id")
+    except BadSignature:
+        return None
+
+async def read_json(receive):
+    body = b""
+    while True:
+        message = await receive()
+        body   += message.get("body", b"")
+        if not message.get("more_body"):
+            break
+    try:
+        return json.loads(body or b"{}")
+    except ValueError:
+        return {}
+
+async def send_json(send, data, status=200):
+    await send({
+        "type":    "http.response.start",
+        "status":  status,
+        "headers": [(b"content-type", b"application/json")],
+    })
+    await send({"type": "http.response.body", "body": json.dumps(data).encode()})
+
+# ─── Chat API (async) ────────────────────────────────────
+async def chat_send(scope, receive, send):
+    user_id = session_user_id(scope)
+    if not user_id:
+        return await send_json(send, {"error": "Not logged in"}, 401)
+
+    user_message = (await read_json(receive)).get("message")
+    try:
+        result = await engine.run_async(user_id, user_message)
+    except LLMUnavailable:
+        return await send_json(send, {"reply": UNAVAILABLE_REPLY,
+                                      "journal_saved": False, "job_id": None}, 503)
+    await send_json(send, result)
+
+async def chat_stream(scope, receive, send):
+    user_id = session_user_id(scope)
+    if not user_id:
+        return await send_json(send, {"error": "Not logged in"}, 401)
+
+    user_message = (await read_json(receive)).get("message")
+
+    persona, context = await asyncio.to_thread(engine.begin, user_id, user_message)
+
+    await send({
+        "type":    "http.response.start",
+        "status":  200,
+        "headers": [(b"content-type", b"text/event-stream"),
+                    (b"cache-control", b"no-cache"),
+                    (b"x-accel-buffering", b"no")],
+    })
+
+    async def emit(text, more=True):
+        await send({"type": "http.response.body",
+                    "body": text.encode(), "more_body": more})
+
+    try:
+        async for event, data in engine.stream_async(user_id, persona, context):
+            if event == "delta":
+                await emit(sse({"delta": data}))
+            else:
+                await emit(sse(data, event), more=False)
+    except Exception:
+        await emit(sse({"error": UNAVAILABLE_REPLY}, "error"), more=False)
+
+ASYNC_ROUTES = {
+    ("POST", "/chat/send"):   chat_send,
+    ("POST", "/chat/stream"): chat_stream,
+}
+
+# ─── ASGI Entry Point ────────────────────────────────────
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    handler = ASYNC_ROUTES.get((scope.get("method"), scope.get("path")))
+    if not handler:
+        return await wsgi(scope, receive, send)
+
+    # Flask's request hooks don't see these routes, so time them here
+    status = {}
+    async def send_tracked(message):
+        if message["type"] == "http.response.start":
+            status["code"] = message["status"]
+        await send(message)
+
+    start = time.perf_counter()
+    token = metrics.start_trace()
+    try:
+        await handler(scope, receive, send_tracked)
+    finally:
+        trace = metrics.end_trace(token)
+        metrics.record_request(scope["path"], scope["method"], status.get("code", 500),
+                               time.perf_counter() - start, trace)
@@ -0,0 +1,323 @@
+"""
+Offline regeneration of journals and personas from chat history.
+
+    python backfill.py journals --workers 4 --checkpoint journals.ckpt
+    python backfill.py personas --since 2026-01-01
+    python backfill.py journals --checkpoint journals.ckpt --retry-failed
+
+Streams chats with a server-side cursor, grouped per user and day,
+runs the ai.py functions on a bounded worker pool and writes results
+back in batched transactions. Progress is checkpointed after every
+batch, so an interrupted run picks up where it stopped. Groups whose
+LLM call failed are kept in the checkpoint; --retry-failed runs just
+those again.
+"""
+import os
+import sys
+import json
+import time
+import heapq
+import argparse
+import itertools
+import collections
+from datetime import date
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from database import get_connection, init_db
+from ai import create_or_update_journal, extract_persona
+from chat_store import forget_persona
+from embeddings import index_note
+from chat_archive import stream_archived_days
+
+# ─── Checkpoints ─────────────────────────────────────────
+def load_checkpoint(path, mode):
+    """
+    Returns (last key written, failed keys); (None, []) without a checkpoint.
+    """
+    if not path or not os.path.exists(path):
+        return None, []
+    with open(path) as f:
+        data = json.load(f)
+    if data.get("mode") != mode:
+        sys.exit(f"{path} is a checkpoint for '{data.get('mode')}', not '{mode}'")
+    failed = [(user_id, date.fromisoformat(day)) for user_id, day in data.get("failed", [])]
+    return (data["user_id"], date.fromisoformat(data["day"])), failed
+
+def save_checkpoint(path, mode, key, failed=()):
+    if not path:
+        return
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump({"mode": mode, "user_id": key[0], "day": key[1].isoformat(),
+                   "failed": [[user_id, day.isoformat()] for user_id, day in failed]}, f)
+    os.replace(tmp, path)
+
+# ─── Streaming History ───────────────────────────────────
+def stream_days(conn, args, after, only=None):
+    """
+    Yields ((user_id, day), messages) in (user_id, day) order, reading
+    chats through a named (server-side) cursor, merged with the days
+    chat_archive.py has already compacted. `only` limits it to those
+    keys (to those users in personas mode).
+    """
+    where, params = ["TRUE"], []
+    archived      = ["TRUE"]
+    if after:
+        where.append("(user_id > %s OR (user_id = %s AND created >= %s::date + 1))")
+        archived.append("(user_id > %s OR (user_id = %s AND date >= %s::date + 1))")
+        params += [after[0], after[0], after[1]]
+    if only and args.mode == "personas":
+        where.append("user_id = ANY(%s)")
+        archived.append("user_id = ANY(%s)")
+        params.append(sorted({user_id for user_id, _ in only}))
+    elif only:
+        where.append("(user_id, created::date) IN %s")
+        archived.append("(user_id, date) IN %s")
+        params.append(tuple(only))
+    if args.user:
+        where.append("user_id = %s")
+        archived.append("user_id = %s")
+        params.append(args.user)
+    if args.since:
+        where.append("created >= %s")
+        archived.append("date >= %s")
+        params.append(args.since)
+    if args.until:
+        where.append("created < %s::date + 1")
+        archived.append("date < %s::date + 1")
+        params.append(args.until)
+
+    cur = conn.cursor(name="backfill_chats")
+    cur.itersize = 2000
+    cur.execute(
+        f"""SELECT id, user_id, created::date AS day, role, content
+            FROM chats
+            WHERE {" AND ".join(where)}
+            ORDER BY user_id, created, id""",
+        params
+    )
+    live = (
+        (key, [dict(r) for r in rows])
+        for key, rows in itertools.groupby(cur, key=lambda r: (r["user_id"], r["day"]))
+    )
+    yield from heapq.merge(stream_archived_days(conn, " AND ".join(archived), params),
+                           live, key=lambda item: item[0])
+    cur.close()
+
+def latest_per_user(days, limit=60):
+    """
+    Collapses the day stream to one item per user: their most recent
+    `limit` messages, keyed by the user's last day.
+    """
+    for user_id, user_days in itertools.groupby(days, key=lambda d: d[0][0]):
+        recent = collections.deque(maxlen=limit)
+        for key, messages in user_days:
+            recent.extend(messages)
+        yield key, list(recent)
+
+def load_personas(user_ids):
+    conn = get_connection()
+    cur  = conn.cursor()
+    cur.execute("SELECT * FROM personas WHERE user_id = ANY(%s)", (list(user_ids),))
+    personas = {p["user_id"]: p for p in cur.fetchall()}
+    cur.close()
+    conn.close()
+    return personas
+
+# ─── Work Items ──────────────────────────────────────────
+def journal_job(key, messages, persona):
+    title, content = create_or_update_journal(messages, persona)
+    return key, (title, content, messages[-1]["id"])
+
+def persona_job(key, messages, persona):
+    return key, extract_persona(messages, key[0])
+
+def write_journals(cur, results):
+    for (user_id, day), (title, content, through_id) in results:
+        cur.execute(
+            """SELECT note_id FROM daily_journals
+               WHERE user_id = %s AND date = %s FOR UPDATE""",
+            (user_id, day)
+        )
+        existing = cur.fetchone()
+        if existing:
+            cur.execute(
+                "UPDATE notes SET title = %s, content = %s WHERE id = %s",
+                (title, content, existing["note_id"])
+            )
+            cur.execute(
+                """UPDATE daily_journals SET through_chat_id = %s
+                   WHERE user_id = %s AND date = %s""",
+                (through_id, user_id, day)
+            )
+            index_note(cur, existing["note_id"], user_id, title, content)
+        else:
+            cur.execute(
+                """INSERT INTO notes (user_id, title, content, created)
+                   VALUES (%s, %s, %s, %s) RETURNING id""",
+                (user_id, title, content, day)
+            )
+            note_id = cur.fetchone()["id"]
+            cur.execute(
+                """INSERT INTO daily_journals (user_id, note_id, date, through_chat_id)
+                   VALUES (%s, %s, %s, %s)""",
+                (user_id, note_id, day, through_id)
+            )
+            index_note(cur, note_id, user_id, title, content)
+
+def write_personas(cur, results):
+    for (user_id, _), data in results:
+        cur.execute(
+            """UPDATE personas
+               SET goals = %s, habits = %s, summary = %s,
+                   pending_messages = 0, updated_at = NOW()
+               WHERE user_id = %s""",
+            (data["goals"], data["habits"], data["summary"], user_id)
+        )
+        forget_persona(user_id)
+
+def run_job(job, key, messages, persona):
+    try:
+        return job(key, messages, persona)
+    except Exception as e:
+        print(f"user {key[0]} / {key[1]}: {e}", file=sys.stderr)
+        return key, None
+
+MODES = {
+    "journals": (journal_job, write_journals),
+    "personas": (persona_job, write_personas),
+}
+
+# ─── Runner ──────────────────────────────────────────────
+class Backfill:
+    def __init__(self, args):
+        self.args            = args
+        self.job, self.write = MODES[args.mode]
+        self.pending         = []      # keys in submit order
+        self.results         = {}      # key -> result (None if failed)
+        self.position        = None    # last key the checkpoint is past
+        self.failed          = []      # failed keys, kept in the checkpoint
+        self.groups          = 0
+        self.messages        = 0
+        self.started         = time.monotonic()
+        self.last_report     = self.started
+
+    def run(self):
+        after, failed = load_checkpoint(self.args.checkpoint, self.args.mode)
+        only = None
+        if self.args.retry_failed:
+            if not failed:
+                print("nothing to retry")
+                return
+            # Only the failed keys; the checkpoint keeps its place
+            print(f"retrying {len(failed)} failed")
+            self.position, only, after = after, failed, None
+        elif after:
+            print(f"resuming after user {after[0]} / {after[1]}")
+            self.failed = failed
+
+        reader = get_connection()
+        days   = stream_days(reader, self.args, after, only)
+        if self.args.mode == "personas":
+            days = latest_per_user(days)
+
+        in_flight = set()
+        with ThreadPoolExecutor(max_workers=self.args.workers) as pool:
+            for chunk in self.chunks(days):
+                personas = load_personas({key[0] for key, _ in chunk})
+                for key, messages in chunk:
+                    persona = personas.get(key[0])
+                    if self.args.mode == "journals" and not (persona and persona["onboarded"]):
+                        continue
+                    # Bound the queue so we never read far ahead of the workers
+                    while len(in_flight) >= self.args.workers * 2:
+                        done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                        self.collect(done)
+                    self.pending.append(key)
+                    self.messages += len(messages)
+                    in_flight.add(pool.submit(run_job, self.job, key, messages, persona))
+            done, _ = wait(in_flight)
+            self.collect(done)
+        self.flush(force=True)
+        reader.close()
+        self.report(final=True)
+
+    def chunks(self, days):
+        while True:
+            chunk = list(itertools.islice(days, 100))
+            if not chunk:
+                return
+            yield chunk
+
+    def collect(self, futures):
+        for future in futures:
+            key, result = future.result()
+            self.results[key] = result
+        self.flush()
+        self.report()
+
+    def flush(self, force=False):
+        """
+        Writes the completed prefix of submitted work in one transaction
+        and moves the checkpoint past it, noting the keys that failed.
+        """
+        ready = []
+        for key in self.pending:
+            if key not in self.results:
+                break
+            ready.append(key)
+        if not ready or (len(ready) < self.args.batch and not force):
+            return
+
+        batch = [(key, self.results[key]) for key in ready if self.results[key]]
+        if batch and not self.args.dry_run:
+            conn = get_connection()
+            cur  = conn.cursor()
+            self.write(cur, batch)
+            conn.commit()
+            cur.close()
+            conn.close()
+
+        self.failed += [key for key in ready if self.results[key] is None]
+        if not self.args.retry_failed:
+            self.position = ready[-1]
+        save_checkpoint(self.args.checkpoint, self.args.mode, self.position, self.failed)
+        for key in ready:
+            del self.results[key]
+        self.pending = self.pending[len(ready):]
+        self.groups += len(ready)
+
+    def report(self, final=False):
+        now = time.monotonic()
+        if not final and now - self.last_report < self.args.report_every:
+            return
+        self.last_report = now
+        elapsed = max(now - self.started, 1e-9)
+        unit    = "days" if self.args.mode == "journals" else "users"
+        print(f"{self.groups} {unit} written, {len(self.failed)} failed, "
+              f"{self.groups / elapsed:.2f} {unit}/s, "
+              f"{self.messages / elapsed:.1f} messages/s")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("mode", choices=sorted(MODES))
+    parser.add_argument("--user",  type=int, help="only this user id")
+    parser.add_argument("--since", help="first day (YYYY-MM-DD)")
+    parser.add_argument("--until", help="last day (YYYY-MM-DD)")
+    parser.add_argument("--workers", type=int, default=4, help="concurrent LLM calls")
+    parser.add_argument("--batch",   type=int, default=20, help="days per write transaction")
+    parser.add_argument("--checkpoint", help="file to resume from / save progress to")
+    parser.add_argument("--report-every", type=float, default=10.0, help="seconds")
+    parser.add_argument("--dry-run", action="store_true", help="call the LLM, write nothing")
+    parser.add_argument("--retry-failed", action="store_true",
+                        help="run only the groups the checkpoint lists as failed")
+    args = parser.parse_args()
+    if args.retry_failed and not args.checkpoint:
+        parser.error("--retry-failed needs --checkpoint")
+
+    init_db()
+    Backfill(args).run()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+Today's-history read cost as chat history grows, plus archival.
+
+    python bench/chat_history.py --steps 4 --rows 250000
+    python bench/chat_history.py --steps 4 --rows 250000 --archive
+
+Creates a few bench users against DATABASE_URL, then repeatedly adds
+`--rows` chats spread over the past year and times the chat page's
+"today's history" read for one of them. Each step prints the total
+history size, the read's median/p99 latency, how many partitions the
+plan touched and the buffers it read; with partitioning those stay flat
+while history grows. --archive then runs chat_archive.maintain over the
+bench rows' old months and reports the compression ratio.
+
+History is backdated, so this creates (and with --archive, archives)
+partitions for past months: run it against a scratch database.
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+import statistics
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import get_connection, init_db, ensure_chat_partitions
+from chat_archive import maintain
+
+TODAY_QUERY = """SELECT role, content FROM chats
+                 WHERE user_id = %s
+                 AND created >= CURRENT_DATE AND created < CURRENT_DATE + 1
+                 ORDER BY created ASC"""
+
+# ─── Setup ───────────────────────────────────────────────
+def create_users(cur, count):
+    ids = []
+    for _ in range(count):
+        cur.execute(
+            "INSERT INTO users (username, password) VALUES (%s, '-') RETURNING id",
+            (f"history-{uuid.uuid4().hex[:8]}",)
+        )
+        ids.append(cur.fetchone()["id"])
+    return ids
+
+def add_history(cur, user_ids, rows, days=365):
+    """
+    `rows` chats for `user_ids`, spread evenly over the past `days` days.
+    """
+    start = date.today() - timedelta(days=days)
+    ensure_chat_partitions(cur, [start + timedelta(days=d) for d in range(0, days + 1, 28)])
+    cur.execute(
+        """INSERT INTO chats (user_id, role, content, created)
+           SELECT (%(users)s::int[])[1 + g %% cardinality(%(users)s::int[])],
+                  CASE WHEN g %% 2 = 0 THEN 'user' ELSE 'assistant' END,
+                  'Earlier message ' || g || ': work was busy, went for a run after.',
+                  CURRENT_DATE - 1 - (g %% %(days)s) + (g %% 86400) * INTERVAL '1 second'
+           FROM generate_series(1, %(rows)s) g""",
+        {"users": user_ids, "rows": rows, "days": days}
+    )
+
+def add_today(cur, user_id, count=20):
+    cur.execute(
+        """INSERT INTO chats (user_id, role, content)
+           SELECT %s, 'user', 'Today ' || g FROM generate_series(1, %s) g""",
+        (user_id, count)
+    )
+
+# ─── Measurement ─────────────────────────────────────────
+def time_read(cur, user_id, runs):
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        cur.execute(TODAY_QUERY, (user_id,))
+        cur.fetchall()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples), sorted(samples)[min(runs - 1, int(0.99 * runs))]
+
+def plan_shape(cur, user_id):
+    """
+    (partitions scanned, shared buffers read) for one execution.
+    """
+    cur.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + TODAY_QUERY, (user_id,))
+    plan = cur.fetchone()["QUERY PLAN"]
+    plan = plan[0]["Plan"] if isinstance(plan, list) else json.loads(plan)[0]["Plan"]
+    scans = []
+
+    def walk(node):
+        if "Relation Name" in node:
+            scans.append(node["Relation Name"])
+        for child in node.get("Plans", []):
+            walk(child)
+    walk(plan)
+    return len(scans), plan.get("Shared Hit Blocks", 0) + plan.get("Shared Read Blocks", 0)
+
+def history_size(cur):
+    cur.execute("SELECT COUNT(*) AS n FROM chats")
+    return cur.fetchone()["n"]
+
+def history_bytes(cur):
+    cur.execute(
+        """SELECT COALESCE(SUM(pg_total_relation_size(inhrelid)), 0)
+                  + pg_total_relation_size('chat_archives') AS size
+           FROM pg_inherits WHERE inhparent = 'chats'::regclass"""
+    )
+    return int(cur.fetchone()["size"])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--steps", type=int, default=4)
+    parser.add_argument("--rows", type=int, default=250000, help="chats added per step")
+    parser.add_argument("--users", type=int, default=50, help="bench users sharing the history")
+    parser.add_argument("--runs", type=int, default=200, help="timed reads per step")
+    parser.add_argument("--archive", action="store_true",
+                        help="archive old months afterwards and report the result")
+    parser.add_argument("--keep", action="store_true", help="don't delete the bench users")
+    args = parser.parse_args()
+
+    init_db()
+    conn = get_connection()
+    cur  = conn.cursor()
+    user_ids = create_users(cur, args.users)
+    add_today(cur, user_ids[0])
+    conn.commit()
+
+    print(f"{'chats':>10} {'p50 ms':>8} {'p99 ms':>8} {'partitions':>11} {'buffers':>8}")
+    try:
+        for step in range(args.steps + 1):
+            if step:
+                add_history(cur, user_ids, args.rows)
+                conn.commit()
+                cur.execute("ANALYZE chats")
+            p50, p99         = time_read(cur, user_ids[0], args.runs)
+            scanned, buffers = plan_shape(cur, user_ids[0])
+            conn.rollback()
+            print(f"{history_size(cur):>10} {p50:>8.3f} {p99:>8.3f} {scanned:>11} {buffers:>8}")
+            conn.rollback()
+
+        if args.archive:
+            before = history_bytes(cur)
+            start  = time.perf_counter()
+            _, archived = maintain(conn)
+            elapsed = time.perf_counter() - start
+            after  = history_bytes(cur)
+            conn.rollback()
+            days   = sum(archived.values())
+            print(f"\narchived {len(archived)} months, {days} user-days in {elapsed:.1f}s")
+            print(f"chats + archives: {before / 1e6:.1f} MB -> {after / 1e6:.1f} MB "
+                  f"({before / max(after, 1):.1f}x smaller)")
+            p50, p99 = time_read(cur, user_ids[0], args.runs)
+            print(f"today read after archival: p50 {p50:.3f} ms, p99 {p99:.3f} ms")
+    finally:
+        if not args.keep:
+            for table in ("chats", "chat_archives"):
+                cur.execute(f"DELETE FROM {table} WHERE user_id = ANY(%s)", (user_ids,))
+            cur.execute("DELETE FROM users WHERE id = ANY(%s)", (user_ids,))
+            conn.commit()
+        cur.close()
+        conn.close()
+
+if __name__ == "__main__":
+    main()
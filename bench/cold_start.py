@@ -0,0 +1,91 @@
+"""
+Measures worker cold start: what a fresh gunicorn worker pays before
+and during its first requests.
+
+    python bench/cold_start.py --runs 10
+    python bench/cold_start.py --runs 10 --ref HEAD~1     # compare with a commit
+
+Each run is a new interpreter that imports the app and calls its
+factory (boot), renders the login page (first page), then makes its
+first DB-backed request (first DB request: the pool connects here).
+--db-down points DATABASE_URL at an unroutable host to check that
+boot itself doesn't need the database.
+"""
+import os
+import sys
+import json
+import tarfile
+import argparse
+import tempfile
+import subprocess
+import statistics
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = """
+import json, time
+t0 = time.perf_counter()
+import app
+application = app.create_app() if hasattr(app, "create_app") else app.app
+t1 = time.perf_counter()
+client = application.test_client()
+client.get("/login")
+t2 = time.perf_counter()
+try:
+    response = client.post("/login", data={"username": "cold-start-probe", "password": "x"})
+    db = time.perf_counter() - t2 if response.status_code < 500 else None
+except Exception:
+    db = None
+print(json.dumps({"boot": t1 - t0, "first_page": t2 - t1, "first_db": db}))
+"""
+
+def run_once(cwd, env):
+    result = subprocess.run([sys.executable, "-c", CHILD], cwd=cwd, env=env,
+                            capture_output=True, text=True, timeout=120)
+    if result.returncode != 0:
+        sys.exit(f"boot failed in {cwd}:\n{result.stderr[-2000:]}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def checkout(ref):
+    """
+    Extracts `ref` into a temp directory and returns its path.
+    """
+    target  = tempfile.mkdtemp(prefix="cold-start-")
+    archive = subprocess.run(["git", "archive", ref], cwd=ROOT,
+                             capture_output=True, check=True).stdout
+    with tempfile.TemporaryFile() as f:
+        f.write(archive)
+        f.seek(0)
+        tarfile.open(fileobj=f).extractall(target)
+    return target
+
+def measure(label, cwd, env, runs):
+    samples = [run_once(cwd, env) for _ in range(runs)]
+    print(f"\n{label}")
+    for key in ("boot", "first_page", "first_db"):
+        values = [s[key] * 1000 for s in samples if s[key] is not None]
+        if not values:
+            print(f"  {key:<11} failed")
+            continue
+        p90 = sorted(values)[min(len(values) - 1, int(0.9 * len(values)))]
+        print(f"  {key:<11} median {statistics.median(values):7.1f} ms   p90 {p90:7.1f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--ref", help="also measure this git ref, e.g. HEAD~1")
+    parser.add_argument("--db-down", action="store_true",
+                        help="boot against an unreachable database")
+    args = parser.parse_args()
+
+    env = dict(os.environ, SECRET_KEY=os.environ.get("SECRET_KEY", "cold-start"))
+    if args.db_down:
+        env["DATABASE_URL"] = "postgresql://nobody@10.255.255.1:5432/none?connect_timeout=2"
+
+    measure("working tree", ROOT, env, args.runs)
+    if args.ref:
+        measure(args.ref, checkout(args.ref), env, args.runs)
+
+if __name__ == "__main__":
+    main()
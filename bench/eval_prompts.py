@@ -0,0 +1,385 @@
+"""
+Offline evaluation of ai.py's structured prompts and their parsers.
+
+    python bench/eval_prompts.py --out base.json
+    python bench/eval_prompts.py --out new.json --csv new.csv --compare base.json
+    python bench/eval_prompts.py --conversations export.ndjson --quirk-rate 0.3
+
+Replays recorded conversations through the prompts a chat turn runs
+(create_or_update_journal, update_journal, summarize_conversation and
+extract_persona) against bench/fake_groq.py, served in-process, and
+reports per function: prompt and completion tokens, wall time and how
+often the reply parsed into usable fields. No database is needed.
+
+Conversations come from --conversations: a user export from
+`flask export-notes USER --format ndjson` (one conversation per day,
+with that day's journal as the existing entry), or a JSON list of
+{"messages": [...], "persona": {...}, "journal": "...", "title": "..."}.
+Without it a few built-in days are used. Each function gets what the
+chat engine sends it: the journal and persona prompts the last
+CHAT_CONTEXT_WINDOW messages (--full sends whole days), update_journal
+the day's last exchange and existing entry, and summarize_conversation
+the messages that fell out of the window (the whole day if it fits).
+
+Token counts are the fake's (about 4 characters a token), which is
+enough to compare two versions of a prompt. --quirk-rate makes the fake
+answer in off-format shapes some of the time; with --seed fixed, runs
+over the same conversations get the same replies. --compare prints the
+change against an earlier --out report and exits 1 if parsing got less
+reliable or tokens / wall time grew by more than --tolerance.
+"""
+import os
+import re
+import sys
+import csv
+import json
+import time
+import random
+import hashlib
+import argparse
+import statistics
+import subprocess
+from datetime import datetime, timezone
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import metrics
+import fake_groq
+
+FUNCTIONS = ["create_or_update_journal", "update_journal", "summarize_conversation",
+             "extract_persona"]
+
+DEFAULT_PERSONA = {
+    "goals":     "Run a half marathon this spring and ship my side project.",
+    "habits":    "Morning runs, long workdays, journaling before bed.",
+    "summary":   "A developer balancing a demanding job with training.",
+    "onboarded": True,
+}
+
+# Stands in for the entry update_journal continues when a day has none
+DEFAULT_TITLE = "A Steady Day"
+DEFAULT_ENTRY = ("I went for a run before work and felt good about it. "
+                 "The day itself was busy, but I kept my head.")
+
+SAMPLE_DAYS = [
+    [("assistant", "Hey! How did the long run go this morning?"),
+     ("user", "Really well, 14k without stopping. My knee held up."),
+     ("assistant", "That's a big step. How did the rest of the day feel?"),
+     ("user", "Work was hectic, three meetings back to back, but I stayed calm.")],
+    [("assistant", "Good to see you! Any progress on the side project?"),
+     ("user", "Not much. I was too tired after work to open the laptop."),
+     ("assistant", "That's fair. What drained you most today?"),
+     ("user", "A release went wrong and I spent the afternoon rolling it back."),
+     ("assistant", "That sounds stressful. How are you feeling about it now?"),
+     ("user", "Better. We found the bug and my manager was supportive."),
+     ("assistant", "Glad it ended well. Anything you want to do differently tomorrow?"),
+     ("user", "Block an hour in the morning for the project before email.")],
+    [("assistant", "Hey, how's the week treating you?"),
+     ("user", "Skipped my run, slept badly, and I'm annoyed with myself.")],
+    [("assistant", "Hi! What's on your mind tonight?")] + [
+        (role, text) for i in range(9) for role, text in (
+            ("user", f"Another thing from today ({i + 1}): dinner with my sister, "
+                     "we talked about moving closer to our parents."),
+            ("assistant", "How do you feel about that idea?"),
+        )
+    ],
+]
+
+# ─── Conversations ───────────────────────────────────────
+def sample_conversations():
+    return [
+        {"id": f"sample-{i + 1}",
+         "messages": [{"role": role, "content": text} for role, text in day]}
+        for i, day in enumerate(SAMPLE_DAYS)
+    ]
+
+def export_conversations(path):
+    """
+    One conversation per day of chat in an NDJSON export, with that
+    day's journal entry (if any) as the existing content.
+    """
+    days, notes, journals = defaultdict(list), {}, {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            kind   = record.pop("type")
+            if kind == "chat":
+                days[record["created"][:10]].append(
+                    {"role": record["role"], "content": record["content"]}
+                )
+            elif kind == "note":
+                notes[record["id"]] = record
+            elif kind == "journal":
+                journals[record["date"]] = record["note_id"]
+    conversations = []
+    for day, messages in sorted(days.items()):
+        note = notes.get(journals.get(day)) or {}
+        conversations.append({"id": day, "messages": messages,
+                              "journal": note.get("content"), "title": note.get("title")})
+    return conversations
+
+def load_conversations(path, limit):
+    if not path:
+        conversations = sample_conversations()
+    elif path.endswith(".ndjson"):
+        conversations = export_conversations(path)
+    else:
+        with open(path, encoding="utf-8") as f:
+            conversations = [dict(c, id=c.get("id", f"case-{i + 1}"))
+                             for i, c in enumerate(json.load(f))]
+    return conversations[-limit:] if limit else conversations
+
+def digest(conversations):
+    data = json.dumps(conversations, sort_keys=True, ensure_ascii=False).encode()
+    return hashlib.blake2b(data, digest_size=8).hexdigest()
+
+# ─── Parse Checks ────────────────────────────────────────
+# Each returns None when the parsed result is usable, else why not.
+TITLE_MAX         = 100
+SUMMARY_MAX_WORDS = 150     # what the prompt asks for
+
+def check_journal(result):
+    title, content = result
+    if not title:
+        return "empty title"
+    if not content:
+        return "empty content"
+    if re.match(r"(?i)title\b|[*#_]|\d+\.", title):
+        return "label left in title"
+    if title.endswith(":"):
+        return "preamble as title"
+    if len(title) > TITLE_MAX:
+        return "title too long"
+    return None
+
+def check_addition(result):
+    if not result:
+        return "empty addition"
+    first = result.split("\n", 1)[0]
+    if re.search(r"(?i)\btitle\b\W*:", first):
+        return "title left in addition"
+    if first.rstrip().endswith(":"):
+        return "preamble left in addition"
+    return None
+
+def check_summary(result):
+    if not result:
+        return "empty summary"
+    if len(result.split()) > SUMMARY_MAX_WORDS:
+        return "summary too long"
+    return None
+
+def check_persona(result):
+    missing = [field for field in ("goals", "habits", "summary") if not result[field]]
+    return "missing " + ", ".join(missing) if missing else None
+
+# ─── Runner ──────────────────────────────────────────────
+def calls_for(ai, conversation, full):
+    """
+    (function name, thunk, check) for each evaluated function.
+    """
+    persona  = dict(DEFAULT_PERSONA, **(conversation.get("persona") or {}))
+    day      = conversation["messages"]
+    messages = day if full else ai.ConversationContext(list(day)).window()
+    title    = conversation.get("title") or DEFAULT_TITLE
+    entry    = conversation.get("journal") or DEFAULT_ENTRY
+    older    = day[:-ai.CONTEXT_WINDOW] or day
+    return [
+        ("create_or_update_journal",
+         lambda: ai.create_or_update_journal(messages, persona), check_journal),
+        ("update_journal",
+         lambda: ai.update_journal(day[-2:], persona, title, entry), check_addition),
+        ("summarize_conversation",
+         lambda: ai.summarize_conversation("", older), check_summary),
+        ("extract_persona",
+         lambda: ai.extract_persona(messages), check_persona),
+    ]
+
+def usage():
+    return (metrics.total("llm_tokens_total", kind="prompt"),
+            metrics.total("llm_tokens_total", kind="completion"),
+            metrics.total("llm_calls_total"))
+
+def run_case(conversation, name, call, check):
+    before = usage()
+    start  = time.perf_counter()
+    try:
+        reason = check(call())
+    except Exception as e:
+        reason = f"error: {type(e).__name__}"
+    wall  = time.perf_counter() - start
+    after = usage()
+    return {
+        "case":              conversation["id"],
+        "function":          name,
+        "messages":          len(conversation["messages"]),
+        "prompt_tokens":     after[0] - before[0],
+        "completion_tokens": after[1] - before[1],
+        "llm_calls":         after[2] - before[2],
+        "wall_ms":           round(wall * 1000, 2),
+        "parsed":            reason is None,
+        "reason":            reason or "",
+    }
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def summarize(rows):
+    functions = {}
+    for name in FUNCTIONS:
+        group = [row for row in rows if row["function"] == name]
+        if not group:
+            continue
+        walls = [row["wall_ms"] for row in group]
+        functions[name] = {
+            "cases":                  len(group),
+            "parse_rate":             round(sum(row["parsed"] for row in group) / len(group), 4),
+            "prompt_tokens_mean":     round(statistics.mean(r["prompt_tokens"] for r in group), 1),
+            "completion_tokens_mean": round(statistics.mean(r["completion_tokens"] for r in group), 1),
+            "wall_ms_p50":            round(statistics.median(walls), 2),
+            "wall_ms_p95":            round(percentile(walls, 0.95), 2),
+            "failures":               dict(sorted(
+                (reason, sum(1 for r in group if r["reason"] == reason))
+                for reason in {r["reason"] for r in group if r["reason"]}
+            )),
+        }
+    return functions
+
+def git_commit():
+    try:
+        result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                capture_output=True, text=True, timeout=10)
+    except OSError:
+        return None
+    return result.stdout.strip() or None
+
+# ─── Reports ─────────────────────────────────────────────
+def print_summary(functions):
+    print(f"{'function':<26} {'cases':>6} {'parsed':>7} {'prompt':>8} {'compl':>7} "
+          f"{'p50 ms':>8} {'p95 ms':>8}")
+    for name, s in functions.items():
+        print(f"{name:<26} {s['cases']:>6} {s['parse_rate']:>7.1%} "
+              f"{s['prompt_tokens_mean']:>8.1f} {s['completion_tokens_mean']:>7.1f} "
+              f"{s['wall_ms_p50']:>8.1f} {s['wall_ms_p95']:>8.1f}")
+        for reason, count in s["failures"].items():
+            print(f"    {count:>4} x {reason}")
+
+def write_csv(path, rows):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+
+# metric -> worse when it goes "up" or "down"
+COMPARED = [
+    ("parse_rate",             "down"),
+    ("prompt_tokens_mean",     "up"),
+    ("completion_tokens_mean", "up"),
+    ("wall_ms_p50",            "up"),
+]
+
+def compare(base, report, tolerance):
+    """
+    Prints each function's change against `base`; returns True if any
+    metric got worse by more than `tolerance` (a fraction).
+    """
+    if base["run"].get("conversations") != report["run"]["conversations"]:
+        print("\nwarning: the baseline was run over different conversations")
+    if base["run"].get("settings") != report["run"]["settings"]:
+        print("warning: the baseline was run with different settings")
+    print(f"\n{'vs ' + (base['run'].get('commit') or 'baseline'):<26} {'metric':<24} "
+          f"{'before':>9} {'after':>9} {'change':>8}")
+    worse = False
+    for name, after in report["functions"].items():
+        before = base["functions"].get(name)
+        if not before:
+            continue
+        for metric, bad in COMPARED:
+            old, new = before[metric], after[metric]
+            change   = (new - old) / old if old else 0.0
+            if metric == "parse_rate":
+                regressed = new < old - tolerance * old
+            else:
+                regressed = change > tolerance
+            worse = worse or regressed
+            flag  = "  WORSE" if regressed else ""
+            print(f"{name:<26} {metric:<24} {old:>9.4g} {new:>9.4g} {change:>+8.1%}{flag}")
+    return worse
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--conversations", help="NDJSON export or JSON list (default: built-in)")
+    parser.add_argument("--limit", type=int, default=200, help="most recent conversations to use")
+    parser.add_argument("--full", action="store_true", help="send whole days, not the window")
+    parser.add_argument("--runs", type=int, default=1, help="times to replay each conversation")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--quirk-rate", type=float, default=0.0,
+                        help="fraction of off-format replies from the fake")
+    parser.add_argument("--latency", type=float, default=0.05, help="fake time to first token")
+    parser.add_argument("--tokens-per-sec", type=float, default=300.0)
+    parser.add_argument("--out", help="write the JSON report here")
+    parser.add_argument("--csv", help="write per-case rows here")
+    parser.add_argument("--compare", help="earlier JSON report to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.05,
+                        help="allowed relative change before --compare fails")
+    args = parser.parse_args()
+
+    conversations = load_conversations(args.conversations, args.limit)
+    if not conversations:
+        sys.exit("no conversations to replay")
+
+    # Calls run one at a time from this process, so seeding here fixes
+    # the fake's replies and quirks too
+    random.seed(args.seed)
+    os.environ["GROQ_BASE_URL"] = fake_groq.start_in_thread(
+        latency=args.latency, tokens_per_sec=args.tokens_per_sec, jitter=0.0,
+        quirk_rate=args.quirk_rate
+    )
+    os.environ.setdefault("GROK_API_KEY", "eval")
+    os.environ.setdefault("LLM_REQUESTS_PER_MIN", "100000")
+    import ai
+    ai.get_client()     # the SDK import shouldn't land in the first case's time
+
+    rows = []
+    for _ in range(args.runs):
+        for conversation in conversations:
+            for name, call, check in calls_for(ai, conversation, args.full):
+                rows.append(run_case(conversation, name, call, check))
+
+    settings = {key: getattr(args, key) for key in
+                ("full", "runs", "seed", "quirk_rate", "latency", "tokens_per_sec")}
+    settings["context_window"] = ai.CONTEXT_WINDOW
+    report = {
+        "run": {
+            "started":       datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "commit":        git_commit(),
+            "model":         ai.MODEL,
+            "conversations": digest(conversations),
+            "settings":      settings,
+        },
+        "functions": summarize(rows),
+        "cases":     rows,
+    }
+
+    print(f"{len(conversations)} conversations x {args.runs} run(s)\n")
+    print_summary(report["functions"])
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.csv:
+        write_csv(args.csv, rows)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            base = json.load(f)
+        sys.exit(1 if compare(base, report, args.tolerance) else 0)
+
+if __name__ == "__main__":
+    main()
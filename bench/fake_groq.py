@@ -0,0 +1,204 @@
+"""
+Local stand-in for the Groq chat completions API.
+
+    python bench/fake_groq.py --port 8765 --latency 0.3 --tokens-per-sec 300
+    GROQ_BASE_URL=http://127.0.0.1:8765 gunicorn app:app
+
+The Groq SDK reads GROQ_BASE_URL, so ai.py needs no changes. Replies are
+canned but shaped like the real ones (GOALS:/HABITS:/SUMMARY: for
+persona extraction, TITLE: for journals), with a configurable time to
+first token and generation rate. Streaming (stream=True) is supported.
+--quirk-rate makes that fraction of the structured replies come back in
+the shapes real models drift into (a preamble, bold or numbered labels,
+a title on a journal continuation), for measuring how ai.py's parsers
+cope.
+"""
+import re
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CHAT_REPLIES = [
+    "That sounds like a lot to carry. What part of today felt heaviest?",
+    "Nice, it seems like the morning run is really sticking. How did it feel?",
+    "Got it. What would make tomorrow a little easier than today?",
+    "Thanks for sharing that. Is there anything else on your mind tonight?",
+]
+
+# ─── Canned Replies ──────────────────────────────────────
+def reply_for(messages):
+    # The task-specific instructions in ai.py live in the last message
+    prompt = messages[-1]["content"] if messages else ""
+    if "GOALS:" in prompt:
+        return "GOALS: run a half marathon, ship the side project\n" \
+               "HABITS: morning runs, journaling at night\n" \
+               "SUMMARY: A developer balancing work stress with training."
+    if "TITLE:" in prompt:
+        return "TITLE: A Steady Day\n" + " ".join(["Today moved at an even pace."] * 12)
+    if "Continue today's journal entry" in prompt:
+        return "Later on I talked through the week ahead and felt calmer about it."
+    if "Rewrite the summary" in prompt:
+        return "They talked about work pressure and their running plan."
+
+    # Chat: finish onboarding after the fourth answer, like the real prompt asks
+    system  = messages[0]["content"] if messages[0]["role"] == "system" else ""
+    answers = sum(1 for m in messages if m["role"] == "user")
+    reply   = random.choice(CHAT_REPLIES)
+    if "[ONBOARDING_COMPLETE]" in system and answers >= 4:
+        return "Thanks, I feel like I know you a bit now. [ONBOARDING_COMPLETE]"
+    if "[JOURNAL_READY]" in system and answers >= 4 and random.random() < 0.2:
+        return reply + " [JOURNAL_READY]"
+    return reply
+
+# ─── Quirks ──────────────────────────────────────────────
+LABELS = re.compile(r"^(TITLE|GOALS|HABITS|SUMMARY):", re.M)
+
+def with_preamble(text):
+    return "Sure! Here it is:\n\n" + text
+
+def bold_labels(text):
+    return LABELS.sub(r"**\1:**", text)
+
+def numbered_labels(text):
+    return "\n".join(f"{i}. {line}" for i, line in enumerate(text.split("\n"), 1))
+
+def title_case_labels(text):
+    return LABELS.sub(lambda m: m.group(1).title() + ":", text)
+
+QUIRKS = [with_preamble, bold_labels, numbered_labels, title_case_labels]
+
+def quirky(text, messages=()):
+    # Journal continuations sometimes open with a title line anyway, plain
+    # or in any of the shapes above; otherwise only labelled replies drift
+    if messages and "Continue today's journal entry" in messages[-1]["content"]:
+        return random.choice([lambda t: t] + QUIRKS)("TITLE: More of the Day\n" + text)
+    return random.choice(QUIRKS)(text) if LABELS.search(text) else text
+
+def count_tokens(text):
+    # Close enough to a real tokenizer for pacing and usage numbers
+    return max(1, len(text) // 4)
+
+# ─── Server ──────────────────────────────────────────────
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config           = None     # set by make_server
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        if not self.path.endswith("/chat/completions"):
+            return self.send_json({"error": {"message": "not found"}}, 404)
+        body    = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        config  = self.config
+        if random.random() < config.error_rate:
+            return self.send_json({"error": {"message": "overloaded"}}, 503)
+
+        text   = reply_for(body.get("messages", []))
+        if config.quirk_rate and random.random() < config.quirk_rate:
+            text = quirky(text, body.get("messages", []))
+        limit  = body.get("max_tokens") or 1024
+        words  = text.split(" ")
+        usage  = {
+            "prompt_tokens":     sum(count_tokens(m["content"]) for m in body["messages"]),
+            "completion_tokens": min(count_tokens(text), limit),
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        time.sleep(max(0.0, random.gauss(config.latency, config.latency * config.jitter)))
+
+        if body.get("stream"):
+            return self.stream(body, words, usage)
+        time.sleep(usage["completion_tokens"] / config.tokens_per_sec)
+        self.send_json(completion(body, text, usage))
+
+    def stream(self, body, words, usage):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        delay = 1 / self.config.tokens_per_sec
+        for i, word in enumerate(words):
+            piece = word if i == 0 else " " + word
+            self.event(chunk(body, {"content": piece}))
+            time.sleep(delay * count_tokens(piece))
+        final = chunk(body, {}, finish="stop")
+        final["x_groq"] = {"id": "req_fake", "usage": usage}
+        self.event(final)
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+        self.close_connection = True
+
+    def event(self, data):
+        self.wfile.write(f"data: {json.dumps(data)}\n\n".encode())
+        self.wfile.flush()
+
+    def send_json(self, data, status=200):
+        payload = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+def completion(body, text, usage):
+    return {
+        "id":      "chatcmpl-fake",
+        "object":  "chat.completion",
+        "created": int(time.time()),
+        "model":   body.get("model", "fake"),
+        "choices": [{"index": 0, "finish_reason": "stop",
+                     "message": {"role": "assistant", "content": text}}],
+        "usage":   usage,
+    }
+
+def chunk(body, delta, finish=None):
+    return {
+        "id":      "chatcmpl-fake",
+        "object":  "chat.completion.chunk",
+        "created": int(time.time()),
+        "model":   body.get("model", "fake"),
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish}],
+    }
+
+def make_server(port=0, latency=0.3, tokens_per_sec=300.0, jitter=0.2, error_rate=0.0,
+                quirk_rate=0.0):
+    """
+    Returns a ThreadingHTTPServer; serve it with serve_forever().
+    """
+    config  = argparse.Namespace(latency=latency, tokens_per_sec=tokens_per_sec,
+                                 jitter=jitter, error_rate=error_rate, quirk_rate=quirk_rate)
+    handler = type("ConfiguredHandler", (Handler,), {"config": config})
+    server  = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    return server
+
+def start_in_thread(**kwargs):
+    """
+    Starts a server on a free port; returns its base URL.
+    """
+    server = make_server(**kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.3, help="seconds to first token")
+    parser.add_argument("--tokens-per-sec", type=float, default=300.0)
+    parser.add_argument("--jitter", type=float, default=0.2, help="latency stddev / latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of 503s")
+    parser.add_argument("--quirk-rate", type=float, default=0.0,
+                        help="fraction of structured replies in an off-format shape")
+    args = parser.parse_args()
+
+    server = make_server(args.port, args.latency, args.tokens_per_sec,
+                         args.jitter, args.error_rate, args.quirk_rate)
+    print(f"fake Groq on http://127.0.0.1:{args.port}")
+    server.serve_forever()
+
+if __name__ == "__main__":
+    main()
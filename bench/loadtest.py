@@ -0,0 +1,260 @@
+"""
+Load test for the web app: signup/login, notes CRUD, search and chat.
+
+    python bench/loadtest.py --users 20 --duration 60
+    python bench/loadtest.py --url http://127.0.0.1:8000 --users 50
+
+Without --url the app is served in-process (werkzeug, threaded) against
+DATABASE_URL, with ai.py pointed at bench/fake_groq.py. With --url it
+drives an already running server; start that one with GROQ_BASE_URL
+set to a fake_groq.py instance and a high LLM_REQUESTS_PER_MIN.
+
+Reports client-side throughput and p50/p99 latency per route, plus the
+server's own latency and DB queries per request from /metrics. Every
+run creates fresh `load-<run>-<n>` users; their data is left in place.
+"""
+import os
+import re
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import threading
+import http.client
+from urllib.parse import urlencode, urlsplit
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fake_groq
+
+WORDS = [
+    "work", "stress", "family", "gym", "running", "coffee", "project",
+    "deadline", "sleep", "weekend", "reading", "friends", "grateful",
+    "meeting", "travel", "cooking", "walk", "music", "focus",
+]
+CHAT_LINES = [
+    "Work was busy again, lots of meetings.",
+    "I went for a run this morning and it felt great.",
+    "I want to finish my side project this month.",
+    "Sleep has been rough lately.",
+    "Spent the evening cooking with friends.",
+]
+
+# ─── HTTP Client ─────────────────────────────────────────
+class Client:
+    """
+    One virtual user: keeps the session cookie, never follows redirects
+    and records every request's latency under a route label.
+    """
+    def __init__(self, base_url, results):
+        parts        = urlsplit(base_url)
+        self.host    = parts.hostname
+        self.port    = parts.port or 80
+        self.cookie  = None
+        self.results = results
+
+    def request(self, label, method, path, form=None, data=None):
+        headers = {}
+        body    = None
+        if form is not None:
+            body = urlencode(form)
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+        elif data is not None:
+            body = json.dumps(data)
+            headers["Content-Type"] = "application/json"
+        if self.cookie:
+            headers["Cookie"] = self.cookie
+
+        conn  = http.client.HTTPConnection(self.host, self.port, timeout=120)
+        start = time.perf_counter()
+        try:
+            conn.request(method, path, body=body, headers=headers)
+            response = conn.getresponse()
+            payload  = response.read()
+        except (OSError, http.client.HTTPException):
+            self.results.record(label, time.perf_counter() - start, ok=False)
+            return None, b""
+        finally:
+            conn.close()
+        elapsed = time.perf_counter() - start
+
+        cookie = response.getheader("Set-Cookie")
+        if cookie:
+            self.cookie = cookie.split(";", 1)[0]
+        self.results.record(label, elapsed, ok=response.status < 400)
+        return response.status, payload
+
+# ─── Results ─────────────────────────────────────────────
+class Results:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors    = defaultdict(int)
+        self._lock     = threading.Lock()
+
+    def record(self, label, elapsed, ok=True):
+        with self._lock:
+            self.latencies[label].append(elapsed)
+            if not ok:
+                self.errors[label] += 1
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+# ─── Scenario ────────────────────────────────────────────
+def sentence(n=40):
+    return " ".join(random.choice(WORDS) for _ in range(n))
+
+def run_user(base_url, name, args, results, deadline):
+    c = Client(base_url, results)
+    c.request("POST /signup", "POST", "/signup", form={"username": name, "password": "pw"})
+    c.request("POST /login",  "POST", "/login",  form={"username": name, "password": "pw"})
+
+    while time.monotonic() < deadline:
+        c.request("GET /", "GET", "/")
+        c.request("POST /new", "POST", "/new",
+                  form={"title": sentence(4), "content": sentence(150)})
+        _, page = c.request("GET /", "GET", "/")
+        ids     = re.findall(rb'/note/(\d+)', page)
+        if ids:
+            note_id = int(ids[0])
+            c.request("GET /note/<id>", "GET", f"/note/{note_id}")
+            c.request("POST /edit/<id>", "POST", f"/edit/{note_id}",
+                      form={"title": sentence(4), "content": sentence(150)})
+            if len(ids) > args.keep_notes:
+                c.request("GET /delete/<id>", "GET", f"/delete/{int(ids[-1])}")
+        c.request("GET /?q=", "GET", "/?" + urlencode({"q": random.choice(WORDS)}))
+
+        c.request("GET /chat", "GET", "/chat")
+        for _ in range(args.chat_turns):
+            if time.monotonic() >= deadline:
+                break
+            route = "/chat/stream" if args.stream else "/chat/send"
+            c.request(f"POST {route}", "POST", route,
+                      data={"message": random.choice(CHAT_LINES)})
+        time.sleep(args.think)
+
+# ─── Server Side Metrics ─────────────────────────────────
+METRIC_LINE = re.compile(r'^(\w+)\{(.*)\} ([\d.e+-]+)$')
+
+def scrape(base_url):
+    """
+    Returns {(metric, route): value} for the request-level series.
+    """
+    parts = urlsplit(base_url)
+    conn  = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+    token = os.environ.get("METRICS_TOKEN")
+    conn.request("GET", "/metrics",
+                 headers={"Authorization": f"Bearer {token}"} if token else {})
+    text  = conn.getresponse().read().decode()
+    conn.close()
+
+    values = defaultdict(float)
+    for line in text.splitlines():
+        match = METRIC_LINE.match(line)
+        if not match:
+            continue
+        name, labels, value = match.groups()
+        route = re.search(r'route="([^"]*)"', labels)
+        if route and name.endswith(("_sum", "_count")):
+            values[(name, route.group(1))] += float(value)
+        elif name == "llm_tokens_total":
+            values[(name, re.search(r'kind="(\w+)"', labels).group(1))] += float(value)
+    return values
+
+# ─── Runner ──────────────────────────────────────────────
+def start_local_server(args):
+    """
+    Serves app.py in-process against a fake Groq; returns its base URL.
+    """
+    os.environ["GROQ_BASE_URL"] = fake_groq.start_in_thread(
+        latency=args.llm_latency, tokens_per_sec=args.llm_tokens_per_sec
+    )
+    os.environ.setdefault("LLM_REQUESTS_PER_MIN", "100000")
+    os.environ.setdefault("LLM_CONCURRENCY", str(max(8, args.users)))
+    os.environ.setdefault("SECRET_KEY", "loadtest")
+
+    from werkzeug.serving import make_server
+    from app import create_app
+    app = create_app()
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}"
+
+def report(results, before, after, elapsed):
+    total = sum(len(v) for v in results.latencies.values())
+    print(f"\n{total} requests in {elapsed:.1f}s = {total / elapsed:.1f} req/s\n")
+    print(f"{'route':<18} {'count':>6} {'err':>4} {'req/s':>7} {'p50 ms':>8} {'p99 ms':>8}")
+    summary = {}
+    for label in sorted(results.latencies):
+        values = results.latencies[label]
+        p50, p99 = percentile(values, 0.50) * 1000, percentile(values, 0.99) * 1000
+        print(f"{label:<18} {len(values):>6} {results.errors[label]:>4} "
+              f"{len(values) / elapsed:>7.1f} {p50:>8.1f} {p99:>8.1f}")
+        summary[label] = {"count": len(values), "errors": results.errors[label],
+                          "p50_ms": round(p50, 2), "p99_ms": round(p99, 2)}
+
+    diff   = {k: after[k] - before.get(k, 0) for k in after}
+    routes = sorted({route for (name, route) in diff if name == "http_request_seconds_count"})
+    print(f"\n{'server route':<24} {'count':>6} {'mean ms':>8} {'db q/req':>9}")
+    for route in routes:
+        count   = diff[("http_request_seconds_count", route)]
+        if not count or route == "/metrics":
+            continue
+        mean    = diff[("http_request_seconds_sum", route)] / count * 1000
+        queries = diff.get(("db_queries_per_request_sum", route), 0) / count
+        print(f"{route:<24} {count:>6.0f} {mean:>8.1f} {queries:>9.1f}")
+        summary.setdefault("server", {})[route] = {
+            "count": count, "mean_ms": round(mean, 2), "db_queries": round(queries, 2)
+        }
+    prompt, completion = diff.get(("llm_tokens_total", "prompt"), 0), \
+                         diff.get(("llm_tokens_total", "completion"), 0)
+    print(f"\nLLM tokens: {prompt:.0f} prompt, {completion:.0f} completion")
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="drive a running server instead of an in-process one")
+    parser.add_argument("--users", type=int, default=10, help="concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds")
+    parser.add_argument("--chat-turns", type=int, default=4, help="chat messages per loop")
+    parser.add_argument("--stream", action="store_true", help="chat via /chat/stream")
+    parser.add_argument("--keep-notes", type=int, default=20, help="delete beyond this many")
+    parser.add_argument("--think", type=float, default=0.0, help="pause between loops (s)")
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="fake time to first token")
+    parser.add_argument("--llm-tokens-per-sec", type=float, default=300.0)
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    base_url = args.url or start_local_server(args)
+    before   = scrape(base_url)
+    run_id   = f"{int(time.time()) % 100000}"
+    deadline = time.monotonic() + args.duration
+    results  = Results()
+
+    print(f"{args.users} users for {args.duration:.0f}s against {base_url}")
+    started = time.monotonic()
+    threads = [
+        threading.Thread(target=run_user,
+                         args=(base_url, f"load-{run_id}-{i}", args, results, deadline))
+        for i in range(args.users)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.monotonic() - started
+
+    summary = report(results, before, scrape(base_url), elapsed)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "elapsed": elapsed, "routes": summary}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
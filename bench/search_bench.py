@@ -0,0 +1,100 @@
+"""
+Compares the old ILIKE homepage search with the indexed full-text search.
+
+    python bench/search_bench.py --notes 100000
+
+Creates a throwaway user with N synthetic notes in DATABASE_URL,
+times both query paths and removes the data again (unless --keep).
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import get_connection, init_db
+from search import search_notes
+
+WORDS = [
+    "work", "stress", "family", "gym", "running", "coffee", "project",
+    "deadline", "sleep", "weekend", "reading", "friends", "anxious",
+    "grateful", "meeting", "travel", "cooking", "walk", "music", "focus",
+]
+QUERIES = ["stress", "work deadline", "grat", "running gym", "w1234"]
+
+def seed(cur, user_id, count):
+    # ~150-word bodies, similar in size to an AI written journal entry.
+    # Mostly filler vocabulary, with the themed words sprinkled in.
+    cur.execute(
+        """INSERT INTO notes (user_id, title, content, created)
+           SELECT %s,
+                  'Entry ' || g,
+                  (SELECT string_agg(
+                      CASE WHEN random() < 0.03
+                           THEN (%s::text[])[1 + floor(random() * %s)::int]
+                           ELSE 'w' || floor(random() * 3000)::int
+                      END, ' ')
+                   FROM generate_series(1, 150) WHERE g > 0),
+                  NOW() - (g || ' minutes')::interval
+           FROM generate_series(1, %s) AS g""",
+        (user_id, WORDS, len(WORDS), count)
+    )
+    cur.execute("ANALYZE notes")
+
+def ilike_search(cur, user_id, query):
+    cur.execute(
+        """SELECT * FROM notes
+           WHERE user_id = %s AND (title ILIKE %s OR content ILIKE %s)
+           ORDER BY created DESC""",
+        (user_id, f"%{query}%", f"%{query}%")
+    )
+    return cur.fetchall()
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--notes",  type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--keep",   action="store_true")
+    args = parser.parse_args()
+
+    init_db()
+    conn = get_connection()
+    cur  = conn.cursor()
+    cur.execute(
+        "INSERT INTO users (username, password) VALUES (%s, '') RETURNING id",
+        (f"search-bench-{os.getpid()}",)
+    )
+    user_id = cur.fetchone()["id"]
+
+    print(f"seeding {args.notes} notes...")
+    seed(cur, user_id, args.notes)
+    conn.commit()
+
+    print(f"{'query':<20} {'ILIKE ms':>10} {'FTS ms':>10} {'ILIKE rows':>11} {'FTS rows':>9}")
+    try:
+        for query in QUERIES:
+            slow = timed(lambda: ilike_search(cur, user_id, query), args.repeat)
+            fast = timed(lambda: search_notes(cur, user_id, query), args.repeat)
+            print(f"{query:<20} {slow:>10.1f} {fast:>10.1f} "
+                  f"{len(ilike_search(cur, user_id, query)):>11} "
+                  f"{len(search_notes(cur, user_id, query)):>9}")
+    finally:
+        if not args.keep:
+            cur.execute("DELETE FROM notes WHERE user_id = %s", (user_id,))
+            cur.execute("DELETE FROM users WHERE id = %s", (user_id,))
+            conn.commit()
+        cur.close()
+        conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+Per-turn cost check for the chat engine.
+
+    python bench/turn_cost.py            # exits 1 if a turn got more expensive
+
+Runs a scripted day of chat turns through ChatTurnEngine against
+DATABASE_URL, with a recording stand-in for the Groq backend and the
+follow-up run inline instead of on the job pool. For each turn it counts
+LLM calls (by kind), DB statements and commits, and compares them with
+BUDGETS. Raise a budget only on purpose, in the commit that needs it.
+"""
+import os
+import sys
+import uuid
+import argparse
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import metrics
+from database import get_connection, init_db
+from chat_engine import ChatTurnEngine, PostgresStore
+from ai import CONTEXT_WINDOW, SUMMARY_BATCH
+
+# turn -> (LLM calls, DB statements, commits), request path + follow-up.
+# Statements include the pool's SELECT 1 health check on each checkout.
+BUDGETS = {
+    "onboarding":          (1, 4, 2),
+    "onboarding complete": (2, 6, 3),
+    "first journal turn":  (2, 6, 3),
+    "journal append":      (2, 6, 3),
+    "session wrap-up":     (3, 6, 3),
+    "compaction":          (3, 6, 3),
+}
+
+# ─── Recording LLM ───────────────────────────────────────
+class RecordingLLM:
+    """
+    Stands in for GroqBackend: canned replies, every call counted.
+    """
+    def __init__(self):
+        self.calls = Counter()
+        self.next  = "Tell me more about that."
+
+    def reply(self, messages, persona, has_history):
+        self.calls["reply"] += 1
+        return self.next
+
+    def stream(self, messages, persona, has_history):
+        self.calls["reply"] += 1
+        yield from self.next.split(" ")
+
+    def summarize(self, summary, messages, user_id):
+        self.calls["summarize"] += 1
+        return "They talked about work and running."
+
+    def extract_persona(self, messages, user_id):
+        self.calls["extract_persona"] += 1
+        return {"goals": "run more", "habits": "morning runs", "summary": "A runner."}
+
+    def write_journal(self, messages, persona):
+        self.calls["write_journal"] += 1
+        return "A Day", "Today I talked about work."
+
+    def append_journal(self, messages, persona, title, content):
+        self.calls["append_journal"] += 1
+        return "Later I felt calmer."
+
+def run_inline(user_id, kind, fn, *args):
+    fn(*args)
+    return None
+
+# ─── Scenario ────────────────────────────────────────────
+def create_user(cur):
+    cur.execute(
+        "INSERT INTO users (username, password) VALUES (%s, '-') RETURNING id",
+        (f"turncost-{uuid.uuid4().hex[:8]}",)
+    )
+    user_id = cur.fetchone()["id"]
+    cur.execute("INSERT INTO personas (user_id) VALUES (%s)", (user_id,))
+    return user_id
+
+def add_history(cur, user_id, count):
+    cur.execute(
+        """INSERT INTO chats (user_id, role, content)
+           SELECT %s, CASE WHEN g %% 2 = 0 THEN 'user' ELSE 'assistant' END,
+                  'Earlier message ' || g
+           FROM generate_series(1, %s) g""",
+        (user_id, count)
+    )
+
+def remove_user(cur, user_id):
+    for table in ("daily_journals", "note_embeddings", "notes", "chat_summaries", "chats",
+                  "chat_archives", "opening_messages", "jobs", "personas"):
+        cur.execute(f"DELETE FROM {table} WHERE user_id = %s", (user_id,))
+    cur.execute("DELETE FROM users WHERE id = %s", (user_id,))
+
+def measure(engine, llm, user_id, reply):
+    llm.calls.clear()
+    llm.next = reply
+    token    = metrics.start_trace()
+    engine.run(user_id, "Work was busy, but I went for a run.")
+    trace    = metrics.end_trace(token)
+    return (sum(llm.calls.values()),
+            sum(1 for name, _, _ in trace if name == "db"),
+            sum(1 for name, _, _ in trace if name == "db_commit"),
+            dict(llm.calls))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--keep", action="store_true", help="don't delete the test user")
+    args = parser.parse_args()
+
+    init_db()
+    llm    = RecordingLLM()
+    engine = ChatTurnEngine(store=PostgresStore(), llm=llm, submit=run_inline)
+
+    conn = get_connection()
+    cur  = conn.cursor()
+    user_id = create_user(cur)
+    conn.commit()
+
+    turns = [
+        ("onboarding",          "What are your main goals right now?", None),
+        ("onboarding complete", "Thanks for sharing! [ONBOARDING_COMPLETE]", None),
+        ("first journal turn",  "How did the run feel?", None),
+        ("journal append",      "What made work so busy?", None),
+        ("session wrap-up",     "Sleep well. [JOURNAL_READY]", None),
+        ("compaction",          "Tell me more about that.", CONTEXT_WINDOW + SUMMARY_BATCH),
+    ]
+
+    failed = False
+    print(f"{'turn':<22} {'llm':>4} {'db':>4} {'commit':>7}  calls")
+    try:
+        for name, reply, history in turns:
+            if history:
+                add_history(cur, user_id, history)
+                conn.commit()
+            llm_calls, statements, commits, calls = measure(engine, llm, user_id, reply)
+            budget = BUDGETS[name]
+            over   = [label for label, used, limit in zip(
+                ("llm", "db", "commits"), (llm_calls, statements, commits), budget
+            ) if used > limit]
+            failed = failed or bool(over)
+            flag   = f"  OVER BUDGET ({', '.join(over)}; budget {budget})" if over else ""
+            print(f"{name:<22} {llm_calls:>4} {statements:>4} {commits:>7}  {calls}{flag}")
+    finally:
+        if not args.keep:
+            remove_user(cur, user_id)
+            conn.commit()
+        cur.close()
+        conn.close()
+
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+import os
+import time
+import pickle
+import sqlite3
+import threading
+from collections import OrderedDict
+
+# ─── In-process LRU ──────────────────────────────────────
+def sizeof(value):
+    """
+    Rough size in bytes, for caches bounded by maxbytes.
+    """
+    if isinstance(value, str):
+        return len(value.encode())
+    if isinstance(value, bytes):
+        return len(value)
+    if hasattr(value, "nbytes"):
+        # numpy arrays: their buffer, without pickling a copy
+        return value.nbytes
+    if isinstance(value, (tuple, list)):
+        return sum(sizeof(item) for item in value)
+    return len(pickle.dumps(value))
+
+class LRUCache:
+    """
+    Thread-safe LRU with an optional per-entry TTL (seconds), bounded by
+    entry count and optionally by total size (maxbytes).
+    """
+    def __init__(self, name, maxsize=1024, ttl=None, maxbytes=None):
+        self.name     = name
+        self.maxsize  = maxsize
+        self.maxbytes = maxbytes
+        self.ttl      = ttl
+        self.hits     = 0
+        self.misses   = 0
+        self.bytes    = 0
+        self._data    = OrderedDict()
+        self._lock    = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or (entry[1] and entry[1] < time.monotonic()):
+                if entry is not None:
+                    self._drop(key)
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value, ttl=None):
+        ttl     = ttl or self.ttl
+        expires = time.monotonic() + ttl if ttl else None
+        size    = sizeof(value) if self.maxbytes else 0
+        with self._lock:
+            self._drop(key)
+            self._data[key] = (value, expires, size)
+            self.bytes     += size
+            while len(self._data) > self.maxsize or (self.maxbytes and self.bytes > self.maxbytes):
+                self._drop(next(iter(self._data)))
+
+    def _drop(self, key):
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry[2]
+
+    def delete(self, key):
+        with self._lock:
+            self._drop(key)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._data),
+                "bytes": self.bytes}
+
+# ─── Redis ───────────────────────────────────────────────
+class RedisCache:
+    """
+    Same interface as LRUCache, backed by Redis so every worker shares it.
+    Eviction is left to Redis (maxmemory-policy allkeys-lru).
+    """
+    def __init__(self, name, client, ttl=None):
+        self.name    = name
+        self.ttl     = ttl
+        self.hits    = 0
+        self.misses  = 0
+        self._client = client
+
+    def _key(self, key):
+        return f"{self.name}:{key!r}"
+
+    def get(self, key):
+        raw = self._client.get(self._key(key))
+        if raw is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return pickle.loads(raw)
+
+    def set(self, key, value, ttl=None):
+        ttl = ttl or self.ttl
+        self._client.set(self._key(key), pickle.dumps(value),
+                         ex=int(ttl) if ttl else None)
+
+    def delete(self, key):
+        self._client.delete(self._key(key))
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
+
+# ─── SQLite (shared on one host) ────────────────────────
+class SQLiteCache:
+    """
+    Same interface as LRUCache, in a SQLite file that every worker on the
+    host shares. Past maxsize (or maxbytes) the least recently used
+    entries go; reads refresh an entry's `written` time at most once
+    every TOUCH_EVERY seconds, so recency is approximate.
+    """
+    TOUCH_EVERY = 60
+
+    def __init__(self, name, path, maxsize=1024, ttl=None, maxbytes=None):
+        self.name     = name
+        self.path     = path
+        self.maxsize  = maxsize
+        self.maxbytes = maxbytes
+        self.ttl      = ttl
+        self.hits     = 0
+        self.misses   = 0
+        self._writes  = 0
+        self._local   = threading.local()
+        self._db().execute(
+            """CREATE TABLE IF NOT EXISTS cache (
+                   name    TEXT NOT NULL,
+                   key     TEXT NOT NULL,
+                   value   BLOB NOT NULL,
+                   expires REAL,
+                   written REAL NOT NULL,
+                   PRIMARY KEY (name, key)
+               )"""
+        )
+
+    def _db(self):
+        # One connection per thread, reopened after a fork
+        db = getattr(self._local, "db", None)
+        if db is None or self._local.pid != os.getpid():
+            db = sqlite3.connect(self.path, timeout=5, isolation_level=None,
+                                 check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db  = db
+            self._local.pid = os.getpid()
+        return db
+
+    def get(self, key):
+        row = self._db().execute(
+            "SELECT value, expires, written FROM cache WHERE name = ? AND key = ?",
+            (self.name, repr(key))
+        ).fetchone()
+        now = time.time()
+        if row is None or (row[1] and row[1] < now):
+            if row is not None:
+                self.delete(key)
+            self.misses += 1
+            return None
+        if now - row[2] > self.TOUCH_EVERY:
+            self._db().execute(
+                "UPDATE cache SET written = ? WHERE name = ? AND key = ?",
+                (now, self.name, repr(key))
+            )
+        self.hits += 1
+        return pickle.loads(row[0])
+
+    def set(self, key, value, ttl=None):
+        ttl = ttl or self.ttl
+        now = time.time()
+        db  = self._db()
+        db.execute(
+            "INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?)",
+            (self.name, repr(key), pickle.dumps(value), now + ttl if ttl else None, now)
+        )
+        self._writes += 1
+        if self._writes % 100 == 0:
+            db.execute(
+                """DELETE FROM cache WHERE name = ? AND key IN (
+                       SELECT key FROM cache WHERE name = ?
+                       ORDER BY written DESC LIMIT -1 OFFSET ?
+                   )""",
+                (self.name, self.name, self.maxsize)
+            )
+            if self.maxbytes:
+                db.execute(
+                    """DELETE FROM cache WHERE name = ? AND key IN (
+                           SELECT key FROM (
+                               SELECT key, SUM(LENGTH(value)) OVER (ORDER BY written DESC) AS total
+                               FROM cache WHERE name = ?
+                           ) WHERE total > ?
+                       )""",
+                    (self.name, self.name, self.maxbytes)
+                )
+
+    def delete(self, key):
+        self._db().execute(
+            "DELETE FROM cache WHERE name = ? AND key = ?", (self.name, repr(key))
+        )
+
+    def stats(self):
+        size, total = self._db().execute(
+            "SELECT COUNT(*), COALESCE(SUM(LENGTH(value)), 0) FROM cache WHERE name = ?",
+            (self.name,)
+        ).fetchone()
+        return {"hits": self.hits, "misses": self.misses, "size": size, "bytes": total}
+
+# ─── Factory ─────────────────────────────────────────────
+caches = {}
+
+def make_cache(name, maxsize=1024, ttl=None, local=False, maxbytes=None):
+    """
+    Redis when REDIS_URL is set and the redis package is installed,
+    a SQLite file shared by the host's workers when LOCAL_CACHE_PATH
+    is set, otherwise an in-process LRU. `local` always picks the LRU,
+    for values that aren't worth serializing (e.g. numpy matrices).
+    `maxbytes` bounds the LRU and SQLite stores by size as well.
+    """
+    url   = None if local else os.environ.get("REDIS_URL")
+    path  = None if local else os.environ.get("LOCAL_CACHE_PATH")
+    cache = None
+    if url:
+        try:
+            import redis
+            cache = RedisCache(name, redis.Redis.from_url(url), ttl)
+        except ImportError:
+            cache = None
+    if cache is None and path:
+        cache = SQLiteCache(name, path, maxsize, ttl, maxbytes)
+    if cache is None:
+        cache = LRUCache(name, maxsize, ttl, maxbytes)
+    caches[name] = cache
+    return cache
+
+def get_cache_stats():
+    return {name: cache.stats() for name, cache in caches.items()}
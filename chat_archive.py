@@ -0,0 +1,139 @@
+import os
+import json
+import zlib
+import itertools
+from datetime import date, timedelta
+from database import ensure_chat_partitions, chat_partitions, chat_partition, next_month
+
+# ─── Settings ────────────────────────────────────────────
+# A month is archived once all of it is older than CHAT_ARCHIVE_AFTER_DAYS.
+# Each user's day becomes one zlib-compressed JSON row in chat_archives and
+# the month's partition is dropped, so nothing is left to vacuum.
+ARCHIVE_AFTER_DAYS = int(os.environ.get("CHAT_ARCHIVE_AFTER_DAYS", 90))
+ARCHIVE_BATCH      = 500
+
+def pack(messages):
+    return zlib.compress(json.dumps(messages, separators=(",", ":")).encode(), 6)
+
+def unpack(blob):
+    return json.loads(zlib.decompress(bytes(blob)))
+
+# ─── Archival ────────────────────────────────────────────
+def archive_month(conn, month):
+    """
+    Compacts one monthly partition into chat_archives and drops it, in
+    one transaction. Returns the number of user-days archived.
+    """
+    name = chat_partition(month)
+    read = conn.cursor(name="archive_chats")
+    read.itersize = 2000
+    read.execute(
+        f"""SELECT id, user_id, created::date AS day, role, content, created
+            FROM {name} ORDER BY user_id, created, id"""
+    )
+    cur     = conn.cursor()
+    batch   = []
+    written = 0
+    for (user_id, day), rows in itertools.groupby(read, key=lambda r: (r["user_id"], r["day"])):
+        messages = [{"id": r["id"], "role": r["role"], "content": r["content"],
+                     "created": r["created"].isoformat()} for r in rows]
+        batch.append((user_id, day, messages))
+        if len(batch) >= ARCHIVE_BATCH:
+            written += write_archives(cur, batch)
+            batch = []
+    written += write_archives(cur, batch)
+    read.close()
+
+    cur.execute(f"ALTER TABLE chats DETACH PARTITION {name}")
+    cur.execute(f"DROP TABLE {name}")
+    conn.commit()
+    cur.close()
+    return written
+
+def merge_messages(earlier, later):
+    """
+    One day's archived messages plus more of them, by id, oldest first.
+    """
+    merged = {m["id"]: m for m in earlier}
+    merged.update((m["id"], m) for m in later)
+    return sorted(merged.values(), key=lambda m: (m["created"], m["id"]))
+
+def write_archives(cur, days):
+    """
+    Stores [(user_id, day, messages)] in chat_archives. A day that is
+    already archived (its partition came back, or an import added to it)
+    is merged with what was stored, never replaced.
+    """
+    if not days:
+        return 0
+    cur.execute(
+        """SELECT user_id, date, messages FROM chat_archives
+           WHERE (user_id, date) IN (""" + ",".join(
+            cur.mogrify("(%s, %s)", (user_id, day)).decode() for user_id, day, _ in days
+        ) + ") FOR UPDATE"
+    )
+    stored = {(row["user_id"], row["date"]): unpack(row["messages"]) for row in cur.fetchall()}
+    rows   = []
+    for user_id, day, messages in days:
+        if (user_id, day) in stored:
+            messages = merge_messages(stored[(user_id, day)], messages)
+        rows.append((user_id, day, pack(messages), len(messages),
+                     messages[0]["id"], messages[-1]["id"]))
+    cur.execute(
+        """INSERT INTO chat_archives
+               (user_id, date, messages, message_count, first_id, last_id)
+           VALUES """ + ",".join(
+            cur.mogrify("(%s, %s, %s, %s, %s, %s)", row).decode() for row in rows
+        ) + """
+           ON CONFLICT (user_id, date) DO UPDATE
+           SET messages = EXCLUDED.messages, message_count = EXCLUDED.message_count,
+               first_id = EXCLUDED.first_id, last_id = EXCLUDED.last_id,
+               archived_at = NOW()"""
+    )
+    return len(rows)
+
+def maintain(conn, after_days=ARCHIVE_AFTER_DAYS, today=None):
+    """
+    Creates upcoming partitions, then archives every month that ended
+    more than `after_days` ago. Returns (partitions created, {month: user-days}).
+    """
+    cur     = conn.cursor()
+    created = ensure_chat_partitions(cur)
+    conn.commit()
+    cutoff  = (today or date.today()) - timedelta(days=after_days)
+    months  = [month for month, _ in chat_partitions(cur) if next_month(month) <= cutoff]
+    cur.close()
+    return created, {month: archive_month(conn, month) for month in months}
+
+# ─── Reading Archives ────────────────────────────────────
+def archived_day(cur, user_id, day):
+    """
+    The messages of an archived day (id, role, content, created), or [].
+    """
+    cur.execute(
+        "SELECT messages FROM chat_archives WHERE user_id = %s AND date = %s",
+        (user_id, day)
+    )
+    row = cur.fetchone()
+    return unpack(row["messages"]) if row else []
+
+def stream_archived_days(conn, where, params):
+    """
+    Yields ((user_id, day), messages) from chat_archives in (user_id, day)
+    order, with messages shaped like backfill.py's chats rows. `where`
+    is a SQL condition on user_id / date.
+    """
+    cur = conn.cursor(name="archived_days")
+    cur.itersize = 200
+    cur.execute(
+        f"""SELECT user_id, date AS day, messages FROM chat_archives
+            WHERE {where} ORDER BY user_id, date""",
+        params
+    )
+    for row in cur:
+        yield (row["user_id"], row["day"]), [
+            {"id": m["id"], "user_id": row["user_id"], "day": row["day"],
+             "role": m["role"], "content": m["content"]}
+            for m in unpack(row["messages"])
+        ]
+    cur.close()
@@ -0,0 +1,308 @@
+import os
+import asyncio
+import jobs
+import chat_store
+import embeddings
+from database import get_connection
+from ai import (get_ai_response, stream_ai_response, get_ai_response_async,
+                stream_ai_response_async, summarize_conversation, extract_persona,
+                create_or_update_journal, update_journal)
+
+# ─── Persona Extraction Schedule ─────────────────────────
+# Persona traits barely move within a day, so extraction is coalesced:
+# it runs every PERSONA_EVERY_N_MESSAGES turns, when the day's session wraps
+# up ([JOURNAL_READY]), or when the last extraction is older than the max age.
+PERSONA_EVERY_N_MESSAGES = int(os.environ.get("PERSONA_EVERY_N_MESSAGES", 6))
+PERSONA_MAX_AGE_MINUTES  = int(os.environ.get("PERSONA_MAX_AGE_MINUTES", 240))
+
+persona_extractions = {"executed": 0, "skipped": 0}
+
+def persona_due(state, ai_reply):
+    return (state["pending_messages"] >= PERSONA_EVERY_N_MESSAGES
+            or "[JOURNAL_READY]" in ai_reply
+            or bool(state["stale"]))
+
+# ─── Reply Markers ───────────────────────────────────────
+MARKERS = ("[ONBOARDING_COMPLETE]", "[JOURNAL_READY]")
+
+UNAVAILABLE_REPLY = "I'm having trouble thinking right now. Give me a moment and try again."
+
+def clean_reply(ai_reply):
+    """
+    Strips control markers. Returns (reply, journal_saved).
+    """
+    ai_reply = ai_reply.replace("[ONBOARDING_COMPLETE]", "").strip()
+    journal_saved = "[JOURNAL_READY]" in ai_reply
+    ai_reply = ai_reply.replace("[JOURNAL_READY]", "").strip()
+    return ai_reply, journal_saved
+
+def split_markers(buffer):
+    """
+    Removes complete markers from buffer and returns (held_back, ready).
+    """
+    for marker in MARKERS:
+        buffer = buffer.replace(marker, "")
+    cut = buffer.rfind("[")
+    if cut != -1 and any(m.startswith(buffer[cut:]) for m in MARKERS):
+        return buffer[cut:], buffer[:cut]
+    return "", buffer
+
+# ─── Backends ────────────────────────────────────────────
+class GroqBackend:
+    """
+    The LLM calls a chat turn makes, as implemented in ai.py.
+    """
+    def reply(self, messages, persona, has_history):
+        return get_ai_response(messages, persona, has_history)
+
+    def stream(self, messages, persona, has_history):
+        return stream_ai_response(messages, persona, has_history)
+
+    async def reply_async(self, messages, persona, has_history):
+        return await get_ai_response_async(messages, persona, has_history)
+
+    def stream_async(self, messages, persona, has_history):
+        return stream_ai_response_async(messages, persona, has_history)
+
+    def summarize(self, summary, messages, user_id):
+        return summarize_conversation(summary, messages, user_id)
+
+    def extract_persona(self, messages, user_id):
+        return extract_persona(messages, user_id)
+
+    def write_journal(self, messages, persona):
+        return create_or_update_journal(messages, persona)
+
+    def append_journal(self, messages, persona, title, content):
+        return update_journal(messages, persona, title, content)
+
+class PostgresStore:
+    """
+    Chat turn persistence on the pooled connections (SQL in chat_store.py).
+    """
+    def begin_turn(self, user_id, user_message):
+        conn = get_connection()
+        cur  = conn.cursor()
+        try:
+            persona, context = chat_store.begin_turn(
+                cur, user_id, user_message, PERSONA_MAX_AGE_MINUTES
+            )
+            conn.commit()
+        finally:
+            cur.close()
+            conn.close()
+        return persona, context
+
+    def save_reply(self, user_id, ai_reply):
+        conn = get_connection()
+        cur  = conn.cursor()
+        try:
+            chat_id = chat_store.save_reply(cur, user_id, ai_reply)
+            conn.commit()
+        finally:
+            cur.close()
+            conn.close()
+        return chat_id
+
+    def save_followup(self, user_id, context, updates):
+        """
+        `updates` may hold: summary (bool), onboarded / persona (extracted
+        data), pending (bool), journal_create (title, content, through_id),
+        journal_append (journal, through_id, addition).
+        """
+        writes = []
+        if updates.get("summary"):
+            writes.append(chat_store.summary_upsert(user_id, context))
+        if "onboarded" in updates:
+            writes.append(chat_store.persona_onboarded(user_id, updates["onboarded"]))
+        if "journal_create" in updates:
+            title, content, _ = updates["journal_create"]
+            writes.append(chat_store.journal_create(user_id, *updates["journal_create"]))
+            writes.append(embeddings.journal_vector_upsert(user_id, title, content))
+        if "journal_append" in updates:
+            journal, _, addition = updates["journal_append"]
+            writes.append(chat_store.journal_append(*updates["journal_append"]))
+            writes.append(embeddings.journal_vector_upsert(
+                user_id, journal["title"], journal["content"] + "\n\n" + addition
+            ))
+        if "persona" in updates:
+            writes.append(chat_store.persona_extracted(user_id, updates["persona"]))
+        if updates.get("pending"):
+            writes.append(chat_store.persona_pending(user_id))
+        if not writes:
+            return
+
+        conn = get_connection()
+        cur  = conn.cursor()
+        try:
+            chat_store.save_followup(cur, user_id, writes)
+            conn.commit()
+        finally:
+            cur.close()
+            conn.close()
+
+        # Keep the cached persona in line with what was just written
+        if "onboarded" in updates or "persona" in updates:
+            chat_store.forget_persona(user_id)
+        elif updates.get("pending"):
+            chat_store.bump_pending(user_id)
+
+# ─── Chat Turn Engine ────────────────────────────────────
+class ChatTurnEngine:
+    """
+    One chat turn, whatever the transport: save the user's message,
+    get the reply (whole, streamed, sync or async), save it and queue
+    the follow-up. Routes only deal with requests and responses.
+    """
+    def __init__(self, store=None, llm=None, submit=None):
+        self.store  = store  or PostgresStore()
+        self.llm    = llm    or GroqBackend()
+        self.submit = submit or jobs.submit
+
+    def begin(self, user_id, user_message):
+        """
+        Saves the user's message and loads persona + today's context.
+        """
+        return self.store.begin_turn(user_id, user_message)
+
+    def finish(self, user_id, persona, context, ai_reply):
+        """
+        Saves the AI reply and queues the background follow-up.
+        Returns the follow-up job id, if one was queued.
+        """
+        context.append("assistant", ai_reply, self.store.save_reply(user_id, ai_reply))
+
+        # Persona + journal updates happen in the background
+        if self.needs_followup(persona, ai_reply, context):
+            return self.submit(user_id, "chat_followup", self.followup,
+                               user_id, persona, context, ai_reply)
+        return None
+
+    def result(self, ai_reply, job_id):
+        ai_reply, journal_saved = clean_reply(ai_reply)
+        return {"reply": ai_reply, "journal_saved": journal_saved, "job_id": job_id}
+
+    # ── Whole replies ─────────────────────────────────────
+    def run(self, user_id, user_message):
+        """
+        A full turn. Returns {"reply", "journal_saved", "job_id"};
+        raises LLMUnavailable if the provider is down.
+        """
+        persona, context = self.begin(user_id, user_message)
+        ai_reply = self.llm.reply(context.window(), persona, context.has_history())
+        return self.result(ai_reply, self.finish(user_id, persona, context, ai_reply))
+
+    async def run_async(self, user_id, user_message):
+        """
+        run() for the event loop: DB steps on threads, the LLM call awaited.
+        """
+        persona, context = await asyncio.to_thread(self.begin, user_id, user_message)
+        ai_reply = await self.llm.reply_async(
+            context.window(), persona, context.has_history()
+        )
+        job_id = await asyncio.to_thread(self.finish, user_id, persona, context, ai_reply)
+        return self.result(ai_reply, job_id)
+
+    # ── Streamed replies ──────────────────────────────────
+    def stream(self, user_id, persona, context):
+        """
+        Yields ("delta", text) with markers held back, then ("done", data)
+        once the full reply is saved. LLM errors propagate to the caller.
+        """
+        parts  = []
+        buffer = ""
+        for chunk in self.llm.stream(context.window(), persona, context.has_history()):
+            parts.append(chunk)
+            buffer, ready = split_markers(buffer + chunk)
+            if ready:
+                yield "delta", ready
+        if buffer:
+            yield "delta", buffer
+
+        # Persist the full reply once the stream has finished
+        ai_reply = "".join(parts)
+        job_id   = self.finish(user_id, persona, context, ai_reply)
+        yield "done", {"journal_saved": "[JOURNAL_READY]" in ai_reply, "job_id": job_id}
+
+    async def stream_async(self, user_id, persona, context):
+        parts  = []
+        buffer = ""
+        async for chunk in self.llm.stream_async(
+            context.window(), persona, context.has_history()
+        ):
+            parts.append(chunk)
+            buffer, ready = split_markers(buffer + chunk)
+            if ready:
+                yield "delta", ready
+        if buffer:
+            yield "delta", buffer
+
+        ai_reply = "".join(parts)
+        job_id   = await asyncio.to_thread(self.finish, user_id, persona, context, ai_reply)
+        yield "done", {"journal_saved": "[JOURNAL_READY]" in ai_reply, "job_id": job_id}
+
+    # ── Follow-up (background) ────────────────────────────
+    def needs_followup(self, persona, ai_reply, context):
+        return ("[ONBOARDING_COMPLETE]" in ai_reply
+                or bool(persona and persona["onboarded"])
+                or context.needs_compaction())
+
+    def followup(self, user_id, persona, context, ai_reply):
+        """
+        Summary upkeep, persona extraction and journal regeneration for one
+        chat turn. All LLM calls happen first; their results are written
+        in one transaction.
+        """
+        updates = {}
+
+        # The journal can lag the summary (an earlier follow-up failed or
+        # lost its watermark race): keep what compaction is about to drop
+        loaded_messages = list(context.messages)
+        loaded_through  = context.through_id
+        earlier         = context.summary_message() if context.summary else None
+
+        # ── Fold old messages into the running summary ────
+        if context.needs_compaction():
+            updates["summary"] = context.compact(user_id, self.llm.summarize)
+
+        history = context.window()
+
+        # ── Handle onboarding complete ────────────────────
+        if "[ONBOARDING_COMPLETE]" in ai_reply:
+            updates["onboarded"] = self.llm.extract_persona(history, user_id)
+
+        # ── Save/update journal after every user message ──
+        if persona and persona["onboarded"]:
+            journal = context.journal
+            if journal:
+                # Only send what the entry hasn't seen yet, then append to it
+                new_messages = [
+                    m for m in loaded_messages
+                    if m.get("id", 0) > journal["through_chat_id"]
+                ]
+                if new_messages and earlier and journal["through_chat_id"] < loaded_through:
+                    # Part of it only survives in the summary
+                    new_messages.insert(0, earlier)
+                if new_messages:
+                    addition = self.llm.append_journal(
+                        new_messages, persona, journal["title"], journal["content"]
+                    )
+                    updates["journal_append"] = (journal, new_messages[-1]["id"], addition)
+            else:
+                # First entry of the day: write it from the conversation so far
+                title, content = self.llm.write_journal(history, persona)
+                updates["journal_create"] = (title, content, context.last_id())
+
+            # Update persona, but only every few messages / at session end
+            state = {"pending_messages": (persona["pending_messages"] or 0) + 1,
+                     "stale":            persona["stale"]}
+            if persona_due(state, ai_reply):
+                updates["persona"] = self.llm.extract_persona(history, user_id)
+                persona_extractions["executed"] += 1
+            else:
+                updates["pending"] = True
+                persona_extractions["skipped"] += 1
+
+        self.store.save_followup(user_id, context, updates)
+
+engine = ChatTurnEngine()
@@ -0,0 +1,245 @@
+import os
+import time
+from ai import ConversationContext
+from cache import make_cache
+
+# ─── Persona Cache ───────────────────────────────────────
+# Personas change a few times a day but are needed on every turn, so they
+# are cached per user. The backend may be one worker's own LRU, so every
+# read checks the entry against the row's (updated_at, pending_messages)
+# and only sends the row back when those moved; on a chat turn that check
+# rides along in the turn's single statement. Writes that change anything
+# else bump updated_at.
+PERSONA_CACHE_TTL = int(os.environ.get("PERSONA_CACHE_TTL", 600))
+
+persona_cache = make_cache("personas", maxsize=4096, ttl=PERSONA_CACHE_TTL)
+
+def cached_persona(user_id):
+    """
+    The cached persona with `stale` worked out for now, or None.
+    """
+    persona = persona_cache.get(user_id)
+    if persona is None:
+        return None
+    return dict(persona, stale=time.time() >= persona["stale_at"])
+
+def remember_persona(persona):
+    """
+    Caches a persona row; `fresh_for` is seconds until it turns stale.
+    """
+    persona   = dict(persona)
+    fresh_for = persona.pop("fresh_for")
+    persona["stale_at"] = time.time() + float(fresh_for) if fresh_for is not None else float("inf")
+    persona_cache.set(persona["user_id"], persona)
+    return dict(persona, stale=time.time() >= persona["stale_at"])
+
+def persona_version(persona):
+    """
+    Query parameters the statements below use to check a cached entry.
+    """
+    if persona is None:
+        return {"cached": False, "updated_at": None, "pending": None}
+    return {"cached": True, "updated_at": persona["updated_at"],
+            "pending": persona["pending_messages"]}
+
+CHANGED = """(NOT %(cached)s OR p.updated_at IS DISTINCT FROM %(updated_at)s
+              OR p.pending_messages IS DISTINCT FROM %(pending)s)"""
+
+def forget_persona(user_id):
+    persona_cache.delete(user_id)
+
+def bump_pending(user_id):
+    # Mirrors persona_pending() so the next turn's schedule check is right
+    persona = persona_cache.get(user_id)
+    if persona is not None:
+        persona_cache.set(user_id, dict(persona,
+                                        pending_messages=(persona["pending_messages"] or 0) + 1))
+
+def load_persona(cur, user_id, max_age):
+    """
+    The user's persona, created on first use. One statement; from the
+    cache when it is still current.
+    """
+    persona = cached_persona(user_id)
+    if persona is not None:
+        cur.execute(
+            f"""SELECT p.*,
+                       EXTRACT(EPOCH FROM p.updated_at + %(max_age)s * INTERVAL '1 minute' - NOW())
+                           AS fresh_for
+                FROM personas p WHERE p.user_id = %(user_id)s AND {CHANGED}""",
+            dict(persona_version(persona), user_id=user_id, max_age=max_age)
+        )
+        row = cur.fetchone()
+        return remember_persona(row) if row else persona
+    cur.execute(
+        """WITH created AS (
+               INSERT INTO personas (user_id) VALUES (%(user_id)s)
+               ON CONFLICT (user_id) DO NOTHING
+               RETURNING *
+           ), persona AS (
+               SELECT * FROM created
+               UNION ALL
+               SELECT * FROM personas WHERE user_id = %(user_id)s
+           )
+           SELECT *,
+                  EXTRACT(EPOCH FROM updated_at + %(max_age)s * INTERVAL '1 minute' - NOW())
+                      AS fresh_for
+           FROM persona LIMIT 1""",
+        {"user_id": user_id, "max_age": max_age}
+    )
+    return remember_persona(cur.fetchone())
+
+# ─── Chat Turn Persistence ───────────────────────────────
+# Reads and writes for one chat turn, kept to as few round trips as
+# possible: the turn is loaded (and the user's message saved) by a single
+# statement, and the follow-up writes go out as one batch in one
+# transaction, serialized per user by an advisory lock.
+JOURNAL_LOCK = 727100   # pg_advisory_xact_lock(JOURNAL_LOCK, user_id)
+
+def begin_turn(cur, user_id, user_message, persona_max_age):
+    """
+    Saves the user's message and loads persona, today's context and
+    today's journal in one statement. Returns (persona, context).
+    The persona comes from the cache when it can.
+    """
+    persona = cached_persona(user_id)
+    cur.execute(
+        """WITH msg AS (
+               INSERT INTO chats (user_id, role, content)
+               VALUES (%(user_id)s, 'user', %(message)s)
+               RETURNING id
+           ), day AS (
+               SELECT summary, through_id FROM chat_summaries
+               WHERE user_id = %(user_id)s AND date = CURRENT_DATE
+           )
+           SELECT p.*,
+                  EXTRACT(EPOCH FROM p.updated_at + %(max_age)s * INTERVAL '1 minute' - NOW())
+                      AS fresh_for,
+                  (SELECT id FROM msg)                      AS turn_chat_id,
+                  (SELECT summary FROM day)                 AS turn_summary,
+                  COALESCE((SELECT through_id FROM day), 0) AS turn_through_id,
+                  (SELECT COALESCE(json_agg(json_build_object(
+                              'id', c.id, 'role', c.role, 'content', c.content
+                          ) ORDER BY c.created, c.id), '[]')
+                   FROM chats c
+                   WHERE c.user_id = %(user_id)s
+                   AND c.id > COALESCE((SELECT through_id FROM day), 0)
+                   AND c.created >= CURRENT_DATE AND c.created < CURRENT_DATE + 1
+                  ) AS turn_messages,
+                  (SELECT row_to_json(j) FROM (
+                       SELECT dj.note_id, dj.through_chat_id, n.title, n.content
+                       FROM daily_journals dj
+                       JOIN notes n ON n.id = dj.note_id
+                       WHERE dj.user_id = %(user_id)s AND dj.date = CURRENT_DATE
+                   ) j) AS turn_journal
+           FROM (SELECT 1) AS one
+           LEFT JOIN personas p ON p.user_id = %(user_id)s AND """ + CHANGED,
+        dict(persona_version(persona), user_id=user_id, message=user_message,
+             max_age=persona_max_age)
+    )
+    row = dict(cur.fetchone())
+
+    # The statement's snapshot doesn't include the message it inserted
+    context = ConversationContext(
+        row.pop("turn_messages"), row.pop("turn_summary"),
+        row.pop("turn_through_id"), row.pop("turn_journal")
+    )
+    context.append("user", user_message, row.pop("turn_chat_id"))
+    if row["user_id"] is not None:
+        persona = remember_persona(row)
+    return persona, context
+
+def save_reply(cur, user_id, ai_reply):
+    cur.execute(
+        """INSERT INTO chats (user_id, role, content)
+           VALUES (%s, 'assistant', %s) RETURNING id""",
+        (user_id, ai_reply)
+    )
+    return cur.fetchone()["id"]
+
+# ─── Follow-up Writes ────────────────────────────────────
+# Each returns a (sql, params) pair for save_followup to batch.
+def summary_upsert(user_id, context):
+    return (
+        """INSERT INTO chat_summaries (user_id, summary, through_id)
+           VALUES (%s, %s, %s)
+           ON CONFLICT (user_id, date) DO UPDATE
+           SET summary = EXCLUDED.summary, through_id = EXCLUDED.through_id,
+               updated_at = NOW()
+           WHERE chat_summaries.through_id < EXCLUDED.through_id""",
+        (user_id, context.summary, context.through_id)
+    )
+
+def persona_onboarded(user_id, data):
+    return (
+        """UPDATE personas
+           SET goals = %s, habits = %s, summary = %s, onboarded = TRUE,
+               updated_at = NOW()
+           WHERE user_id = %s""",
+        (data["goals"], data["habits"], data["summary"], user_id)
+    )
+
+def persona_extracted(user_id, data):
+    return (
+        """UPDATE personas
+           SET goals = %s, habits = %s, summary = %s,
+               pending_messages = 0, updated_at = NOW()
+           WHERE user_id = %s""",
+        (data["goals"], data["habits"], data["summary"], user_id)
+    )
+
+def persona_pending(user_id):
+    return (
+        "UPDATE personas SET pending_messages = pending_messages + 1 WHERE user_id = %s",
+        (user_id,)
+    )
+
+def journal_create(user_id, title, content, through_id):
+    """
+    First entry of the day. A no-op if one appeared since the turn was
+    loaded (e.g. from another tab); that entry picks up these messages
+    on the next append.
+    """
+    return (
+        """WITH note AS (
+               INSERT INTO notes (user_id, title, content)
+               SELECT %(user_id)s, %(title)s, %(content)s
+               WHERE NOT EXISTS (
+                   SELECT 1 FROM daily_journals
+                   WHERE user_id = %(user_id)s AND date = CURRENT_DATE
+               )
+               RETURNING id
+           )
+           INSERT INTO daily_journals (user_id, note_id, through_chat_id)
+           SELECT %(user_id)s, id, %(through_id)s FROM note
+           ON CONFLICT (user_id, date) DO NOTHING""",
+        {"user_id": user_id, "title": title, "content": content,
+         "through_id": through_id}
+    )
+
+def journal_append(journal, through_id, addition):
+    """
+    Appends to today's entry, unless another job moved its watermark
+    since the turn was loaded.
+    """
+    return (
+        """WITH moved AS (
+               UPDATE daily_journals SET through_chat_id = %s
+               WHERE note_id = %s AND through_chat_id = %s
+               RETURNING note_id
+           )
+           UPDATE notes SET content = content || %s
+           WHERE id IN (SELECT note_id FROM moved)""",
+        (through_id, journal["note_id"], journal["through_chat_id"], "\n\n" + addition)
+    )
+
+def save_followup(cur, user_id, writes):
+    """
+    Sends the lock and all writes as one batch; the caller commits.
+    """
+    if not writes:
+        return
+    statements = [("SELECT pg_advisory_xact_lock(%s, %s)", (JOURNAL_LOCK, user_id))] + writes
+    cur.execute(";\n".join(
+        cur.mogrify(sql, params).decode() for sql, params in statements
+    ))
@@ -1,20 +1,182 @@
 import os
+import time
+import threading
+from datetime import date, datetime, timedelta
 import psycopg2
+from psycopg2.pool import ThreadedConnectionPool
 from psycopg2.extras import RealDictCursor
 from dotenv import load_dotenv
+from metrics import span, observe
 load_dotenv()
 
+POOL_MIN     = int(os.environ.get("DB_POOL_MIN", 1))
+POOL_MAX     = int(os.environ.get("DB_POOL_MAX", 10))
+POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", 10))
+
+# ─── Connection Pool ─────────────────────────────────────
+# One pool per process: gunicorn forks workers after import, so the pool
+# is created lazily and rebuilt if we find ourselves in a new PID.
+_pool       = None
+_pool_pid   = None
+_pool_lock  = threading.Lock()
+_stats_lock = threading.Lock()
+_slots      = None
+_local      = threading.local()
+
+pool_stats = {
+    "checkouts":     0,
+    "wait_seconds":  0.0,
+    "active":        0,
+    "discarded":     0,
+    "timeouts":      0,
+}
+
+class PoolTimeout(Exception):
+    pass
+
+class TimedCursor(RealDictCursor):
+    """
+    RealDictCursor that records a `db` span per statement, labelled with
+    its leading keyword (SELECT, INSERT, ...).
+    """
+    def execute(self, query, vars=None):
+        with span("db", op=_statement_kind(query)):
+            return super().execute(query, vars)
+
+    def executemany(self, query, vars_list):
+        with span("db", op=_statement_kind(query)):
+            return super().executemany(query, vars_list)
+
+def _statement_kind(query):
+    if isinstance(query, bytes):
+        query = query.decode("utf-8", "replace")
+    words = query.split(None, 1) if isinstance(query, str) else None
+    return words[0].upper() if words else "OTHER"
+
+def _get_pool():
+    global _pool, _pool_pid, _slots
+    if _pool is None or _pool_pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool_pid != os.getpid():
+                _pool = ThreadedConnectionPool(
+                    POOL_MIN, POOL_MAX,
+                    os.environ.get("DATABASE_URL"),
+                    cursor_factory=TimedCursor
+                )
+                _slots    = threading.BoundedSemaphore(POOL_MAX)
+                _pool_pid = os.getpid()
+                pool_stats["active"] = 0
+    return _pool
+
+def _is_healthy(conn):
+    """
+    Cheap liveness check run on every checkout.
+    """
+    if conn.closed:
+        return False
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT 1")
+        cur.close()
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+class PooledConnection:
+    """
+    Thin wrapper around a pooled psycopg2 connection.
+    close() hands the connection back to the pool instead of
+    closing the socket, so existing call sites keep working.
+    """
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __enter__(self):
+        return self
+
+    def commit(self):
+        with span("db_commit"):
+            self._conn.commit()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        if self._conn is None:
+            return
+        conn, self._conn = self._conn, None
+        broken = conn.closed
+        if not broken:
+            try:
+                # Never hand out a connection with a half-done transaction
+                conn.rollback()
+            except psycopg2.Error:
+                broken = True
+        self._pool.putconn(conn, close=broken)
+        _slots.release()
+        with _stats_lock:
+            pool_stats["active"] -= 1
+            if broken:
+                pool_stats["discarded"] += 1
+        outstanding = getattr(_local, "outstanding", None)
+        if outstanding and self in outstanding:
+            outstanding.remove(self)
+
 def get_connection():
-    conn = psycopg2.connect(
-        os.environ.get("DATABASE_URL"),
-        cursor_factory=RealDictCursor
-    )
-    return conn
+    pool  = _get_pool()
+    start = time.monotonic()
+    if not _slots.acquire(timeout=POOL_TIMEOUT):
+        with _stats_lock:
+            pool_stats["timeouts"] += 1
+        raise PoolTimeout(f"No database connection free after {POOL_TIMEOUT}s")
+    waited = time.monotonic() - start
+    observe("db_checkout_wait_seconds", waited)
 
-def init_db():
-    conn = get_connection()
-    cur = conn.cursor()
+    try:
+        conn = pool.getconn()
+        if not _is_healthy(conn):
+            pool.putconn(conn, close=True)
+            conn = pool.getconn()
+            with _stats_lock:
+                pool_stats["discarded"] += 1
+    except Exception:
+        _slots.release()
+        raise
+
+    with _stats_lock:
+        pool_stats["checkouts"]    += 1
+        pool_stats["active"]       += 1
+        pool_stats["wait_seconds"] += waited
+
+    wrapped = PooledConnection(pool, conn)
+    if not hasattr(_local, "outstanding"):
+        _local.outstanding = []
+    _local.outstanding.append(wrapped)
+    return wrapped
+
+def release_connections():
+    """
+    Returns any connection this thread forgot to close (e.g. because a
+    route raised halfway through). Called from the app's request teardown.
+    """
+    for conn in list(getattr(_local, "outstanding", [])):
+        conn.close()
 
+def get_pool_stats():
+    with _stats_lock:
+        return dict(pool_stats, max=POOL_MAX, min=POOL_MIN)
+
+# ─── Migrations ──────────────────────────────────────────
+# Each migration runs once, in order, inside its own transaction.
+# Append new ones to MIGRATIONS; never edit one that has shipped.
+MIGRATION_LOCK = 727001
+
+def _m001_initial_schema(cur):
     cur.execute("""
         CREATE TABLE IF NOT EXISTS users (
             id       SERIAL PRIMARY KEY,
@@ -66,6 +228,327 @@ def init_db():
         )
     """)
 
-    conn.commit()
+    # Full-text search over notes: stored tsvector so ranking doesn't re-parse
+    cur.execute("""
+        ALTER TABLE notes ADD COLUMN IF NOT EXISTS search_vector tsvector
+        GENERATED ALWAYS AS (
+            to_tsvector('english', title || ' ' || content)
+        ) STORED
+    """)
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS notes_search_idx ON notes
+        USING GIN (search_vector)
+    """)
+
+    # Background work (journal / persona updates) queued by chat turns
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS jobs (
+            id         SERIAL PRIMARY KEY,
+            user_id    INTEGER NOT NULL REFERENCES users(id),
+            kind       TEXT NOT NULL,
+            status     TEXT NOT NULL DEFAULT 'queued',
+            error      TEXT,
+            created    TIMESTAMP DEFAULT NOW(),
+            finished   TIMESTAMP
+        )
+    """)
+
+def _m002_hot_path_indexes(cur):
+    # Homepage listing: WHERE user_id = ? ORDER BY created DESC
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS notes_user_created_idx
+        ON notes (user_id, created DESC)
+    """)
+
+    # Today's chat history: WHERE user_id = ? AND created in [today, tomorrow)
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS chats_user_created_idx
+        ON chats (user_id, created)
+    """)
+
+    # Job status polling
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS jobs_user_idx ON jobs (user_id, id)
+    """)
+
+def _m003_notes_keyset_index(cur):
+    # Keyset pagination orders by (created, id); id breaks ties
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS notes_user_created_id_idx
+        ON notes (user_id, created DESC, id DESC)
+    """)
+    cur.execute("DROP INDEX IF EXISTS notes_user_created_idx")
+
+def _m004_chat_summaries(cur):
+    # Running summary of each user's day, covering chats up to through_id
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS chat_summaries (
+            user_id    INTEGER NOT NULL REFERENCES users(id),
+            date       DATE NOT NULL DEFAULT CURRENT_DATE,
+            summary    TEXT NOT NULL DEFAULT '',
+            through_id INTEGER NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT NOW(),
+            PRIMARY KEY (user_id, date)
+        )
+    """)
+
+def _m005_journal_watermark(cur):
+    # Last chat id already written into the day's journal entry
+    cur.execute("""
+        ALTER TABLE daily_journals
+        ADD COLUMN IF NOT EXISTS through_chat_id INTEGER NOT NULL DEFAULT 0
+    """)
+
+def _m006_persona_pending(cur):
+    # Chat turns since the persona was last extracted
+    cur.execute("""
+        ALTER TABLE personas
+        ADD COLUMN IF NOT EXISTS pending_messages INTEGER NOT NULL DEFAULT 0
+    """)
+
+def _m007_opening_messages(cur):
+    # Chat openings generated ahead of time by `flask pregenerate-openings`
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS opening_messages (
+            user_id    INTEGER NOT NULL REFERENCES users(id),
+            date       DATE NOT NULL DEFAULT CURRENT_DATE,
+            content    TEXT NOT NULL,
+            created    TIMESTAMP DEFAULT NOW(),
+            PRIMARY KEY (user_id, date)
+        )
+    """)
+
+def _m008_note_embeddings(cur):
+    # One float16 vector per note for semantic search (see embeddings.py)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS note_embeddings (
+            note_id    INTEGER PRIMARY KEY REFERENCES notes(id) ON DELETE CASCADE,
+            user_id    INTEGER NOT NULL REFERENCES users(id),
+            vector     BYTEA NOT NULL,
+            updated    TIMESTAMP DEFAULT NOW()
+        )
+    """)
+    # Loading a user's matrix, and its (count, max(updated)) version check
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS note_embeddings_user_idx
+        ON note_embeddings (user_id, updated)
+    """)
+
+def _m009_partition_chats(cur):
+    # chats becomes range-partitioned by month (see ensure_chat_partitions);
+    # rows are copied over once, ids keep coming from the same sequence
+    cur.execute("SELECT relkind FROM pg_class WHERE oid = 'chats'::regclass")
+    if cur.fetchone()["relkind"] == "p":
+        return
+    cur.execute("ALTER TABLE chats RENAME TO chats_unpartitioned")
+    cur.execute("ALTER TABLE chats_unpartitioned RENAME CONSTRAINT chats_pkey TO chats_unpartitioned_pkey")
+    cur.execute("ALTER INDEX IF EXISTS chats_user_created_idx RENAME TO chats_unpartitioned_user_created_idx")
+    cur.execute("""
+        CREATE TABLE chats (
+            id         INTEGER NOT NULL DEFAULT nextval('chats_id_seq'),
+            user_id    INTEGER NOT NULL REFERENCES users(id),
+            role       TEXT NOT NULL,
+            content    TEXT NOT NULL,
+            created    TIMESTAMP NOT NULL DEFAULT NOW(),
+            PRIMARY KEY (id, created)
+        ) PARTITION BY RANGE (created)
+    """)
+    cur.execute("CREATE INDEX chats_user_created_idx ON chats (user_id, created)")
+    # Catches rows for months that have no partition yet
+    cur.execute("CREATE TABLE chats_default PARTITION OF chats DEFAULT")
+    cur.execute("ALTER SEQUENCE chats_id_seq OWNED BY chats.id")
+
+    cur.execute("""
+        SELECT DISTINCT date_trunc('month', created)::date AS month
+        FROM chats_unpartitioned WHERE created IS NOT NULL
+    """)
+    ensure_chat_partitions(cur, [row["month"] for row in cur.fetchall()])
+    cur.execute("""
+        INSERT INTO chats (id, user_id, role, content, created)
+        SELECT id, user_id, role, content, COALESCE(created, NOW())
+        FROM chats_unpartitioned
+    """)
+    cur.execute("DROP TABLE chats_unpartitioned")
+
+    # Old days, compacted by chat_archive.py once their month is dropped
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS chat_archives (
+            user_id       INTEGER NOT NULL REFERENCES users(id),
+            date          DATE NOT NULL,
+            messages      BYTEA NOT NULL,
+            message_count INTEGER NOT NULL,
+            first_id      INTEGER NOT NULL,
+            last_id       INTEGER NOT NULL,
+            archived_at   TIMESTAMP DEFAULT NOW(),
+            PRIMARY KEY (user_id, date)
+        )
+    """)
+    # Already zlib-compressed: don't let TOAST try again
+    cur.execute("ALTER TABLE chat_archives ALTER COLUMN messages SET STORAGE EXTERNAL")
+
+def _m010_note_revisions(cur):
+    # Version of each note for ETags: bumped by trigger whenever the title or
+    # content changes, whoever writes it (routes, journal jobs, backfill)
+    cur.execute("ALTER TABLE notes ADD COLUMN IF NOT EXISTS updated TIMESTAMP")
+    cur.execute("ALTER TABLE notes ADD COLUMN IF NOT EXISTS revision INTEGER NOT NULL DEFAULT 1")
+    cur.execute("UPDATE notes SET updated = COALESCE(created, NOW()) WHERE updated IS NULL")
+    cur.execute("ALTER TABLE notes ALTER COLUMN updated SET DEFAULT NOW()")
+    cur.execute("ALTER TABLE notes ALTER COLUMN updated SET NOT NULL")
+    cur.execute("""
+        CREATE OR REPLACE FUNCTION notes_bump_revision() RETURNS trigger AS $$
+        BEGIN
+            IF NEW.title IS DISTINCT FROM OLD.title
+               OR NEW.content IS DISTINCT FROM OLD.content THEN
+                NEW.revision := OLD.revision + 1;
+                NEW.updated  := NOW();
+            END IF;
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    cur.execute("DROP TRIGGER IF EXISTS notes_revision ON notes")
+    cur.execute("""
+        CREATE TRIGGER notes_revision BEFORE UPDATE ON notes
+        FOR EACH ROW EXECUTE FUNCTION notes_bump_revision()
+    """)
+    # Homepage ETag: COUNT(*) + MAX(updated) per user as an index-only scan
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS notes_user_updated_idx
+        ON notes (user_id, updated)
+    """)
+
+MIGRATIONS = [
+    (1, "initial schema",        _m001_initial_schema),
+    (2, "hot path indexes",      _m002_hot_path_indexes),
+    (3, "notes keyset index",    _m003_notes_keyset_index),
+    (4, "chat summaries",        _m004_chat_summaries),
+    (5, "journal watermark",     _m005_journal_watermark),
+    (6, "persona pending count", _m006_persona_pending),
+    (7, "opening messages",      _m007_opening_messages),
+    (8, "note embeddings",       _m008_note_embeddings),
+    (9, "partition chats",       _m009_partition_chats),
+    (10, "note revisions",       _m010_note_revisions),
+]
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+# ─── Chat Partitions ─────────────────────────────────────
+# One partition of chats per calendar month, named chats_pYYYYMM. Today's
+# reads touch only the current month, and old months can be archived and
+# dropped whole (chat_archive.py) instead of deleted row by row.
+PARTITIONS_AHEAD = 2
+
+def next_month(month):
+    return (month.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+def chat_partition(month):
+    return f"chats_p{month:%Y%m}"
+
+def ensure_chat_partitions(cur, months=()):
+    """
+    Creates partitions for this month, the next PARTITIONS_AHEAD months,
+    `months`, and any month that has rows sitting in chats_default
+    (those rows are moved over). Returns the names created; the caller
+    commits.
+    """
+    this_month = date.today().replace(day=1)
+    wanted     = {this_month}
+    for _ in range(PARTITIONS_AHEAD):
+        wanted.add(next_month(max(wanted)))
+    wanted.update(month.replace(day=1) for month in months)
+    cur.execute("SELECT DISTINCT date_trunc('month', created)::date AS month FROM chats_default")
+    wanted.update(row["month"] for row in cur.fetchall())
+
+    created = []
+    for month in sorted(wanted):
+        name = chat_partition(month)
+        cur.execute("SELECT to_regclass(%s) AS t", (name,))
+        if cur.fetchone()["t"] is not None:
+            continue
+        bounds = (month, next_month(month))
+        cur.execute(f"CREATE TABLE {name} (LIKE chats INCLUDING DEFAULTS)")
+        cur.execute(
+            f"""WITH moved AS (
+                    DELETE FROM chats_default
+                    WHERE created >= %s AND created < %s
+                    RETURNING *
+                )
+                INSERT INTO {name} SELECT * FROM moved""",
+            bounds
+        )
+        cur.execute(f"ALTER TABLE chats ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)",
+                    bounds)
+        created.append(name)
+    return created
+
+def chat_partitions(cur):
+    """
+    [(month, name)] for the monthly partitions, oldest first.
+    """
+    cur.execute(
+        """SELECT c.relname AS name FROM pg_inherits i
+           JOIN pg_class c ON c.oid = i.inhrelid
+           WHERE i.inhparent = 'chats'::regclass AND c.relname ~ '^chats_p[0-9]{6}$'
+           ORDER BY c.relname"""
+    )
+    return [(datetime.strptime(row["name"][7:], "%Y%m").date(), row["name"])
+            for row in cur.fetchall()]
+
+def schema_version(cur):
+    cur.execute("SELECT to_regclass('schema_migrations') AS t")
+    if cur.fetchone()["t"] is None:
+        return 0
+    cur.execute("SELECT COALESCE(MAX(version), 0) AS v FROM schema_migrations")
+    return cur.fetchone()["v"]
+
+def migrate():
+    """
+    Applies any pending migrations. An advisory lock makes concurrent
+    callers (e.g. several workers booting at once) wait for each other.
+    """
+    conn = get_connection()
+    cur  = conn.cursor()
+    cur.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK,))
+    try:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version    INTEGER PRIMARY KEY,
+                name       TEXT NOT NULL,
+                applied_at TIMESTAMP DEFAULT NOW()
+            )
+        """)
+        conn.commit()
+
+        current = schema_version(cur)
+        applied = []
+        for version, name, migration in MIGRATIONS:
+            if version <= current:
+                continue
+            migration(cur)
+            cur.execute(
+                "INSERT INTO schema_migrations (version, name) VALUES (%s, %s)",
+                (version, name)
+            )
+            conn.commit()
+            applied.append(f"{version:03d} {name}")
+        return applied
+    finally:
+        conn.rollback()
+        cur.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK,))
+        cur.close()
+        conn.close()
+
+def init_db():
+    """
+    Cheap on an up-to-date database: one version read, no DDL.
+    """
+    conn = get_connection()
+    cur  = conn.cursor()
+    current = schema_version(cur)
     cur.close()
-    conn.close()
\ No newline at end of file
+    conn.close()
+    if current < LATEST_VERSION:
+        migrate()
+
+if __name__ == "__main__":
+    for applied in migrate():
+        print("applied", applied)
@@ -0,0 +1,220 @@
+import os
+import re
+import zlib
+from functools import lru_cache
+from cache import make_cache
+from database import get_connection
+
+# numpy is imported inside the functions that use it, so importing this
+# module (and the app) doesn't pay for it until the first note is embedded.
+
+# ─── Settings ────────────────────────────────────────────
+# Vectors are stored as float16, EMBEDDING_DIM * 2 bytes per note.
+# Changing the dimension needs `flask --app app index-notes --all`.
+EMBEDDING_DIM    = int(os.environ.get("EMBEDDING_DIM", 512))
+SEMANTIC_MIN     = float(os.environ.get("SEMANTIC_MIN_SCORE", 0.05))
+TITLE_WEIGHT     = 2.0
+BIGRAM_WEIGHT    = 0.5
+TRIGRAM_WEIGHT   = 0.25
+
+STOPWORDS = frozenset("""
+    a about after again all am an and any are as at be because been before
+    being but by can could did do does doing down for from had has have
+    having he her here hers him his how i if in into is it its just me more
+    most my no nor not now of off on once only or other our out over own
+    same she should so some such than that the their them then there these
+    they this those through to too under until up very was we were what
+    when where which while who why will with would you your
+""".split())
+
+SUFFIXES = ("ingly", "fully", "ness", "ment", "ing", "ful", "ed", "ly", "es", "s")
+
+# ─── Hashing Vectorizer ──────────────────────────────────
+# No model and no network: words, word pairs and character trigrams are
+# hashed into a fixed number of signed buckets. Light stemming plus the
+# trigrams let "stressed", "stressful" and "stress" land close together.
+def stem(word):
+    for suffix in SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3 and not word.endswith("ss"):
+            word = word[:-len(suffix)]
+            # running -> runn -> run
+            if word[-1] == word[-2] and word[-1] not in "aeiouls":
+                word = word[:-1]
+            return word
+    return word
+
+def words(text):
+    return [stem(w) for w in re.findall(r"[a-z0-9]+", text.lower())
+            if w not in STOPWORDS and len(w) > 1]
+
+@lru_cache(maxsize=65536)
+def bucket(feature):
+    """
+    (index, sign) for a feature; crc32 keeps it stable across processes.
+    """
+    h = zlib.crc32(feature.encode())
+    return h % EMBEDDING_DIM, 1.0 if h & 0x80000000 else -1.0
+
+def features(text, weight=1.0):
+    """
+    Yields (feature, weight) pairs for a piece of text.
+    """
+    tokens = words(text)
+    for i, token in enumerate(tokens):
+        yield "w:" + token, weight
+        if i:
+            yield f"b:{tokens[i - 1]} {token}", weight * BIGRAM_WEIGHT
+        padded = f"<{token}>"
+        for j in range(len(padded) - 2):
+            yield "c:" + padded[j:j + 3], weight * TRIGRAM_WEIGHT
+
+def embed(text, title=""):
+    """
+    L2-normalised float32 vector for a note (or a query); all zeros if
+    the text has no usable words.
+    """
+    import numpy as np
+    pairs  = list(features(title, TITLE_WEIGHT)) + list(features(text))
+    vector = np.zeros(EMBEDDING_DIM, dtype=np.float32)
+    if not pairs:
+        return vector
+    buckets = [bucket(f) for f, _ in pairs]
+    index   = np.array([i for i, _ in buckets])
+    weight  = np.array([sign * w for (_, sign), (_, w) in zip(buckets, pairs)], dtype=np.float32)
+    np.add.at(vector, index, weight)
+    # Dampen repeated words so long notes aren't dominated by them
+    vector = np.sign(vector) * np.log1p(np.abs(vector))
+    norm   = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+def to_bytes(vector):
+    import numpy as np
+    return vector.astype(np.float16).tobytes()
+
+# ─── Index Upkeep ────────────────────────────────────────
+# note_embeddings rows are written in the same transaction as the note.
+def index_note(cur, note_id, user_id, title, content):
+    cur.execute(*note_vector_upsert(note_id, user_id, title, content))
+
+def note_vector_upsert(note_id, user_id, title, content):
+    return (
+        """INSERT INTO note_embeddings (note_id, user_id, vector)
+           VALUES (%s, %s, %s)
+           ON CONFLICT (note_id) DO UPDATE
+           SET vector = EXCLUDED.vector, updated = NOW()""",
+        (note_id, user_id, to_bytes(embed(content, title)))
+    )
+
+def journal_vector_upsert(user_id, title, content):
+    """
+    Embeds today's journal entry, for the follow-up batch. Only applies
+    if the entry ended up with exactly this text, i.e. the create/append
+    before it in the batch wasn't skipped.
+    """
+    return (
+        """INSERT INTO note_embeddings (note_id, user_id, vector)
+           SELECT n.id, n.user_id, %(vector)s
+           FROM daily_journals dj
+           JOIN notes n ON n.id = dj.note_id
+           WHERE dj.user_id = %(user_id)s AND dj.date = CURRENT_DATE
+             AND n.title = %(title)s AND n.content = %(content)s
+           ON CONFLICT (note_id) DO UPDATE
+           SET vector = EXCLUDED.vector, updated = NOW()""",
+        {"user_id": user_id, "title": title, "content": content,
+         "vector": to_bytes(embed(content, title))}
+    )
+
+def reindex(cur, everything=False, batch=500, user_id=None):
+    """
+    Embeds notes that have no vector yet (or all of them), optionally
+    for one user, `batch` notes per statement. Returns the number of
+    notes written; the caller commits.
+    """
+    missing = "" if everything else \
+        "AND NOT EXISTS (SELECT 1 FROM note_embeddings e WHERE e.note_id = n.id)"
+    owner   = "" if user_id is None else "AND n.user_id = %(user_id)s"
+    written = 0
+    last_id = 0
+    while True:
+        cur.execute(
+            f"""SELECT n.id, n.user_id, n.title, n.content FROM notes n
+                WHERE n.id > %(last_id)s {owner} {missing}
+                ORDER BY n.id LIMIT %(batch)s""",
+            {"last_id": last_id, "batch": batch, "user_id": user_id}
+        )
+        rows = cur.fetchall()
+        if not rows:
+            return written
+        cur.execute(";\n".join(
+            cur.mogrify(*note_vector_upsert(r["id"], r["user_id"], r["title"], r["content"])).decode()
+            for r in rows
+        ))
+        written += len(rows)
+        last_id  = rows[-1]["id"]
+
+def index_user_notes(user_id):
+    """
+    Embeds a user's notes that have no vector yet, e.g. after an import.
+    """
+    conn = get_connection()
+    cur  = conn.cursor()
+    try:
+        written = reindex(cur, user_id=user_id)
+        conn.commit()
+    finally:
+        cur.close()
+        conn.close()
+    return written
+
+# ─── Search ──────────────────────────────────────────────
+# Each user's vectors are loaded once into a matrix and kept in-process,
+# keyed by a cheap version read (row count + last update). A float32 row
+# is EMBEDDING_DIM * 4 bytes, so the cache is bounded by size
+# (NOTE_VECTOR_CACHE_MB per worker), not just by user count.
+NOTE_VECTOR_CACHE_MB = int(os.environ.get("NOTE_VECTOR_CACHE_MB", 64))
+
+matrix_cache = make_cache("note_vectors", maxsize=256, local=True,
+                          maxbytes=NOTE_VECTOR_CACHE_MB * 1024 * 1024)
+
+def user_matrix(cur, user_id):
+    """
+    Returns (note_ids, matrix) for a user's notes: int64 (n,) and float32 (n, dim).
+    """
+    import numpy as np
+    cur.execute(
+        """SELECT COUNT(*) AS n, MAX(updated) AS updated
+           FROM note_embeddings WHERE user_id = %s""",
+        (user_id,)
+    )
+    version = tuple(cur.fetchone().values())
+    cached  = matrix_cache.get(user_id)
+    if cached is not None and cached[0] == version:
+        return cached[1], cached[2]
+
+    cur.execute(
+        "SELECT note_id, vector FROM note_embeddings WHERE user_id = %s",
+        (user_id,)
+    )
+    rows   = [r for r in cur.fetchall() if len(r["vector"]) == EMBEDDING_DIM * 2]
+    ids    = np.array([r["note_id"] for r in rows], dtype=np.int64)
+    matrix = np.frombuffer(b"".join(bytes(r["vector"]) for r in rows), dtype=np.float16)
+    matrix = matrix.reshape(len(rows), EMBEDDING_DIM).astype(np.float32)
+    matrix_cache.set(user_id, (version, ids, matrix))
+    return ids, matrix
+
+def nearest(cur, user_id, text, limit=20):
+    """
+    [(note_id, score)] for the user's notes closest to `text`, best first.
+    """
+    import numpy as np
+    query = embed(text)
+    if not query.any():
+        return []
+    ids, matrix = user_matrix(cur, user_id)
+    if not len(ids):
+        return []
+    scores = matrix @ query
+    k      = min(limit, len(ids))
+    top    = np.argpartition(-scores, k - 1)[:k]
+    top    = top[np.argsort(-scores[top])]
+    return [(int(ids[i]), float(scores[i])) for i in top if scores[i] >= SEMANTIC_MIN]
@@ -0,0 +1,101 @@
+import os
+import re
+from flask import render_template
+from markupsafe import Markup, escape
+from cache import make_cache
+from http_cache import release
+
+# ─── Fragment Cache ──────────────────────────────────────
+# Rendered note bodies and homepage cards, keyed by note id + revision,
+# so an edit (or a journal append, via the revision trigger) never serves
+# a stale fragment. Bounded by FRAGMENT_CACHE_MB, least recently used out
+# first; shared by the host's workers when LOCAL_CACHE_PATH is set. The
+# write paths in app.py drop the old revision's entries right away.
+# Keys include the release, so a deploy never serves old markup.
+FRAGMENT_CACHE_MB = int(os.environ.get("FRAGMENT_CACHE_MB", 32))
+
+fragment_cache = make_cache("fragments", maxsize=100000,
+                            maxbytes=FRAGMENT_CACHE_MB * 1024 * 1024)
+
+def forget_note(note_id, revision):
+    fragment_cache.delete(("body", note_id, revision, release(), BODY_FORMAT))
+    fragment_cache.delete(("card", note_id, revision, release()))
+
+# ─── Note Bodies ─────────────────────────────────────────
+# A small Markdown subset, enough for the journal entries the model writes:
+# # headings, - / * lists, **bold**, *italic*, `code`, and paragraphs.
+# release() only covers templates and static files: bump BODY_FORMAT when
+# the output below changes, so cached bodies (kept across restarts with
+# LOCAL_CACHE_PATH) are rebuilt.
+BODY_FORMAT = 2
+# Emphasis never spans a tag, so overlapping markers (***x***, **a *b** c*)
+# can't produce misnested HTML; code spans are left as written.
+INLINE = [
+    (re.compile(r"\*\*\*([^<>*]+?)\*\*\*"), r"<strong><em>\1</em></strong>"),
+    (re.compile(r"\*\*([^<>]+?)\*\*"), r"<strong>\1</strong>"),
+    (re.compile(r"(?<![\w*])\*(?!\s)([^<>]+?)(?<!\s)\*(?![\w*])"), r"<em>\1</em>"),
+]
+CODE      = re.compile(r"`([^`]+)`")
+LIST_ITEM = re.compile(r"^\s*[-*] +")
+HEADING   = re.compile(r"^(#{1,3}) +(.*)$")
+
+def inline(text):
+    parts = CODE.split(str(escape(text)))    # odd indexes are code spans
+    for i, part in enumerate(parts):
+        if i % 2:
+            parts[i] = f"<code>{part}</code>"
+            continue
+        for pattern, replacement in INLINE:
+            part = pattern.sub(replacement, part)
+        parts[i] = part
+    return "".join(parts)
+
+def format_body(content):
+    """
+    Note text as HTML. Everything is escaped before any tag is added.
+    """
+    html = []
+    for block in re.split(r"\n\s*\n", content.replace("\r\n", "\n").strip()):
+        lines = block.split("\n")
+        if all(LIST_ITEM.match(line) for line in lines):
+            items = "".join(f"<li>{inline(LIST_ITEM.sub('', line))}</li>" for line in lines)
+            html.append(f"<ul>{items}</ul>")
+            continue
+        heading = HEADING.match(lines[0])
+        if heading:
+            level = len(heading.group(1)) + 1
+            html.append(f"<h{level}>{inline(heading.group(2))}</h{level}>")
+            lines = lines[1:]
+        if lines:
+            html.append("<p>" + "<br>".join(inline(line) for line in lines) + "</p>")
+    return "\n".join(html)
+
+def note_body(note):
+    """
+    The note's formatted body, from the cache when it can.
+    """
+    key  = ("body", note["id"], note["revision"], release(), BODY_FORMAT)
+    html = fragment_cache.get(key)
+    if html is None:
+        html = format_body(note["content"])
+        fragment_cache.set(key, html)
+    return Markup(html)
+
+# ─── Note Cards ──────────────────────────────────────────
+def note_card(note):
+    """
+    One homepage card. Search results carry query-specific snippets
+    and are rendered every time.
+    """
+    if "revision" not in note or note.get("snippet"):
+        return Markup(render_template("_note_card.html", note=note))
+    key  = ("card", note["id"], note["revision"], release())
+    html = fragment_cache.get(key)
+    if html is None:
+        html = render_template("_note_card.html", note=note)
+        fragment_cache.set(key, html)
+    return Markup(html)
+
+def install(app):
+    app.add_template_global(note_body)
+    app.add_template_global(note_card)
@@ -0,0 +1,116 @@
+import os
+import hashlib
+from datetime import timezone
+from flask import Response, request
+import metrics
+
+# ─── Validators ──────────────────────────────────────────
+# Pages carry a weak ETag built from what they show (note revision, or
+# the listing's row count + last update) plus RELEASE, so a deploy that
+# changes templates invalidates them too. Cache-Control: no-cache makes
+# browsers revalidate every time; a current copy costs one small query
+# and a 304, without rendering.
+STATIC_MAX_AGE = 365 * 24 * 3600
+
+_release = None
+
+def release():
+    """
+    RELEASE_VERSION, or a digest of the templates and static files.
+    """
+    global _release
+    if _release is None:
+        _release = os.environ.get("RELEASE_VERSION")
+    if _release is None:
+        root   = os.path.dirname(os.path.abspath(__file__))
+        digest = hashlib.blake2b(digest_size=8)
+        for folder in ("templates", "static"):
+            for name in sorted(os.listdir(os.path.join(root, folder))):
+                stat = os.stat(os.path.join(root, folder, name))
+                digest.update(f"{name}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+        _release = digest.hexdigest()
+    return _release
+
+def page_etag(*parts):
+    digest = hashlib.blake2b(digest_size=12)
+    digest.update(repr((release(),) + parts).encode())
+    return digest.hexdigest()
+
+def _utc(moment):
+    # TIMESTAMP columns hold UTC without a zone
+    return moment.replace(tzinfo=timezone.utc, microsecond=0) if moment else None
+
+def validators(response, etag, last_modified=None):
+    response.set_etag(etag, weak=True)
+    if last_modified:
+        response.last_modified = _utc(last_modified)
+    response.cache_control.private  = True
+    response.cache_control.no_cache = True
+    response.vary.add("Cookie")
+    return response
+
+def revalidating():
+    return bool(request.if_none_match or request.if_modified_since)
+
+def conditional(etag, last_modified=None):
+    """
+    A 304 if the client's copy is current, else None (render as usual).
+    If-None-Match wins over If-Modified-Since when both are sent.
+    Revalidations are counted in http_cache_total by result.
+    """
+    if not revalidating():
+        return None
+    if request.if_none_match:
+        fresh = request.if_none_match.contains_weak(etag)
+    else:
+        fresh = bool(last_modified) and _utc(last_modified) <= request.if_modified_since
+    metrics.inc("http_cache_total", route=request.url_rule.rule,
+                result="hit" if fresh else "miss")
+    return validators(Response(status=304), etag, last_modified) if fresh else None
+
+# ─── Static Files ────────────────────────────────────────
+# url_for("static", ...) gets ?v=<content digest>, so those URLs can be
+# cached for a year when the digest matches the file served; Flask
+# already answers conditional requests for them.
+_static_versions = {}
+
+def static_version(folder, filename):
+    path  = os.path.join(folder, filename)
+    mtime = os.stat(path).st_mtime_ns
+    known = _static_versions.get(path)
+    if known is None or known[0] != mtime:
+        with open(path, "rb") as f:
+            known = (mtime, hashlib.blake2b(f.read(), digest_size=6).hexdigest())
+        _static_versions[path] = known
+    return known[1]
+
+def install(app):
+    @app.url_defaults
+    def version_static_urls(endpoint, values):
+        if endpoint == "static" and "filename" in values and "v" not in values:
+            try:
+                values["v"] = static_version(app.static_folder, values["filename"])
+            except OSError:
+                pass
+
+    def current_version(filename):
+        # Mid-deploy, an old worker can be asked for a new ?v=; it mustn't
+        # pin its own copy under that URL for a year
+        try:
+            return request.args.get("v") == static_version(app.static_folder, filename)
+        except OSError:
+            return False
+
+    @app.after_request
+    def cache_static(response):
+        if request.endpoint != "static":
+            return response
+        if response.status_code == 200 and current_version(request.view_args["filename"]):
+            response.cache_control.no_cache  = None
+            response.cache_control.public    = True
+            response.cache_control.max_age   = STATIC_MAX_AGE
+            response.cache_control.immutable = True
+        if revalidating() and response.status_code in (200, 304):
+            metrics.inc("http_cache_total", route="/static",
+                        result="hit" if response.status_code == 304 else "miss")
+        return response
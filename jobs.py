@@ -0,0 +1,91 @@
+import os
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from database import get_connection, release_connections
+from metrics import span, inc
+
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", 4))
+
+# ─── Worker Pool ─────────────────────────────────────────
+# Jobs run on a small thread pool inside each web worker; their status
+# lives in the `jobs` table so any worker can answer a poll for it.
+_executor      = None
+_executor_pid  = None
+_executor_lock = threading.Lock()
+
+def _get_executor():
+    global _executor, _executor_pid
+    if _executor is None or _executor_pid != os.getpid():
+        with _executor_lock:
+            if _executor is None or _executor_pid != os.getpid():
+                _executor     = ThreadPoolExecutor(
+                    max_workers=JOB_WORKERS, thread_name_prefix="job"
+                )
+                _executor_pid = os.getpid()
+    return _executor
+
+def _set_status(job_id, status, error=None):
+    conn = get_connection()
+    cur  = conn.cursor()
+    cur.execute(
+        """UPDATE jobs SET status = %s, error = %s,
+                  finished = CASE WHEN %s IN ('done', 'failed') THEN NOW() END
+           WHERE id = %s""",
+        (status, error, status, job_id)
+    )
+    conn.commit()
+    cur.close()
+    conn.close()
+
+def _run(job_id, kind, fn, args):
+    try:
+        _set_status(job_id, "running")
+        try:
+            with span("job", kind=kind):
+                fn(*args)
+        except Exception:
+            inc("jobs_total", kind=kind, status="failed")
+            _set_status(job_id, "failed", traceback.format_exc(limit=5))
+            return
+        inc("jobs_total", kind=kind, status="done")
+        _set_status(job_id, "done")
+    finally:
+        # Executor threads live on: hand back anything a failed job left open
+        release_connections()
+
+# ─── Submit Job ──────────────────────────────────────────
+def submit(user_id, kind, fn, *args):
+    """
+    Records a queued job and runs fn(*args) on the worker pool.
+    Returns the job id so the caller can poll its status.
+    """
+    conn = get_connection()
+    cur  = conn.cursor()
+    try:
+        cur.execute(
+            "INSERT INTO jobs (user_id, kind) VALUES (%s, %s) RETURNING id",
+            (user_id, kind)
+        )
+        job_id = cur.fetchone()["id"]
+        conn.commit()
+    finally:
+        cur.close()
+        conn.close()
+
+    _get_executor().submit(_run, job_id, kind, fn, args)
+    return job_id
+
+# ─── Job Status ──────────────────────────────────────────
+def get_status(job_id, user_id):
+    conn = get_connection()
+    cur  = conn.cursor()
+    cur.execute(
+        """SELECT id, kind, status, error, created, finished FROM jobs
+           WHERE id = %s AND user_id = %s""",
+        (job_id, user_id)
+    )
+    job = cur.fetchone()
+    cur.close()
+    conn.close()
+    return job
@@ -0,0 +1,158 @@
+import os
+import time
+import random
+import cProfile
+import threading
+import contextvars
+from contextlib import contextmanager
+
+# ─── Registry ────────────────────────────────────────────
+# Plain in-process metrics, rendered in Prometheus text format by /metrics.
+# Each gunicorn worker keeps its own; scrape per worker or aggregate upstream.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+_lock       = threading.Lock()
+_histograms = {}   # (name, labels) -> [bucket counts..., sum, count]
+_counters   = {}   # (name, labels) -> value
+
+# Per-request trace: every span inside a request is also recorded here
+_trace = contextvars.ContextVar("trace", default=None)
+
+def _labels(labels):
+    return tuple(sorted(labels.items()))
+
+def observe(name, value, **labels):
+    key = (name, _labels(labels))
+    with _lock:
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = _histograms[key] = [0] * len(BUCKETS) + [0.0, 0]
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                hist[i] += 1
+        hist[-2] += value
+        hist[-1] += 1
+
+def inc(name, amount=1, **labels):
+    key = (name, _labels(labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+def total(name, **labels):
+    """
+    Sum of counter `name` over every label set that includes `labels`.
+    """
+    wanted = set(labels.items())
+    with _lock:
+        return sum(value for (counter, key), value in _counters.items()
+                   if counter == name and wanted <= set(key))
+
+# ─── Spans ───────────────────────────────────────────────
+@contextmanager
+def span(_name, **labels):
+    """
+    Times a block into the `<name>_seconds` histogram and the current
+    request's trace.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        observe(f"{_name}_seconds", elapsed, **labels)
+        trace = _trace.get()
+        if trace is not None:
+            trace.append((_name, labels, elapsed))
+
+def start_trace():
+    return _trace.set([])
+
+def end_trace(token):
+    trace = _trace.get() or []
+    _trace.reset(token)
+    return trace
+
+# ─── Request Hooks ───────────────────────────────────────
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", 0))
+PROFILE_DIR         = os.environ.get("PROFILE_DIR", "profiles")
+
+def record_request(route, method, status, elapsed, trace):
+    observe("http_request_seconds", elapsed, route=route, method=method)
+    inc("http_requests_total", route=route, method=method, status=str(status))
+    # A count, not seconds, but the buckets still give a usable distribution
+    queries = sum(1 for name, _, _ in trace if name == "db")
+    observe("db_queries_per_request", queries, route=route)
+
+def maybe_profile():
+    """
+    Returns a running profiler for a sampled request (PROFILE_SAMPLE_RATE).
+    """
+    if PROFILE_SAMPLE_RATE and random.random() < PROFILE_SAMPLE_RATE:
+        profiler = cProfile.Profile()
+        profiler.enable()
+        return profiler
+    return None
+
+def save_profile(profiler, route):
+    profiler.disable()
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    name = route.strip("/").replace("/", "_").replace("<", "").replace(">", "") or "index"
+    profiler.dump_stats(os.path.join(
+        PROFILE_DIR, f"{int(time.time() * 1000)}-{os.getpid()}-{name}.prof"
+    ))
+
+def install(app):
+    """
+    Times every Flask request and optionally profiles a sample of them.
+    """
+    from flask import g, request
+
+    @app.before_request
+    def _start_request():
+        g.metrics_start    = time.perf_counter()
+        g.metrics_trace    = start_trace()
+        g.metrics_profiler = maybe_profile()
+
+    @app.teardown_request
+    def _end_request(exc):
+        if "metrics_start" not in g:
+            return
+        elapsed = time.perf_counter() - g.metrics_start
+        trace   = end_trace(g.metrics_trace)
+        route   = request.url_rule.rule if request.url_rule else "unmatched"
+        status  = 500 if exc else getattr(g, "metrics_status", 200)
+        record_request(route, request.method, status, elapsed, trace)
+        if g.metrics_profiler:
+            save_profile(g.metrics_profiler, route)
+
+    @app.after_request
+    def _remember_status(response):
+        g.metrics_status = response.status_code
+        return response
+
+# ─── Exposition ──────────────────────────────────────────
+def _fmt(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+def render(gauges=None):
+    """
+    Prometheus text format. `gauges` is a list of (name, labels dict, value).
+    """
+    lines = []
+    with _lock:
+        histograms = {k: list(v) for k, v in _histograms.items()}
+        counters   = dict(_counters)
+
+    for (name, labels), hist in sorted(histograms.items()):
+        for i, bound in enumerate(BUCKETS):
+            lines.append(f"{name}_bucket{_fmt(labels + (('le', bound),))} {hist[i]}")
+        lines.append(f"{name}_bucket{_fmt(labels + (('le', '+Inf'),))} {hist[-1]}")
+        lines.append(f"{name}_sum{_fmt(labels)} {hist[-2]:.6f}")
+        lines.append(f"{name}_count{_fmt(labels)} {hist[-1]}")
+    for (name, labels), value in sorted(counters.items()):
+        lines.append(f"{name}{_fmt(labels)} {value}")
+    for name, labels, value in gauges or []:
+        lines.append(f"{name}{_fmt(_labels(labels))} {value}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,227 @@
+import time
+import random
+import asyncio
+import threading
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from contextlib import contextmanager, asynccontextmanager
+
+class Saturated(Exception):
+    """
+    A limiter couldn't admit the call within its timeout.
+    """
+
+# ─── Backoff ─────────────────────────────────────────────
+def retry_after_seconds(value):
+    """
+    Seconds to wait from a Retry-After header, in either of its forms
+    (delta-seconds or an HTTP date), or None if it can't be read.
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+def backoff_delay(attempt, base=0.5, cap=8.0, retry_after=None):
+    """
+    Full-jitter exponential backoff; honours a server Retry-After if given.
+    """
+    seconds = retry_after_seconds(retry_after)
+    if seconds is not None:
+        return min(seconds, cap)
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+# ─── Token Bucket ────────────────────────────────────────
+class TokenBucket:
+    """
+    Allows `rate` calls per `per` seconds with bursts up to `capacity`.
+    """
+    def __init__(self, rate, per=60.0, capacity=None):
+        self.rate     = rate / per
+        self.capacity = capacity or max(1, rate)
+        self.tokens   = self.capacity
+        self.updated  = time.monotonic()
+        self._lock    = threading.Lock()
+
+    def _take(self):
+        """
+        Takes a token if one is free, else returns seconds until one is.
+        """
+        with self._lock:
+            now          = time.monotonic()
+            self.tokens  = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.rate
+
+    def acquire(self, timeout=None):
+        """
+        Waits for a token; raises Saturated if none is free within `timeout`.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self._take()
+            if not wait:
+                return
+            if deadline is not None and time.monotonic() + wait > deadline:
+                raise Saturated("rate limit: no token free in time")
+            time.sleep(wait)
+
+    async def acquire_async(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self._take()
+            if not wait:
+                return
+            if deadline is not None and time.monotonic() + wait > deadline:
+                raise Saturated("rate limit: no token free in time")
+            await asyncio.sleep(wait)
+
+# ─── Circuit Breaker ─────────────────────────────────────
+class CircuitOpen(Exception):
+    pass
+
+class CircuitBreaker:
+    """
+    Opens after `threshold` consecutive failures and fails fast for
+    `reset_after` seconds, then lets one trial call through (half-open).
+    A trial that never reports back frees its place after `reset_after`.
+    """
+    def __init__(self, threshold=5, reset_after=30.0):
+        self.threshold   = threshold
+        self.reset_after = reset_after
+        self.failures    = 0
+        self.opened_at   = None
+        self.trial_at    = None
+        self._lock       = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_after:
+            return "half-open"
+        return "open"
+
+    def check(self):
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return
+            now = time.monotonic()
+            if state == "half-open" and (self.trial_at is None
+                                         or now - self.trial_at >= self.reset_after):
+                self.trial_at = now
+                return
+        raise CircuitOpen("LLM circuit is open")
+
+    def record_success(self):
+        with self._lock:
+            self.failures  = 0
+            self.opened_at = None
+            self.trial_at  = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.threshold or self.opened_at is not None:
+                self.opened_at = time.monotonic()
+                self.trial_at  = None
+
+# ─── Concurrency Limiter ─────────────────────────────────
+class ConcurrencyLimiter:
+    """
+    A global cap on in-flight calls plus a smaller cap per user.
+    Threads use slot(); coroutines use slot_async(). Both raise
+    Saturated if no slot frees up within `timeout`. A user's semaphore
+    only exists while they have calls running or waiting.
+    """
+    def __init__(self, total, per_user):
+        self.total        = total
+        self.per_user     = per_user
+        self._global      = threading.BoundedSemaphore(total)
+        self._users       = {}      # user_id -> [semaphore, holders + waiters]
+        self._async       = None
+        self._async_users = {}
+        self._lock        = threading.Lock()
+
+    def _join(self, users, user_id, make):
+        with self._lock:
+            entry = users.get(user_id)
+            if entry is None:
+                entry = users[user_id] = [make(self.per_user), 0]
+            entry[1] += 1
+            return entry[0]
+
+    def _leave(self, users, user_id):
+        with self._lock:
+            entry = users[user_id]
+            entry[1] -= 1
+            if not entry[1]:
+                del users[user_id]
+
+    @contextmanager
+    def slot(self, user_id=None, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        def remaining():
+            return None if deadline is None else max(0.0, deadline - time.monotonic())
+
+        if user_id is not None:
+            user = self._join(self._users, user_id, threading.BoundedSemaphore)
+            if not user.acquire(timeout=remaining()):
+                self._leave(self._users, user_id)
+                raise Saturated("too many LLM calls in flight for this user")
+        try:
+            if not self._global.acquire(timeout=remaining()):
+                raise Saturated("too many LLM calls in flight")
+            try:
+                yield
+            finally:
+                self._global.release()
+        finally:
+            if user_id is not None:
+                user.release()
+                self._leave(self._users, user_id)
+
+    @asynccontextmanager
+    async def slot_async(self, user_id=None, timeout=None):
+        if self._async is None:
+            self._async = asyncio.Semaphore(self.total)
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        async def acquire(semaphore, message):
+            try:
+                remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+                await asyncio.wait_for(semaphore.acquire(), remaining)
+            except asyncio.TimeoutError:
+                raise Saturated(message) from None
+
+        if user_id is not None:
+            user = self._join(self._async_users, user_id, asyncio.Semaphore)
+            try:
+                await acquire(user, "too many LLM calls in flight for this user")
+            except Saturated:
+                self._leave(self._async_users, user_id)
+                raise
+        try:
+            await acquire(self._async, "too many LLM calls in flight")
+            try:
+                yield
+            finally:
+                self._async.release()
+        finally:
+            if user_id is not None:
+                user.release()
+                self._leave(self._async_users, user_id)
@@ -0,0 +1,78 @@
+import re
+from embeddings import nearest
+from markupsafe import Markup, escape
+
+# ts_headline wraps matches in these; they are swapped for <mark> after escaping
+HIGHLIGHT_START = "\x01"
+HIGHLIGHT_STOP  = "\x02"
+
+# ─── Build Query ─────────────────────────────────────────
+def build_tsquery(text):
+    """
+    Turns free text into a prefix-matching tsquery string,
+    e.g. "work stre" -> "work:* & stre:*". Returns None if nothing usable.
+    """
+    words = re.findall(r"\w+", text.lower())
+    if not words:
+        return None
+    return " & ".join(f"{word}:*" for word in words)
+
+# ─── Search Notes ────────────────────────────────────────
+def search_notes(cur, user_id, text, limit=50):
+    """
+    Ranked full-text search over a user's notes with highlighted snippets.
+    Only the top `limit` rows get a headline, since ts_headline is costly.
+    """
+    tsquery = build_tsquery(text)
+    if not tsquery:
+        return []
+
+    cur.execute(
+        """SELECT id, title, created,
+                  ts_headline('english', content, to_tsquery('english', %(q)s),
+                      'StartSel=' || %(start)s || ', StopSel=' || %(stop)s ||
+                      ', MaxFragments=2, MaxWords=20, MinWords=8') AS snippet
+           FROM (
+               SELECT id, title, content, created,
+                      ts_rank(search_vector, to_tsquery('english', %(q)s)) AS rank
+               FROM notes
+               WHERE user_id = %(user_id)s
+                 AND search_vector @@ to_tsquery('english', %(q)s)
+               ORDER BY rank DESC, created DESC
+               LIMIT %(limit)s
+           ) ranked
+           ORDER BY rank DESC, created DESC""",
+        {"q": tsquery, "user_id": user_id, "limit": limit,
+         "start": HIGHLIGHT_START, "stop": HIGHLIGHT_STOP}
+    )
+    notes = [dict(row) for row in cur.fetchall()]
+    for note in notes:
+        note["snippet"] = highlight(note["snippet"])
+    return notes
+
+def highlight(snippet):
+    """
+    Escapes the note text, then turns the match sentinels into <mark> tags.
+    """
+    safe = str(escape(snippet))
+    safe = safe.replace(HIGHLIGHT_START, "<mark>").replace(HIGHLIGHT_STOP, "</mark>")
+    return Markup(safe)
+
+# ─── Semantic Search ─────────────────────────────────────
+def semantic_search(cur, user_id, text, limit=20, preview_len=200):
+    """
+    The user's notes closest in meaning to `text` (see embeddings.py),
+    best first, shaped like the homepage listing.
+    """
+    ranked = nearest(cur, user_id, text, limit)
+    if not ranked:
+        return []
+    cur.execute(
+        """SELECT id, title, created, revision, LEFT(content, %s) AS preview,
+                  LENGTH(content) > %s AS truncated
+           FROM notes
+           WHERE id = ANY(%s) AND user_id = %s""",
+        (preview_len, preview_len, [note_id for note_id, _ in ranked], user_id)
+    )
+    notes = {row["id"]: row for row in cur.fetchall()}
+    return [notes[note_id] for note_id, _ in ranked if note_id in notes]
@@ -0,0 +1,25 @@
+import numpy as np
+
+from cache import LRUCache, sizeof
+
+def test_sizeof_counts_array_buffers():
+    matrix = np.zeros((100, 512), dtype=np.float32)
+    assert sizeof(matrix) == 100 * 512 * 4
+    assert sizeof((("v", 1), np.zeros(10, dtype=np.int64), matrix)) >= 80 + 100 * 512 * 4
+
+def test_lru_evicts_by_bytes():
+    cache = LRUCache("test", maxsize=100, maxbytes=250_000)
+    for user_id in range(3):
+        cache.set(user_id, (user_id, np.zeros((50, 512), dtype=np.float32)))
+    assert cache.get(0) is None
+    assert cache.get(2) is not None
+    assert cache.stats()["bytes"] <= 250_000
+
+def test_lru_evicts_least_recently_used():
+    cache = LRUCache("test", maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
@@ -0,0 +1,19 @@
+from chat_archive import pack, unpack, merge_messages
+
+def message(id, created, content="hi"):
+    return {"id": id, "role": "user", "content": content, "created": created}
+
+def test_pack_round_trip():
+    messages = [message(1, "2026-01-05T20:00:00", "héllo")]
+    assert unpack(pack(messages)) == messages
+
+def test_merge_keeps_earlier_messages():
+    earlier = [message(1, "2026-01-05T20:00:00"), message(2, "2026-01-05T20:05:00")]
+    later   = [message(3, "2026-01-05T19:00:00")]
+    assert [m["id"] for m in merge_messages(earlier, later)] == [3, 1, 2]
+
+def test_merge_dedupes_by_id():
+    earlier = [message(1, "2026-01-05T20:00:00", "old")]
+    later   = [message(1, "2026-01-05T20:00:00", "new"), message(2, "2026-01-05T20:01:00")]
+    merged  = merge_messages(earlier, later)
+    assert [(m["id"], m["content"]) for m in merged] == [(1, "new"), (2, "hi")]
@@ -0,0 +1,265 @@
+import asyncio
+from collections import Counter
+
+import pytest
+
+import chat_engine
+from ai import ConversationContext, CONTEXT_WINDOW, SUMMARY_BATCH
+from chat_engine import ChatTurnEngine, GroqBackend, PERSONA_EVERY_N_MESSAGES
+
+# Per turn: LLM calls by kind, and store round trips. Each store call is
+# one statement (begin, reply) or one batched transaction (follow-up)
+# in PostgresStore. Raise a budget only on purpose.
+BUDGETS = {
+    "onboarding":          ({"reply": 1}, 2),
+    "onboarding complete": ({"reply": 1, "extract_persona": 1}, 3),
+    "first journal turn":  ({"reply": 1, "write_journal": 1}, 3),
+    "journal append":      ({"reply": 1, "append_journal": 1}, 3),
+    "session wrap-up":     ({"reply": 1, "append_journal": 1, "extract_persona": 1}, 3),
+    "compaction":          ({"reply": 1, "summarize": 1, "append_journal": 1}, 3),
+}
+
+# ─── Stubbed Groq ────────────────────────────────────────
+class StubAI:
+    """
+    Replaces the ai.py functions GroqBackend calls; counts every call.
+    """
+    def __init__(self, monkeypatch):
+        self.calls = Counter()
+        self.next  = "Tell me more about that."
+        stubs = {
+            "get_ai_response":          self.reply,
+            "stream_ai_response":       self.stream,
+            "get_ai_response_async":    self.reply_async,
+            "summarize_conversation":   self.summarize,
+            "extract_persona":          self.extract_persona,
+            "create_or_update_journal": self.write_journal,
+            "update_journal":           self.append_journal,
+        }
+        for name, stub in stubs.items():
+            monkeypatch.setattr(chat_engine, name, stub)
+
+    def reply(self, messages, persona, has_history):
+        self.calls["reply"] += 1
+        return self.next
+
+    def stream(self, messages, persona, has_history):
+        self.calls["reply"] += 1
+        for i in range(0, len(self.next), 5):
+            yield self.next[i:i + 5]
+
+    async def reply_async(self, messages, persona, has_history):
+        return self.reply(messages, persona, has_history)
+
+    def summarize(self, summary, messages, user_id):
+        self.calls["summarize"] += 1
+        return "They talked about work and running."
+
+    def extract_persona(self, messages, user_id=None):
+        self.calls["extract_persona"] += 1
+        return {"goals": "run more", "habits": "morning runs", "summary": "A runner."}
+
+    def write_journal(self, messages, persona):
+        self.calls["write_journal"] += 1
+        return "A Day", "Today I talked about work."
+
+    def append_journal(self, messages, persona, title, content):
+        self.calls["append_journal"] += 1
+        self.appended = messages
+        return "Later I felt calmer."
+
+# ─── In-memory Store ─────────────────────────────────────
+class MemoryStore:
+    """
+    PostgresStore's interface over plain dicts; counts round trips and
+    keeps what each follow-up wrote.
+    """
+    def __init__(self):
+        self.persona = {"user_id": 1, "onboarded": False, "pending_messages": 0,
+                        "stale": False, "goals": None, "habits": None, "summary": None}
+        self.chats   = []
+        self.summary = ("", 0)
+        self.journal = None
+        self.trips   = Counter()
+        self.writes  = []
+
+    def add_chat(self, role, content):
+        self.chats.append({"id": len(self.chats) + 1, "role": role, "content": content})
+        return self.chats[-1]["id"]
+
+    def begin_turn(self, user_id, user_message):
+        self.trips["begin"] += 1
+        summary, through_id = self.summary
+        messages = [dict(m) for m in self.chats if m["id"] > through_id]
+        context  = ConversationContext(messages, summary, through_id,
+                                       dict(self.journal) if self.journal else None)
+        context.append("user", user_message, self.add_chat("user", user_message))
+        return dict(self.persona), context
+
+    def save_reply(self, user_id, ai_reply):
+        self.trips["reply"] += 1
+        return self.add_chat("assistant", ai_reply)
+
+    def save_followup(self, user_id, context, updates):
+        self.writes.append(sorted(updates))
+        if not updates:
+            return
+        self.trips["followup"] += 1
+        if updates.get("summary"):
+            self.summary = (context.summary, context.through_id)
+        if "onboarded" in updates:
+            self.persona.update(updates["onboarded"], onboarded=True)
+        if "persona" in updates:
+            self.persona.update(updates["persona"], pending_messages=0)
+        if updates.get("pending"):
+            self.persona["pending_messages"] += 1
+        if "journal_create" in updates:
+            title, content, through_id = updates["journal_create"]
+            self.journal = {"title": title, "content": content, "through_chat_id": through_id}
+        if "journal_append" in updates:
+            _, through_id, addition = updates["journal_append"]
+            self.journal["content"] += "\n\n" + addition
+            self.journal["through_chat_id"] = through_id
+
+def run_inline(user_id, kind, fn, *args):
+    fn(*args)
+    return None
+
+@pytest.fixture
+def turn(monkeypatch):
+    ai     = StubAI(monkeypatch)
+    store  = MemoryStore()
+    engine = ChatTurnEngine(store=store, llm=GroqBackend(), submit=run_inline)
+
+    def run(reply, message="Work was busy, but I went for a run."):
+        ai.calls.clear()
+        store.trips.clear()
+        ai.next = reply
+        result  = engine.run(1, message)
+        return result, dict(ai.calls), sum(store.trips.values())
+
+    run.ai, run.store, run.engine = ai, store, engine
+    return run
+
+def assert_budget(name, calls, trips):
+    llm_budget, trip_budget = BUDGETS[name]
+    assert calls == llm_budget, name
+    assert trips <= trip_budget, name
+
+# ─── Per-turn Cost ───────────────────────────────────────
+def test_day_of_turns_stays_in_budget(turn):
+    result, calls, trips = turn("What are your main goals right now?")
+    assert_budget("onboarding", calls, trips)
+
+    result, calls, trips = turn("Thanks for sharing! [ONBOARDING_COMPLETE]")
+    assert_budget("onboarding complete", calls, trips)
+    assert result["reply"] == "Thanks for sharing!"
+    assert turn.store.persona["onboarded"]
+
+    _, calls, trips = turn("How did the run feel?")
+    assert_budget("first journal turn", calls, trips)
+    assert turn.store.journal["title"] == "A Day"
+
+    _, calls, trips = turn("What made work so busy?")
+    assert_budget("journal append", calls, trips)
+
+    result, calls, trips = turn("Sleep well. [JOURNAL_READY]")
+    assert_budget("session wrap-up", calls, trips)
+    assert result == {"reply": "Sleep well.", "journal_saved": True, "job_id": None}
+    assert turn.store.persona["pending_messages"] == 0
+
+def test_compaction_turn(turn):
+    turn.store.persona.update(onboarded=True)
+    turn("Hi!")
+    for i in range(CONTEXT_WINDOW + SUMMARY_BATCH):
+        turn.store.add_chat("user" if i % 2 else "assistant", f"Earlier message {i}")
+    _, calls, trips = turn("Tell me more about that.")
+    assert_budget("compaction", calls, trips)
+    assert turn.store.summary[0] == "They talked about work and running."
+
+def journal_through(store, chat_id):
+    store.journal = {"title": "A Day", "content": "Ran 10k.", "through_chat_id": chat_id}
+
+def test_compaction_keeps_unjournaled_messages(turn):
+    store = turn.store
+    store.persona.update(onboarded=True)
+    for i in range(CONTEXT_WINDOW + SUMMARY_BATCH):
+        store.add_chat("user" if i % 2 else "assistant", f"Earlier message {i}")
+    journal_through(store, 2)
+    turn("Tell me more about that.")
+    assert store.summary[1] > 2
+    assert [m["id"] for m in turn.ai.appended][0] == 3
+    assert store.journal["through_chat_id"] == store.chats[-1]["id"]
+
+def test_journal_behind_the_summary_gets_it(turn):
+    store = turn.store
+    store.persona.update(onboarded=True)
+    for i in range(6):
+        store.add_chat("user" if i % 2 else "assistant", f"Earlier message {i}")
+    store.summary = ("They ran 10k before work.", 4)
+    journal_through(store, 2)
+    turn("Tell me more about that.")
+    first = turn.ai.appended[0]
+    assert first["role"] == "system" and "They ran 10k before work." in first["content"]
+    assert [m["id"] for m in turn.ai.appended[1:]][0] == 5
+
+def test_onboarding_turn_writes_nothing_in_the_background(turn):
+    turn("What are your main goals right now?")
+    assert turn.store.writes == []
+
+def test_persona_extraction_is_coalesced(turn):
+    turn.store.persona.update(onboarded=True)
+    extractions = 0
+    for _ in range(PERSONA_EVERY_N_MESSAGES * 2):
+        _, calls, _ = turn("Go on.")
+        extractions += calls.get("extract_persona", 0)
+    assert extractions == 2
+
+# ─── Other Transports ────────────────────────────────────
+def test_stream_holds_markers_back_and_costs_the_same(turn):
+    store = turn.store
+    store.persona.update(onboarded=True)
+    turn.ai.next = "Sleep well. [JOURNAL_READY]"
+    persona, context = turn.engine.begin(1, "Good night")
+    events = list(turn.engine.stream(1, persona, context))
+
+    text = "".join(data for kind, data in events if kind == "delta")
+    assert text == "Sleep well. "
+    assert events[-1] == ("done", {"journal_saved": True, "job_id": None})
+    assert turn.ai.calls == {"reply": 1, "write_journal": 1, "extract_persona": 1}
+    assert sum(store.trips.values()) == 3
+
+def test_async_turn_matches_sync(turn):
+    turn.store.persona.update(onboarded=True)
+    turn.ai.next = "How did the run feel?"
+    result = asyncio.run(turn.engine.run_async(1, "I ran 5k."))
+    assert result["reply"] == "How did the run feel?"
+    assert turn.ai.calls == {"reply": 1, "write_journal": 1}
+    assert sum(turn.store.trips.values()) == 3
+
+# ─── Postgres Store ──────────────────────────────────────
+class ClosingConnection:
+    def __init__(self):
+        self.closed = False
+
+    def cursor(self):
+        return self
+
+    def commit(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+@pytest.mark.parametrize("step, args", [("begin_turn", (1, "Hi")), ("save_reply", (1, "Hello"))])
+def test_store_returns_its_connection_when_a_query_fails(monkeypatch, step, args):
+    conn = ClosingConnection()
+
+    def fail(*args):
+        raise RuntimeError("statement failed")
+
+    monkeypatch.setattr(chat_engine, "get_connection", lambda: conn)
+    monkeypatch.setattr(chat_engine.chat_store, step, fail)
+    with pytest.raises(RuntimeError):
+        getattr(chat_engine.PostgresStore(), step)(*args)
+    assert conn.closed
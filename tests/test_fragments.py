@@ -0,0 +1,65 @@
+import pytest
+
+from fragments import format_body
+
+# ─── Escaping ────────────────────────────────────────────
+def test_script_is_escaped():
+    assert format_body("<script>alert(1)</script>") == \
+        "<p>&lt;script&gt;alert(1)&lt;/script&gt;</p>"
+
+@pytest.mark.parametrize("text", [
+    '" onmouseover="alert(1)',
+    "' onclick='alert(1)",
+    '**" autofocus onfocus="alert(1)**',
+    '# <img src=x onerror="alert(1)">',
+    '- <a href="javascript:alert(1)">x</a>',
+])
+def test_no_markup_survives_from_the_text(text):
+    html = format_body(text)
+    assert "<img" not in html and "<a " not in html
+    assert '"' not in html and "'" not in html
+
+def test_markers_inside_escaped_text():
+    assert format_body("**a < b** & *c > d*") == \
+        "<p><strong>a &lt; b</strong> &amp; <em>c &gt; d</em></p>"
+
+# ─── Blocks ──────────────────────────────────────────────
+def test_paragraphs_and_line_breaks():
+    assert format_body("one\ntwo\r\n\r\nthree") == "<p>one<br>two</p>\n<p>three</p>"
+
+def test_lists():
+    assert format_body("- run\n* read\n  - rest") == \
+        "<ul><li>run</li><li>read</li><li>rest</li></ul>"
+
+def test_star_then_space_starts_a_list():
+    assert format_body("* walk\n*stretch*") == "<p>* walk<br><em>stretch</em></p>"
+    assert format_body("* walk\n* stretch") == "<ul><li>walk</li><li>stretch</li></ul>"
+
+def test_mixed_block_is_a_paragraph():
+    assert format_body("- run\nthen rest") == "<p>- run<br>then rest</p>"
+
+@pytest.mark.parametrize("text, html", [
+    ("# Today",       "<h2>Today</h2>"),
+    ("### Today",     "<h4>Today</h4>"),
+    ("#### Today",    "<p>#### Today</p>"),
+    ("#Today",        "<p>#Today</p>"),
+    ("# Today\nRan.", "<h2>Today</h2>\n<p>Ran.</p>"),
+])
+def test_headings(text, html):
+    assert format_body(text) == html
+
+# ─── Emphasis ────────────────────────────────────────────
+@pytest.mark.parametrize("text, html", [
+    ("**bold**",        "<strong>bold</strong>"),
+    ("*it*",            "<em>it</em>"),
+    ("***both***",      "<strong><em>both</em></strong>"),
+    ("**a *b* c**",     "<strong>a <em>b</em> c</strong>"),
+    ("**a *b** c*",     "<strong>a *b</strong> c*"),
+    ("2 * 3 * 4",       "2 * 3 * 4"),
+    ("a*b*c",           "a*b*c"),
+    ("a ** b",          "a ** b"),
+    ("`**raw**`",       "<code>**raw**</code>"),
+    ("**a** `b` *c*",   "<strong>a</strong> <code>b</code> <em>c</em>"),
+])
+def test_emphasis(text, html):
+    assert format_body(text) == f"<p>{html}</p>"
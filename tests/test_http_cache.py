@@ -0,0 +1,82 @@
+import os
+
+import pytest
+
+import app as notes_app
+from http_cache import static_version
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setitem(notes_app.app.config, "TESTING", True)
+    monkeypatch.setattr(notes_app.app, "secret_key", "test")
+    return notes_app.app.test_client()
+
+# ─── Static Files ────────────────────────────────────────
+def static_file():
+    return sorted(os.listdir(notes_app.app.static_folder))[0]
+
+def test_current_static_version_is_immutable(client):
+    name    = static_file()
+    version = static_version(notes_app.app.static_folder, name)
+    response = client.get(f"/static/{name}?v={version}")
+    assert response.cache_control.immutable
+    assert response.cache_control.max_age > 0
+
+def test_other_static_version_is_not_pinned(client):
+    response = client.get(f"/static/{static_file()}?v=000000000000")
+    assert response.status_code == 200
+    assert not response.cache_control.immutable
+
+# ─── Note Listing ────────────────────────────────────────
+class VersionCursor:
+    """
+    Answers the listing's version query from `version`; no notes.
+    """
+    def __init__(self, version):
+        self.version = version
+        self.sql     = []
+
+    def execute(self, sql, params=None):
+        self.sql.append(sql)
+
+    def fetchone(self):
+        return dict(self.version)
+
+    def fetchall(self):
+        return []
+
+    def close(self):
+        pass
+
+class VersionConnection:
+    def __init__(self, cur):
+        self.cur = cur
+
+    def cursor(self):
+        return self.cur
+
+    def close(self):
+        pass
+
+def listing_etag(client, monkeypatch, url, version):
+    cur = VersionCursor(version)
+    monkeypatch.setattr(notes_app, "get_connection", lambda: VersionConnection(cur))
+    monkeypatch.setattr(notes_app, "semantic_search", lambda *args, **kw: [])
+    monkeypatch.setattr(notes_app, "search_notes", lambda *args, **kw: [])
+    with client.session_transaction() as session:
+        session["user_id"] = 1
+    response = client.get(url)
+    assert response.status_code == 200
+    return response.get_etag()[0], cur.sql[0]
+
+def test_semantic_etag_follows_embeddings(client, monkeypatch):
+    notes  = {"n": 3, "updated": None}
+    url    = "/?q=running&mode=semantic"
+    before, sql = listing_etag(client, monkeypatch, url, {**notes, "embedded": 0, "embedded_at": None})
+    after, _    = listing_etag(client, monkeypatch, url, {**notes, "embedded": 3, "embedded_at": None})
+    assert "note_embeddings" in sql
+    assert before != after
+
+def test_keyword_etag_skips_embeddings(client, monkeypatch):
+    _, sql = listing_etag(client, monkeypatch, "/?q=running", {"n": 3, "updated": None})
+    assert "note_embeddings" not in sql
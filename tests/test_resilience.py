@@ -0,0 +1,84 @@
+import time
+import asyncio
+import threading
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from resilience import (TokenBucket, CircuitBreaker, CircuitOpen, ConcurrencyLimiter,
+                        Saturated, backoff_delay, retry_after_seconds)
+
+# ─── Backoff ─────────────────────────────────────────────
+def test_retry_after_seconds_and_dates():
+    assert retry_after_seconds("3") == 3.0
+    later = datetime.now(timezone.utc) + timedelta(seconds=5)
+    assert 3 < retry_after_seconds(format_datetime(later, usegmt=True)) <= 5
+    assert retry_after_seconds("soon") is None
+
+def test_backoff_honours_retry_after_date_within_cap():
+    later = datetime.now(timezone.utc) + timedelta(seconds=60)
+    assert backoff_delay(0, cap=8.0, retry_after=format_datetime(later, usegmt=True)) == 8.0
+    assert 0 <= backoff_delay(0, retry_after="not a date") <= 0.5
+
+# ─── Token Bucket ────────────────────────────────────────
+def test_token_bucket_times_out():
+    bucket = TokenBucket(1, per=60.0)
+    bucket.acquire(timeout=0.1)
+    with pytest.raises(Saturated):
+        bucket.acquire(timeout=0.1)
+
+# ─── Circuit Breaker ─────────────────────────────────────
+def test_half_open_admits_one_trial():
+    breaker = CircuitBreaker(threshold=1, reset_after=0.05)
+    breaker.record_failure()
+    with pytest.raises(CircuitOpen):
+        breaker.check()
+    time.sleep(0.06)
+    breaker.check()
+    with pytest.raises(CircuitOpen):
+        breaker.check()
+    breaker.record_success()
+    breaker.check()
+    breaker.check()
+
+def test_failed_trial_reopens():
+    breaker = CircuitBreaker(threshold=1, reset_after=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    breaker.check()
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+# ─── Concurrency Limiter ─────────────────────────────────
+def test_slot_times_out_and_forgets_idle_users():
+    limiter = ConcurrencyLimiter(total=4, per_user=1)
+    held    = threading.Event()
+    done    = threading.Event()
+
+    def hold():
+        with limiter.slot(7):
+            held.set()
+            done.wait()
+
+    thread = threading.Thread(target=hold)
+    thread.start()
+    held.wait()
+    with pytest.raises(Saturated):
+        with limiter.slot(7, timeout=0.05):
+            pass
+    done.set()
+    thread.join()
+    assert limiter._users == {}
+
+def test_async_slot_times_out():
+    limiter = ConcurrencyLimiter(total=1, per_user=1)
+
+    async def main():
+        async with limiter.slot_async(1):
+            with pytest.raises(Saturated):
+                async with limiter.slot_async(2, timeout=0.05):
+                    pass
+        assert limiter._async_users == {}
+
+    asyncio.run(main())
@@ -0,0 +1,114 @@
+import io
+import json
+import zipfile
+
+import pytest
+from datetime import date, datetime
+
+import transfer
+from chat_archive import pack
+
+# ─── Fake Connection ─────────────────────────────────────
+# Just enough of a psycopg2 connection for export_records: each query
+# is answered from ROWS by the table it reads.
+ROWS = {
+    "daily_journals": [{"date": date(2026, 1, 5), "note_id": 7, "through_chat_id": 2}],
+    "notes":          [{"id": 7, "title": "A Day", "content": "Ran 10k.",
+                        "created": datetime(2026, 1, 5, 21, 0)}],
+    "chat_archives":  [{"date": date(2026, 1, 5), "messages": pack([
+        {"id": 1, "role": "assistant", "content": "How was today?",
+         "created": "2026-01-05T20:00:00"},
+        {"id": 2, "role": "user", "content": "I ran 10k.",
+         "created": "2026-01-05T20:01:00"},
+    ])}],
+    "chats":          [{"id": 3, "role": "user", "content": "Rest day.",
+                        "created": datetime(2026, 10, 1, 9, 30)}],
+}
+
+class FakeCursor:
+    def __init__(self):
+        self.rows = []
+
+    def execute(self, sql, params=None):
+        self.rows = next((rows for table, rows in ROWS.items()
+                          if f"FROM {table}" in sql), [])
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def close(self):
+        pass
+
+class FakeConnection:
+    def cursor(self, name=None):
+        return FakeCursor()
+
+def export(fmt):
+    records = transfer.export_records(FakeConnection(), user_id=1)
+    return b"".join(transfer.chunked(transfer.WRITERS[fmt](records)))
+
+# ─── Export ──────────────────────────────────────────────
+def test_archived_chats_have_datetimes():
+    chats = [r for kind, r in transfer.export_records(FakeConnection(), 1) if kind == "chat"]
+    assert [c["id"] for c in chats] == [1, 2, 3]
+    assert all(isinstance(c["created"], datetime) for c in chats)
+
+def test_zip_export_includes_archived_day():
+    archive = zipfile.ZipFile(io.BytesIO(export("zip")))
+    names   = set(archive.namelist())
+    assert {"chats/2026-01-05.md", "chats/2026-10-01.md"} <= names
+    day = archive.read("chats/2026-01-05.md").decode()
+    assert "**Journal Bot** (20:00): How was today?" in day
+    assert "**You** (20:01): I ran 10k." in day
+    note = archive.read("notes/2026-01-05-a-day-7.md").decode()
+    assert "journal: 2026-01-05" in note
+
+def test_ndjson_export_round_trips_archived_chats():
+    lines = [json.loads(line) for line in export("ndjson").decode().splitlines()]
+    chats = [line for line in lines if line["type"] == "chat"]
+    assert chats[0]["created"] == "2026-01-05T20:00:00"
+
+# ─── Import ──────────────────────────────────────────────
+class ImportCursor:
+    """
+    Records statements; MAX(created) answers with the latest chat spooled.
+    """
+    def __init__(self, latest):
+        self.latest = latest
+        self.sql    = []
+
+    def execute(self, sql, params=None):
+        self.sql.append(sql)
+
+    def copy_expert(self, sql, f):
+        self.sql.append(sql)
+
+    def fetchone(self):
+        return {"latest": self.latest}
+
+    def close(self):
+        pass
+
+class ImportConnection:
+    def __init__(self, cur):
+        self.cur = cur
+
+    def cursor(self):
+        return self.cur
+
+    def close(self):
+        pass
+
+def test_import_rejects_chats_past_the_partition_horizon(monkeypatch):
+    horizon = transfer.partition_horizon()
+    cur     = ImportCursor(datetime.combine(horizon, datetime.min.time()))
+    monkeypatch.setattr(transfer, "get_connection", lambda: ImportConnection(cur))
+    record  = {"id": 1, "role": "user", "content": "Hi", "created": f"{horizon}T00:00:00"}
+    with pytest.raises(ValueError, match="dated"):
+        transfer.import_records(1, [("chat", record)])
+    assert not any("CREATE TABLE chats_p" in sql or "INSERT INTO" in sql for sql in cur.sql)
+
+def test_partition_horizon_is_past_the_precreated_months():
+    horizon = transfer.partition_horizon()
+    months  = (horizon.year - date.today().year) * 12 + horizon.month - date.today().month
+    assert months == transfer.PARTITIONS_AHEAD + 1
@@ -0,0 +1,399 @@
+import io
+import re
+import csv
+import json
+import zipfile
+import tempfile
+import itertools
+import psycopg2
+from datetime import date, datetime, timedelta
+from database import (get_connection, ensure_chat_partitions, chat_partitions, next_month,
+                      PARTITIONS_AHEAD)
+from chat_archive import unpack, write_archives, ARCHIVE_AFTER_DAYS, ARCHIVE_BATCH
+
+# ─── Export ──────────────────────────────────────────────
+# Everything is read through server-side cursors inside one read-only
+# REPEATABLE READ transaction (a consistent snapshot) and written out
+# as it arrives, in chunks of about EXPORT_CHUNK bytes.
+EXPORT_BATCH = 500
+EXPORT_CHUNK = 64 * 1024
+
+EXPORT_FORMATS = {
+    # format: (mimetype, file extension)
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "json":   ("application/json",     "json"),
+    "zip":    ("application/zip",      "zip"),
+}
+
+SECTIONS = {"journal": "journals", "note": "notes", "chat": "chats"}
+
+EXPORT_QUERIES = [
+    ("journal", """SELECT date, note_id, through_chat_id FROM daily_journals
+                   WHERE user_id = %s ORDER BY date"""),
+    ("note",    """SELECT id, title, content, created FROM notes
+                   WHERE user_id = %s ORDER BY created, id"""),
+    ("archive", """SELECT date, messages FROM chat_archives
+                   WHERE user_id = %s ORDER BY date"""),
+    ("chat",    """SELECT id, role, content, created FROM chats
+                   WHERE user_id = %s ORDER BY created, id"""),
+]
+
+def export_records(conn, user_id):
+    """
+    Yields (kind, record) for all of a user's data: journals, then notes,
+    then chats oldest first (archived days included).
+    """
+    cur = conn.cursor()
+    cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY")
+    cur.close()
+    for kind, sql in EXPORT_QUERIES:
+        cur = conn.cursor(name=f"export_{kind}")
+        cur.itersize = EXPORT_BATCH
+        cur.execute(sql, (user_id,))
+        for row in cur:
+            if kind == "archive":
+                for message in unpack(row["messages"]):
+                    chat = {key: message[key] for key in ("id", "role", "content")}
+                    # Archives store timestamps as ISO strings
+                    chat["created"] = datetime.fromisoformat(message["created"])
+                    yield "chat", chat
+            else:
+                yield kind, dict(row)
+        cur.close()
+
+def dumps(record):
+    return json.dumps(record, ensure_ascii=False, default=lambda value: value.isoformat())
+
+def chunked(parts):
+    """
+    Joins small str/bytes parts into chunks of about EXPORT_CHUNK bytes.
+    """
+    buffer, size = [], 0
+    for part in parts:
+        part = part.encode() if isinstance(part, str) else part
+        buffer.append(part)
+        size += len(part)
+        if size >= EXPORT_CHUNK:
+            yield b"".join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield b"".join(buffer)
+
+def to_ndjson(records):
+    for kind, record in records:
+        yield dumps(dict(record, type=kind)) + "\n"
+
+def to_json(records):
+    """
+    {"journals": [...], "notes": [...], "chats": [...]}, written as it goes.
+    """
+    written = set()
+    yield "{"
+    for kind, group in itertools.groupby(records, key=lambda item: item[0]):
+        yield f'{"," if written else ""}\n"{SECTIONS[kind]}": ['
+        for i, (_, record) in enumerate(group):
+            yield ("," if i else "") + "\n" + dumps(record)
+        yield "\n]"
+        written.add(kind)
+    for kind in SECTIONS:
+        if kind not in written:
+            yield f'{"," if written else ""}\n"{SECTIONS[kind]}": []'
+            written.add(kind)
+    yield "\n}\n"
+
+class ZipPipe:
+    """
+    Write-only file for zipfile that hands the bytes back out through
+    drain(). zipfile handles the missing seek() itself.
+    """
+    def __init__(self):
+        self.parts = []
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data, self.parts = b"".join(self.parts), []
+        return data
+
+def slug(text):
+    return re.sub(r"[^a-z0-9]+", "-", text.lower()).strip("-")[:40] or "note"
+
+def to_markdown_zip(records):
+    """
+    notes/<date>-<title>-<id>.md with a small front matter block, and
+    chats/<date>.md with one file per day of conversation.
+    """
+    pipe     = ZipPipe()
+    archive  = zipfile.ZipFile(pipe, "w", zipfile.ZIP_DEFLATED)
+    journals = {}
+    for day, group in itertools.groupby(
+        records, key=lambda item: (item[0], item[1]["created"].date() if item[0] == "chat" else None)
+    ):
+        kind, chat_day = day
+        if kind == "journal":
+            journals.update((record["note_id"], record["date"]) for _, record in group)
+            continue
+        if kind == "note":
+            for _, note in group:
+                front = [f"title: {json.dumps(note['title'], ensure_ascii=False)}",
+                         f"created: {note['created'].isoformat()}"]
+                if note["id"] in journals:
+                    front.append(f"journal: {journals[note['id']].isoformat()}")
+                name = f"notes/{note['created']:%Y-%m-%d}-{slug(note['title'])}-{note['id']}.md"
+                archive.writestr(name, "---\n" + "\n".join(front) + "\n---\n\n" + note["content"] + "\n")
+                yield pipe.drain()
+            continue
+        with archive.open(f"chats/{chat_day.isoformat()}.md", "w") as f:
+            f.write(f"# Chat, {chat_day:%A %d %B %Y}\n".encode())
+            for _, chat in group:
+                who = "You" if chat["role"] == "user" else "Journal Bot"
+                f.write(f"\n**{who}** ({chat['created']:%H:%M}): {chat['content']}\n".encode())
+        yield pipe.drain()
+    archive.close()
+    yield pipe.drain()
+
+WRITERS = {"ndjson": to_ndjson, "json": to_json, "zip": to_markdown_zip}
+
+def export_stream(user_id, fmt):
+    """
+    Yields the export as byte chunks. Holds one pooled connection while
+    the stream is being consumed.
+    """
+    conn = get_connection()
+    try:
+        yield from chunked(WRITERS[fmt](export_records(conn, user_id)))
+    finally:
+        conn.close()
+
+# ─── Import ──────────────────────────────────────────────
+# Records are spooled per table into temporary CSV files while the input
+# is read, then loaded with COPY into temp staging tables and merged in
+# one transaction. Ids are remapped; rows the user already has (same
+# timestamp and text, in chats or in an archived day) are matched instead
+# of duplicated, so importing the same export twice is a no-op. Chats from
+# months that are already archived go straight into chat_archives rather
+# than bringing the month's partition back.
+IMPORT_COLUMNS = {
+    "journal": ("date", "note_id", "through_chat_id"),
+    "note":    ("id", "title", "content", "created"),
+    "chat":    ("id", "role", "content", "created"),
+}
+IMPORT_TEXT = {"title", "content", "role"}
+
+def parse_ndjson(stream):
+    for line in io.TextIOWrapper(stream, encoding="utf-8"):
+        if line.strip():
+            record = json.loads(line)
+            yield record.pop("type"), record
+
+def parse_json(stream):
+    # A single document has to be parsed whole; NDJSON is the streaming format
+    data = json.load(io.TextIOWrapper(stream, encoding="utf-8"))
+    for kind, section in SECTIONS.items():
+        for record in data.get(section, []):
+            yield kind, record
+
+PARSERS = {"ndjson": parse_ndjson, "json": parse_json}
+
+def spool(records):
+    """
+    Writes records into one temporary CSV file per kind; returns {kind: file}.
+    """
+    files   = {kind: tempfile.TemporaryFile("w+", newline="") for kind in IMPORT_COLUMNS}
+    writers = {kind: csv.writer(f, quoting=csv.QUOTE_NONNUMERIC) for kind, f in files.items()}
+    for kind, record in records:
+        if kind in writers:
+            writers[kind].writerow([record.get(column) for column in IMPORT_COLUMNS[kind]])
+    for f in files.values():
+        f.seek(0)
+    return files
+
+def import_records(user_id, records):
+    """
+    Imports (kind, record) pairs as produced by export_records for
+    `user_id`. Returns the number of rows added per table. New notes
+    still need embedding.index_user_notes() for semantic search. Values
+    of the wrong type, and chats dated from partition_horizon() on, raise
+    ValueError.
+    """
+    files = spool(records)
+    conn  = get_connection()
+    cur   = conn.cursor()
+    try:
+        cur.execute("""
+            CREATE TEMP TABLE import_journals (
+                date DATE, note_id INTEGER, through_chat_id INTEGER
+            ) ON COMMIT DROP;
+            CREATE TEMP TABLE import_notes (
+                id INTEGER, title TEXT, content TEXT, created TIMESTAMP,
+                new_id INTEGER, existing BOOLEAN NOT NULL DEFAULT FALSE
+            ) ON COMMIT DROP;
+            CREATE TEMP TABLE import_chats (
+                id INTEGER, role TEXT, content TEXT, created TIMESTAMP,
+                new_id INTEGER, existing BOOLEAN NOT NULL DEFAULT FALSE
+            ) ON COMMIT DROP;
+            CREATE TEMP TABLE import_archived (
+                id INTEGER, role TEXT, content TEXT, created TIMESTAMP
+            ) ON COMMIT DROP
+        """)
+        for kind, f in files.items():
+            # spool() quotes everything but numbers, missing values included;
+            # FORCE_NULL reads those back as NULL outside the text columns
+            columns  = IMPORT_COLUMNS[kind]
+            nullable = [column for column in columns if column not in IMPORT_TEXT]
+            cur.copy_expert(
+                f"COPY import_{SECTIONS[kind]} ({', '.join(columns)}) "
+                f"FROM STDIN WITH (FORMAT csv, FORCE_NULL ({', '.join(nullable)}))", f
+            )
+        # Temp tables get no autovacuum stats; without them the matching
+        # below can pick a nested loop
+        cur.execute("ANALYZE import_journals, import_notes, import_chats")
+
+        # Imported dates pick which partitions get created, so they stay
+        # within the months ensure_chat_partitions keeps ready anyway
+        horizon = partition_horizon()
+        cur.execute("SELECT MAX(created) AS latest FROM import_chats")
+        latest = cur.fetchone()["latest"]
+        if latest is not None and latest >= datetime.combine(horizon, datetime.min.time()):
+            raise ValueError(f"chat dated {latest:%Y-%m-%d}; nothing from {horizon:%Y-%m} on is accepted")
+
+        load_archived_days(cur, user_id)
+
+        # Match rows the user already has, then give the rest fresh ids
+        cur.execute(
+            """UPDATE import_notes s SET new_id = n.id, existing = TRUE
+               FROM notes n
+               WHERE n.user_id = %(user_id)s AND n.created = s.created
+                 AND n.title = s.title AND n.content = s.content;
+               UPDATE import_notes SET new_id = nextval('notes_id_seq') WHERE new_id IS NULL;
+               UPDATE import_chats s SET new_id = c.id, existing = TRUE
+               FROM chats c
+               WHERE c.user_id = %(user_id)s AND c.created = s.created
+                 AND c.role = s.role AND c.content = s.content;
+               UPDATE import_chats s SET new_id = a.id, existing = TRUE
+               FROM import_archived a
+               WHERE NOT s.existing AND a.created = s.created
+                 AND a.role = s.role AND a.content = s.content;
+               UPDATE import_chats SET new_id = nextval('chats_id_seq') WHERE new_id IS NULL""",
+            {"user_id": user_id}
+        )
+        cur.execute("""SELECT DISTINCT date_trunc('month', created)::date AS month
+                       FROM import_chats WHERE NOT existing AND created IS NOT NULL""")
+        months   = [row["month"] for row in cur.fetchall()]
+        archived = archived_months(cur, months)
+        ensure_chat_partitions(cur, [month for month in months if month not in archived])
+
+        counts = {}
+        cur.execute(
+            """INSERT INTO notes (id, user_id, title, content, created)
+               SELECT new_id, %s, COALESCE(title, ''), COALESCE(content, ''),
+                      COALESCE(created, NOW())
+               FROM import_notes WHERE NOT existing""",
+            (user_id,)
+        )
+        counts["notes"] = cur.rowcount
+        cur.execute(
+            """INSERT INTO chats (id, user_id, role, content, created)
+               SELECT new_id, %s, role, COALESCE(content, ''), COALESCE(created, NOW())
+               FROM import_chats
+               WHERE NOT existing AND role IN ('user', 'assistant')
+                 AND (created IS NULL
+                      OR date_trunc('month', created)::date <> ALL(%s::date[]))""",
+            (user_id, archived)
+        )
+        counts["chats"] = cur.rowcount + archive_imported_chats(cur, user_id, archived)
+        cur.execute(
+            """INSERT INTO daily_journals (user_id, note_id, date, through_chat_id)
+               SELECT %s, n.new_id, j.date, COALESCE(c.new_id, 0)
+               FROM import_journals j
+               JOIN import_notes n ON n.id = j.note_id
+               LEFT JOIN import_chats c ON c.id = j.through_chat_id
+               WHERE j.date IS NOT NULL
+               ON CONFLICT (user_id, date) DO NOTHING""",
+            (user_id,)
+        )
+        counts["journals"] = cur.rowcount
+        conn.commit()
+        return counts
+    except psycopg2.DataError as e:
+        raise ValueError(str(e).split("\n")[0]) from e
+    finally:
+        for f in files.values():
+            f.close()
+        cur.close()
+        conn.close()
+
+def load_archived_days(cur, user_id):
+    """
+    Fills import_archived with the messages of the user's archived days
+    that the import touches, so they can be matched like chats rows.
+    """
+    cur.execute(
+        """SELECT messages FROM chat_archives
+           WHERE user_id = %s AND date IN (
+               SELECT DISTINCT created::date FROM import_chats WHERE created IS NOT NULL
+           )""",
+        (user_id,)
+    )
+    days = cur.fetchall()
+    rows = [(m["id"], m["role"], m["content"], m["created"])
+            for day in days for m in unpack(day["messages"])]
+    for start in range(0, len(rows), ARCHIVE_BATCH):
+        cur.execute(
+            "INSERT INTO import_archived (id, role, content, created) VALUES " + ",".join(
+                cur.mogrify("(%s, %s, %s, %s)", row).decode()
+                for row in rows[start:start + ARCHIVE_BATCH]
+            )
+        )
+
+def partition_horizon():
+    """
+    The first month past the partitions ensure_chat_partitions creates ahead.
+    """
+    month = date.today().replace(day=1)
+    for _ in range(PARTITIONS_AHEAD + 1):
+        month = next_month(month)
+    return month
+
+def archived_months(cur, months):
+    """
+    The months in `months` that chat_archive.maintain has already archived:
+    past the cutoff, with no partition left.
+    """
+    cutoff = date.today() - timedelta(days=ARCHIVE_AFTER_DAYS)
+    live   = {month for month, _ in chat_partitions(cur)}
+    return [month for month in months if month not in live and next_month(month) <= cutoff]
+
+def archive_imported_chats(cur, user_id, months):
+    """
+    Writes the new chats from archived `months` into chat_archives, merged
+    with any day already there. Returns the number of messages added.
+    """
+    if not months:
+        return 0
+    cur.execute(
+        """SELECT new_id AS id, role, COALESCE(content, '') AS content, created,
+                  created::date AS day
+           FROM import_chats
+           WHERE NOT existing AND role IN ('user', 'assistant')
+             AND date_trunc('month', created)::date = ANY(%s::date[])
+           ORDER BY created, new_id""",
+        (months,)
+    )
+    rows  = cur.fetchall()
+    days  = [
+        (user_id, day, [{"id": r["id"], "role": r["role"], "content": r["content"],
+                         "created": r["created"].isoformat()} for r in group])
+        for day, group in itertools.groupby(rows, key=lambda r: r["day"])
+    ]
+    for start in range(0, len(days), ARCHIVE_BATCH):
+        write_archives(cur, days[start:start + ARCHIVE_BATCH])
+    return len(rows)
+
+def import_file(user_id, stream, fmt):
+    return import_records(user_id, PARSERS[fmt](stream))